@@ -6,9 +6,8 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
 from config.settings import OPENAI_API_KEY
-from src.rag.rag_system import RAGSystem
-from src.agent.ai_agent import AIAgent
-from demo import demo_mode
+
+# RAGSystem・AIAgent・デモ画面は使うときにインポートする（langchain等の読み込みで起動が遅くならないように）
 
 st.set_page_config(
     page_title="RAGエージェントシステム",
@@ -16,6 +15,15 @@ st.set_page_config(
     layout="wide"
 )
 
+
+@st.cache_resource(show_spinner=False)
+def get_rag_system():
+    """全セッションで共有するRAGシステム（インデックスとリトリーバーはプロセス内で1つだけ保持）"""
+    from config.settings import MEETING_NOTES_DIR
+    from src.rag.rag_system import RAGSystem
+    return RAGSystem(MEETING_NOTES_DIR)
+
+
 def main():
     st.title("📚 RAG エージェントシステム")
     st.markdown("**AI搭載の高度な情報検索・対話システム**")
@@ -28,6 +36,7 @@ def main():
     demo_mode_enabled = st.sidebar.checkbox("🎬 デモモード（APIキー不要）")
     
     if demo_mode_enabled:
+        from demo import demo_mode
         demo_mode()
         return
     
@@ -50,6 +59,9 @@ def main():
         st.session_state.ai_agent = None
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
+    if 'llm_history' not in st.session_state:
+        # LLMに渡す会話履歴（セッションごとに保持し、RAGシステム本体は共有）
+        st.session_state.llm_history = []
     if 'initialized' not in st.session_state:
         st.session_state.initialized = False
     
@@ -65,18 +77,21 @@ def main():
         if st.button("⚡ システム初期化", type="primary"):
             with st.spinner("RAGシステムを初期化しています..."):
                 try:
-                    from config.settings import MEETING_NOTES_DIR
-                    st.session_state.rag_system = RAGSystem(MEETING_NOTES_DIR)
-                    theme_retriever = st.session_state.rag_system.initialize()
+                    # 初期化済みの共有インデックスがあれば再利用する
+                    st.session_state.rag_system = get_rag_system()
+                    theme_retriever = st.session_state.rag_system.ensure_initialized()
+                    st.session_state.llm_history = st.session_state.rag_system.create_chat_history()
                     
                     if mode == "AIエージェント（中間課題②）":
                         if theme_retriever:
                             st.info("AIエージェントを初期化しています...")
                             st.write(f"🔍 利用可能テーマ: {list(theme_retriever.keys())}")
-                            st.write(f"📊 チャット履歴数: {len(st.session_state.rag_system.chat_history)}")
+                            st.write(f"📊 チャット履歴数: {len(st.session_state.llm_history)}")
                             
                             try:
-                                st.session_state.ai_agent = AIAgent(theme_retriever, st.session_state.rag_system.chat_history)
+                                from src.agent.ai_agent import AIAgent
+                                st.session_state.ai_agent = AIAgent(theme_retriever, st.session_state.llm_history)
+                                st.session_state.agent_version = st.session_state.rag_system.index_version
                                 st.success("✅ AIエージェント初期化完了！")
                             except Exception as agent_error:
                                 st.error(f"❌ AIエージェント初期化エラー: {str(agent_error)}")
@@ -107,6 +122,13 @@ def main():
             st.markdown(f"**💡 AI:** {ai_msg}")
             st.markdown("---")
     
+    # 直前の回答で参照した議事録
+    if st.session_state.get("last_sources"):
+        with st.expander("📎 直前の回答で参照した議事録"):
+            for doc in st.session_state.last_sources:
+                st.markdown(f"**{doc.metadata.get('theme', '')} / {doc.metadata.get('file_name', '')}**")
+                st.caption(doc.page_content[:200])
+    
     # 入力フォーム
     st.subheader("✍️ 質問を入力")
     user_input = st.text_area(
@@ -118,38 +140,112 @@ def main():
     col1, col2 = st.columns([1, 4])
     
     with col1:
-        if st.button("✨ 送信", type="primary"):
-            if user_input.strip():
-                with st.spinner("回答を生成しています..."):
-                    try:
-                        if mode == "RAGシステム（中間課題①）":
-                            response = st.session_state.rag_system.query(user_input)
-                        else:
-                            response = st.session_state.ai_agent.run(user_input)
-                        
-                        st.session_state.chat_history.append((user_input, response))
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"❌ エラー: {e}")
-            else:
-                st.warning("質問を入力してください。")
+        submitted = st.button("✨ 送信", type="primary")
     
     with col2:
         if st.button("🗑️ チャット履歴クリア"):
             st.session_state.chat_history = []
-            if st.session_state.rag_system:
-                st.session_state.rag_system.chat_history = []
+            st.session_state.last_sources = []
+            # AIエージェントも同じリストを参照しているためその場で空にする
+            st.session_state.llm_history.clear()
             st.rerun()
     
+    if submitted:
+        if user_input.strip():
+            # 回答はトークンが届き次第表示する
+            st.markdown(f"**👤 ユーザー:** {user_input}")
+            st.markdown("**💡 AI:**")
+            try:
+                sources = []
+                if mode == "RAGシステム（中間課題①）":
+                    def answer_tokens():
+                        for chunk in st.session_state.rag_system.stream_query(
+                            user_input, chat_history=st.session_state.llm_history
+                        ):
+                            if "context" in chunk:
+                                sources.extend(chunk["context"])
+                            if "answer" in chunk:
+                                yield chunk["answer"]
+                    response = st.write_stream(answer_tokens())
+                else:
+                    response = st.write_stream(current_agent().stream_run(user_input))
+                
+                st.session_state.chat_history.append((user_input, response))
+                st.session_state.last_sources = sources
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ エラー: {e}")
+        else:
+            st.warning("質問を入力してください。")
+    
     # サイドバーの情報
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 📊 システム状態")
     if st.session_state.rag_system:
         st.sidebar.success("✅ RAGシステム: 稼働中")
         st.sidebar.info(f"💬 会話履歴: {len(st.session_state.chat_history)}件")
+        
+        # フォルダ監視（新しい議事録を差分のみ自動でインデックスに反映）
+        rag_system = st.session_state.rag_system
+        watching = rag_system.watcher is not None and rag_system.watcher.is_running
+        if st.sidebar.checkbox("📡 フォルダ監視で自動インデックス更新", value=watching):
+            if not watching:
+                rag_system.start_watcher()
+        elif watching:
+            rag_system.stop_watcher()
+        st.sidebar.caption(f"🗂️ インデックスバージョン: {rag_system.index_version}")
+        if st.sidebar.button("🔄 インデックスを更新"):
+            # 差分のみ反映し、新しいリトリーバーに一括で差し替える（他のセッションの検索は止めない）
+            with st.spinner("インデックスを更新しています..."):
+                rag_system.sync_index()
+            st.rerun()
     
     if mode == "AIエージェント（中間課題②）" and st.session_state.ai_agent:
         st.sidebar.success("✅ AIエージェント: 稼働中")
+    
+    if st.session_state.rag_system:
+        show_metrics()
+
+
+def current_agent():
+    """セッションのAIエージェント（フォルダ監視などでインデックスが更新されていれば、ルーターとツールを作り直す）"""
+    rag_system = st.session_state.rag_system
+    version = rag_system.index_version
+    if st.session_state.ai_agent is None or st.session_state.get("agent_version") != version:
+        from src.agent.ai_agent import AIAgent
+        st.session_state.ai_agent = AIAgent(rag_system.theme_retriever, st.session_state.llm_history)
+        st.session_state.agent_version = version
+    return st.session_state.ai_agent
+
+
+def show_metrics():
+    """段階ごとの所要時間・トークン数・料金・キャッシュのヒット率（プロセス内の全セッションの合計）"""
+    from src.utils.metrics import metrics
+    
+    with st.sidebar.expander("📈 メトリクス"):
+        snapshot = metrics.snapshot()
+        if snapshot["stages"]:
+            st.dataframe(
+                [
+                    {"段階": stage, "件数": s["count"], "p50(ms)": s["p50_ms"], "p95(ms)": s["p95_ms"], "p99(ms)": s["p99_ms"]}
+                    for stage, s in snapshot["stages"].items()
+                ],
+                hide_index=True,
+            )
+        else:
+            st.caption("まだ計測値がありません")
+        
+        prompt_tokens = metrics.total("llm_tokens_total", kind="prompt")
+        completion_tokens = metrics.total("llm_tokens_total", kind="completion")
+        st.caption(f"🔤 トークン: 入力 {prompt_tokens:,.0f} / 出力 {completion_tokens:,.0f}")
+        st.caption(f"💰 推定料金: ${metrics.total('llm_cost_usd_total'):.4f}")
+        for name, label in (("response_cache", "回答キャッシュ"), ("embedding_cache", "埋め込みキャッシュ")):
+            stats = snapshot["stats"].get(name)
+            if stats:
+                hits = sum(value for key, value in stats.items() if key.endswith("hits"))
+                requests = hits + stats.get("misses", 0)
+                if requests:
+                    st.caption(f"♻️ {label}: ヒット率 {hits / requests:.0%}（{hits}/{requests}件）")
 
 if __name__ == "__main__":
     main()
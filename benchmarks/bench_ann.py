@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+近似最近傍（IVF）インデックスのオフラインベンチマーク
+
+クラスタ構造を持つ疑似ベクトルをコンパクトストア（メモリ内）に登録し、全件検索とIVF検索の
+再現率（recall@k）とレイテンシ（p50 / p99）をチャンク数・nprobeごとに比較します。
+
+例: python benchmarks/bench_ann.py --sizes 10000 100000 1000000 --dim 256 --nprobe 4 8 16 32
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.rag.compact_store import CompactVectorStore
+
+
+def make_vectors(count: int, dim: int, rng: np.random.Generator, topics: int = 1000) -> np.ndarray:
+    """話題ごとの中心の周りに散らばった疑似埋め込み（実際の議事録のように似たチャンクがまとまる）"""
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100000):
+        end = min(start + 100000, count)
+        labels = rng.integers(0, topics, end - start)
+        vectors[start:end] = centers[labels] + 1.5 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    return vectors
+
+
+def percentile_ms(samples, q: float) -> float:
+    return float(np.percentile(samples, q)) * 1000
+
+
+def run(store: CompactVectorStore, queries: np.ndarray, k: int, nprobe):
+    """各質問の上位k件のID集合と検索時間"""
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        docs = store.similarity_search_with_score_by_vector(query, k=k, nprobe=nprobe)
+        latencies.append(time.perf_counter() - started)
+        results.append({doc.metadata["chunk_id"] for doc, _ in docs})
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVFインデックスの再現率とレイテンシのベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="チャンク数")
+    parser.add_argument("--dim", type=int, default=256, help="ベクトルの次元数")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32], help="検索するクラスタ数")
+    parser.add_argument("--queries", type=int, default=200, help="質問数")
+    parser.add_argument("-k", type=int, default=4, help="取得件数")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        vectors = make_vectors(size, args.dim, rng)
+        ids = [f"c{i}" for i in range(size)]
+        store = CompactVectorStore(None, None, dtype=args.dtype, ann_index="none")
+        store.add_embeddings(ids, vectors, [""] * size, [{"chunk_id": chunk_id} for chunk_id in ids])
+
+        started = time.perf_counter()
+        store.build_ann_index()
+        build = time.perf_counter() - started
+
+        queries = vectors[rng.choice(size, args.queries, replace=False)]
+        queries = queries + 1.0 * rng.standard_normal(queries.shape).astype(np.float32)
+        exact, exact_latencies = run(store, queries, args.k, nprobe=0)
+        print(f"\n== {size}チャンク（IVF学習 {build:.1f}秒） ==")
+        print(f"全件検索      : p50 {percentile_ms(exact_latencies, 50):6.2f}ms / "
+              f"p99 {percentile_ms(exact_latencies, 99):6.2f}ms")
+        for nprobe in args.nprobe:
+            approx, latencies = run(store, queries, args.k, nprobe=nprobe)
+            recall = np.mean([len(a & e) / len(e) for a, e in zip(approx, exact) if e])
+            print(f"IVF nprobe={nprobe:<3}: p50 {percentile_ms(latencies, 50):6.2f}ms / "
+                  f"p99 {percentile_ms(latencies, 99):6.2f}ms / recall@{args.k} {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
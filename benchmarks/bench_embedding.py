@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+埋め込みパイプラインのオフラインベンチマーク
+
+ローカルの疑似埋め込みバックエンド（レイテンシ・レート制限を模擬）に対して、
+逐次呼び出しとバッチ化・並列化パイプラインのスループットを比較します。
+
+例: python benchmarks/bench_embedding.py --texts 5000 --latency 0.2 --rps 8 --workers 8
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.rag.embedding_pipeline import BatchedEmbeddings
+from src.rag.fake_backends import LocalFakeEmbeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="埋め込みパイプラインのベンチマーク")
+    parser.add_argument("--texts", type=int, default=2000, help="埋め込むテキスト数")
+    parser.add_argument("--latency", type=float, default=0.1, help="1リクエストあたりの疑似レイテンシ（秒）")
+    parser.add_argument("--rps", type=float, default=10.0, help="疑似バックエンドの1秒あたりリクエスト上限（0で無制限）")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--batch-tokens", type=int, default=60000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--serial-batch", type=int, default=16, help="逐次ベースラインの1リクエストあたり件数")
+    args = parser.parse_args()
+
+    texts = [f"議事録{i}: 第{i % 97}四半期の施策と担当者の振り返り。" * 4 for i in range(args.texts)]
+
+    # 逐次ベースライン（レート制限なしでもラウンドトリップの合計で律速される）
+    backend = LocalFakeEmbeddings(latency=args.latency)
+    started = time.perf_counter()
+    for start in range(0, len(texts), args.serial_batch):
+        backend.embed_documents(texts[start:start + args.serial_batch])
+    serial = time.perf_counter() - started
+    print(f"逐次: {serial:.2f}秒 ({len(texts) / serial:.1f}件/秒)")
+
+    # バッチ化・並列化パイプライン（レート制限あり）
+    backend = LocalFakeEmbeddings(latency=args.latency, requests_per_second=args.rps)
+    pipeline = BatchedEmbeddings(
+        backend,
+        batch_size=args.batch_size,
+        max_batch_tokens=args.batch_tokens,
+        max_workers=args.workers,
+        progress_callback=lambda done, total, elapsed: None,
+    )
+    started = time.perf_counter()
+    _, stats = pipeline.embed_documents_with_stats(texts)
+    batched = time.perf_counter() - started
+    print(f"パイプライン: {batched:.2f}秒 ({len(texts) / batched:.1f}件/秒, "
+          f"バッチ数 {stats['batches']}, 429発生 {stats['rate_limited']}回, "
+          f"リクエスト数 {backend.request_count})")
+
+
+if __name__ == "__main__":
+    main()
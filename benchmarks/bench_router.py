@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+テーマ振り分け（ThemeRouter）のオフラインベンチマーク
+
+疑似議事録（synthetic_corpus.py）を疑似埋め込みでインデックス化し、正解のテーマが分かっている質問で
+振り分けの正解率・エージェントに任せた割合・レイテンシ（p50 / p99）をROUTER_MIN_CONFIDENCEごとに比較します。
+実際の議事録と正解付きの質問（1行に {"question": ..., "theme": ...} のJSONL）を --notes-dir / --questions で
+指定すると、しきい値を実データで調整できます（インデックスは一時ディレクトリに作り、議事録のフォルダには書き込みません）。
+
+例: python benchmarks/bench_router.py --files-per-theme 30 --confidences 0.5 0.8 0.9 0.99
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from run_benchmarks import percentile_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テーマ振り分けの正解率とレイテンシのベンチマーク")
+    parser.add_argument("--files-per-theme", type=int, default=20, help="テーマごとの議事録数")
+    parser.add_argument("--paragraphs", type=int, default=12, help="1ファイルあたりの段落数")
+    parser.add_argument("--confidences", type=float, nargs="+", default=[0.5, 0.8, 0.9, 0.99],
+                        help="比較するROUTER_MIN_CONFIDENCE")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--notes-dir", type=Path, help="既存の議事録のルートディレクトリ（指定時は疑似議事録を作らない）")
+    parser.add_argument("--questions", type=Path, help="正解のテーマ付きの質問（JSONL。--notes-dirと併用）")
+    args = parser.parse_args()
+    if args.notes_dir and not args.questions:
+        parser.error("--notes-dir を指定する場合は --questions も指定してください")
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag_router_bench_"))
+    # 設定はインポート時に読み込まれるため、先に疑似バックエンドを環境変数で指定する
+    # （疑似ベクトルを既存の.dbや埋め込みキャッシュに書き込まないよう、インデックスは作業ディレクトリに作る）
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("EMBEDDING_BACKEND", "fake")
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["PERSIST_INDEX"] = "false"
+    os.environ["EMBED_CACHE_PATH"] = str(workdir / "embeddings.sqlite3")
+
+    from src.agent.theme_router import ThemeRouter
+    from src.rag.rag_system import RAGSystem
+    from synthetic_corpus import generate_corpus
+
+    notes_dir = workdir / "notes"
+    if args.notes_dir:
+        lines = args.questions.read_text(encoding="utf-8").splitlines()
+        questions = [(item["question"], item["theme"]) for item in map(json.loads, filter(None, lines))]
+        # テーマのフォルダへのリンクを作業ディレクトリに置き、マニフェストと.dbは元の議事録の外に作る
+        notes_dir.mkdir()
+        for theme_dir in args.notes_dir.resolve().iterdir():
+            if theme_dir.is_dir() and not theme_dir.name.startswith("."):
+                (notes_dir / theme_dir.name).symlink_to(theme_dir, target_is_directory=True)
+    else:
+        questions = generate_corpus(notes_dir, args.files_per_theme, args.paragraphs, args.seed)
+    rag = RAGSystem(notes_dir)
+    rag.create_vector_stores(rag.load_and_process_files())
+
+    started = time.perf_counter()
+    router = ThemeRouter.from_keyword_index(rag.keyword_index, list(rag.theme_retriever))
+    print(f"\nルーター作成: {(time.perf_counter() - started) * 1000:.1f}ms（{len(router.themes)}テーマ）")
+
+    top1 = sum(max(p := router.probabilities(q), key=p.get) == theme for q, theme in questions)
+    print(f"1位のテーマの正解率: {top1 / len(questions):.3f}（{len(questions)}問）")
+
+    for min_confidence in args.confidences:
+        router.min_confidence = min_confidence
+        routed = correct = selected = 0
+        latencies = []
+        for question, theme in questions:
+            decision = router.route(question)
+            latencies.append(decision.elapsed_ms / 1000)
+            if decision.themes:
+                routed += 1
+                selected += len(decision.themes)
+                correct += theme in decision.themes
+        print(f"min_confidence={min_confidence:<5}: 振り分け {routed / len(questions):.3f} / "
+              f"振り分けた質問の正解率 {correct / max(routed, 1):.3f} / 平均テーマ数 {selected / max(routed, 1):.2f} / "
+              f"p50 {percentile_ms(latencies, 50):.2f}ms / p99 {percentile_ms(latencies, 99):.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+起動時間のレポート
+
+各エントリポイントを新しいPythonプロセスで `-X importtime` 付きで読み込み、起動にかかった時間と、
+インポート時間の内訳（トップレベルのパッケージごとの合計と、時間のかかったモジュール）を表示します。
+rag_system はRAGSystemの作成まで、agent はAIAgentモジュールの読み込みまでを含みます。
+--output でJSONに保存します（コミット間の比較用）。
+
+例: python benchmarks/bench_startup.py --repeat 3 --top 15 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT))
+
+from run_benchmarks import git_commit
+
+# 計測対象（名前 -> 実行するコード）。{notes_dir}は空の議事録ディレクトリに置き換える
+TARGETS = {
+    "app": "import app",
+    "main_task1": "import main_task1",
+    "server": "import server",
+    "agent": "import src.agent.ai_agent",
+    "rag_system": "from src.rag.rag_system import RAGSystem; RAGSystem({notes_dir!r})",
+}
+
+# -X importtime の1行（import time: 自身のμs | 累計のμs | モジュール名）
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr: str):
+    """-X importtime の出力から [(モジュール名, 自身のμs, 累計のμs, 深さ)] を返す"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def measure(code: str, env: dict) -> dict:
+    """新しいプロセスでcodeを実行し、経過時間とインポート時間の内訳を返す"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = parse_importtime(result.stderr)
+    packages = Counter()
+    for module, self_us, _, _ in rows:
+        packages[module.split(".")[0]] += self_us
+    return {
+        "seconds": elapsed,
+        "import_seconds": sum(self_us for _, self_us, _, _ in rows) / 1e6,
+        "modules": len(rows),
+        "packages": packages,
+        "rows": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="エントリポイントの起動時間とインポート時間の内訳")
+    parser.add_argument("targets", nargs="*", default=list(TARGETS),
+                        help=f"計測するエントリポイント（{', '.join(TARGETS)}。省略時はすべて）")
+    parser.add_argument("--repeat", type=int, default=3, help="計測回数（最も速い回を表示）")
+    parser.add_argument("--top", type=int, default=10, help="表示するパッケージ・モジュールの数")
+    parser.add_argument("--output", type=Path, help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+    unknown = [name for name in args.targets if name not in TARGETS]
+    if unknown:
+        parser.error(f"不明なエントリポイント: {', '.join(unknown)}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag_startup_bench_"))
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.setdefault("EMBED_CACHE_PATH", str(workdir / "embeddings.sqlite3"))
+    notes_dir = str(workdir / "notes")
+
+    report = {"commit": git_commit(), "python": sys.version.split()[0], "targets": {}}
+    for name in args.targets:
+        code = TARGETS[name].format(notes_dir=notes_dir)
+        # 1回目はバイトコードの作成を含むため捨て、残りで最も速い回を使う
+        measure(code, env)
+        best = min((measure(code, env) for _ in range(max(args.repeat, 1))), key=lambda m: m["seconds"])
+
+        print(f"\n=== {name}: {best['seconds']:.2f}秒（インポート {best['import_seconds']:.2f}秒 / {best['modules']}モジュール）")
+        print("パッケージ別（自身の時間の合計）:")
+        for package, us in best["packages"].most_common(args.top):
+            print(f"  {package:<28} {us / 1000:8.1f}ms")
+        print("上位2階層のモジュール（累計）:")
+        direct = sorted((row for row in best["rows"] if row[3] <= 1), key=lambda row: row[2], reverse=True)
+        for module, _, cumulative_us, _ in direct[:args.top]:
+            print(f"  {module:<28} {cumulative_us / 1000:8.1f}ms")
+
+        report["targets"][name] = {
+            "seconds": round(best["seconds"], 3),
+            "import_seconds": round(best["import_seconds"], 3),
+            "modules": best["modules"],
+            "packages_ms": {package: round(us / 1000, 1) for package, us in best["packages"].most_common(args.top)},
+        }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+取り込み・インデックス作成・検索・回答生成のオフラインベンチマーク
+
+疑似議事録（synthetic_corpus.py）を生成し、決定的なローカル疑似バックエンド（埋め込み・チャットモデル）で
+FileManagerによる取り込み、RAGSystem.create_vector_stores、検索、query()、一括回答（batch()）の各段階を計測します。
+スループット、p50 / p95 / p99 レイテンシ、ピークRSSを表示し、--output でJSONに保存します
+（コミット間の比較用）。設定は環境変数で上書きできます（例: VECTOR_STORE_BACKEND=compact）。
+
+例: python benchmarks/run_benchmarks.py --files-per-theme 50 --queries 100 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT))
+
+
+def peak_rss_mb():
+    """プロセスのピークRSS（MB。resourceモジュールがない環境ではNone）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト単位
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile_ms(samples, q: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return (ordered[low] + (ordered[high] - ordered[low]) * (position - low)) * 1000
+
+
+def summarize(name: str, items: int, seconds: float, latencies=None, unit: str = "件") -> dict:
+    """段階ごとの結果（件数・所要時間・スループット・レイテンシ・その時点のピークRSS）"""
+    result = {
+        "items": items,
+        "seconds": round(seconds, 4),
+        "throughput_per_sec": round(items / seconds, 2) if seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    line = f"{name:<12}: {items}{unit} / {seconds:.2f}秒 ({result['throughput_per_sec']}{unit}/秒)"
+    if latencies:
+        result.update({
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50_ms": round(percentile_ms(latencies, 50), 3),
+            "p95_ms": round(percentile_ms(latencies, 95), 3),
+            "p99_ms": round(percentile_ms(latencies, 99), 3),
+        })
+        line += f" p50 {result['p50_ms']:.2f}ms / p95 {result['p95_ms']:.2f}ms / p99 {result['p99_ms']:.2f}ms"
+    print(f"{line} / ピークRSS {result['peak_rss_mb']}MB")
+    return result
+
+
+def timed(fn, inputs):
+    latencies = []
+    for item in inputs:
+        started = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAGシステムのオフラインベンチマーク")
+    parser.add_argument("--files-per-theme", type=int, default=20, help="テーマごとの議事録数")
+    parser.add_argument("--paragraphs", type=int, default=12, help="1ファイルあたりの段落数")
+    parser.add_argument("--queries", type=int, default=50, help="検索・回答生成で計測する質問数")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="疑似チャットモデルの最初のトークンまでの秒数")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="疑似チャットモデルの1トークンごとの秒数")
+    parser.add_argument("--batch-concurrency", type=int, default=8, help="一括回答（abatch）の同時実行数")
+    parser.add_argument("--response-cache", action="store_true", help="回答キャッシュを有効にする（既定は無効）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, help="議事録とインデックスの作成先（既定は一時ディレクトリ）")
+    parser.add_argument("--output", type=Path, help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    notes_dir = workdir / "notes"
+
+    # 設定はインポート時に読み込まれるため、先に疑似バックエンドと計測条件を環境変数で指定する
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["EMBEDDING_BACKEND"] = "fake"
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ.setdefault("EMBED_CACHE_PATH", str(workdir / "embeddings.sqlite3"))
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.response_cache else "false"
+
+    import config.settings as settings
+    from src.rag.rag_system import RAGSystem
+    from src.utils.metrics import metrics
+    from synthetic_corpus import generate_corpus
+
+    started = time.perf_counter()
+    questions = generate_corpus(notes_dir, args.files_per_theme, args.paragraphs, args.seed)
+    print(f"疑似議事録を作成しました: {notes_dir}（{time.perf_counter() - started:.1f}秒）")
+    questions = [question for question, _ in questions]
+    queries = (questions * (args.queries // max(len(questions), 1) + 1))[:args.queries]
+
+    results = {}
+    rag = RAGSystem(notes_dir)
+    rag.llm.latency = rag.rewrite_llm.latency = args.llm_latency
+    rag.llm.token_latency = args.llm_token_latency
+
+    started = time.perf_counter()
+    theme_docs = rag.load_and_process_files()
+    files = sum(len({doc.metadata["source"] for doc in docs}) for docs in theme_docs.values())
+    results["ingest"] = summarize("取り込み", files, time.perf_counter() - started, unit="ファイル")
+
+    started = time.perf_counter()
+    rag.create_vector_stores(theme_docs)
+    results["index"] = summarize("インデックス", rag._store_count(), time.perf_counter() - started, unit="チャンク")
+    rag.setup_rag_chain()
+
+    started = time.perf_counter()
+    latencies = timed(rag.all_retriever.invoke, queries)
+    results["retrieve"] = summarize("検索", len(queries), time.perf_counter() - started, latencies)
+
+    started = time.perf_counter()
+    latencies = timed(lambda q: rag.query(q, chat_history=[]), queries)
+    results["query"] = summarize("回答生成", len(queries), time.perf_counter() - started, latencies)
+
+    def first_token(q):
+        for chunk in rag.stream_query(q, chat_history=[]):
+            if "answer" in chunk:
+                break
+
+    started = time.perf_counter()
+    latencies = timed(first_token, queries)
+    results["stream_first_token"] = summarize("最初のトークン", len(queries), time.perf_counter() - started, latencies)
+
+    # 一括回答は各質問の所要時間ではなく全体のスループットを計測する
+    started = time.perf_counter()
+    rag.batch(queries, max_concurrency=args.batch_concurrency)
+    results["batch"] = summarize("一括回答", len(queries), time.perf_counter() - started)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "settings": {
+            name: getattr(settings, name)
+            for name in ["VECTOR_STORE_BACKEND", "RETRIEVAL_MODE", "RERANKER", "SEARCH_K", "CHUNK_SIZE",
+                         "CHUNK_OVERLAP", "CONTEXT_MAX_TOKENS", "EMBED_CACHE_ENABLED", "INGEST_WORKERS"]
+        },
+        "results": results,
+        # 全段階を通した内訳（書き換え・検索・生成などの所要時間、トークン数、キャッシュのヒット数）
+        "metrics": metrics.snapshot(),
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用の疑似議事録（.docx）の生成
+
+THEMESの各テーマの「データベース化前」フォルダに、見出し・段落・表を含む日本語の議事録を
+指定した件数だけ作成します。乱数の種が同じなら内容も同じになるため、コミット間で比較できます。
+
+例: python benchmarks/synthetic_corpus.py /tmp/bench_notes --files-per-theme 50 --paragraphs 20
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+from docx import Document
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import THEMES
+
+SUBJECTS = ["新製品", "既存顧客", "展示会", "採用広報", "研修制度", "業務改善", "予算配分", "品質保証", "物流", "価格改定"]
+TOPICS = ["進捗", "課題", "対策", "スケジュール", "費用", "効果測定", "体制", "リスク", "優先順位", "振り返り"]
+PEOPLE = ["田中", "佐藤", "鈴木", "高橋", "伊藤", "渡辺", "山本", "中村", "小林", "加藤"]
+VERBS = ["説明した", "報告した", "提案した", "確認した", "合意した", "懸念を示した", "再検討を求めた"]
+METRICS = ["問い合わせ件数", "受注件数", "応募者数", "解約率", "満足度", "リードタイム", "不良率"]
+# テーマに特有の語（テーマ振り分けの評価に使う。THEMESにないテーマは共通の語だけになる）
+THEME_TERMS = {
+    "営業": ["商談", "見積書", "代理店", "受注見込み", "訪問計画"],
+    "マーケティング": ["広告出稿", "キャンペーン", "SNS施策", "ブランド認知", "LP改修"],
+    "採用": ["面接官", "内定承諾", "求人媒体", "新卒説明会", "リファラル"],
+    "開発": ["リリース計画", "コードレビュー", "障害対応", "API仕様", "テスト自動化"],
+    "教育": ["新人研修", "eラーニング", "OJT", "資格取得支援", "評価面談"],
+    "全社": ["経営方針", "中期計画", "全社朝会", "就業規則", "組織改編"],
+    "顧客": ["問い合わせ対応", "解約防止", "導入支援", "顧客アンケート", "サポート窓口"],
+}
+
+
+def make_sentence(rng: random.Random, theme: str) -> str:
+    terms = THEME_TERMS.get(theme, SUBJECTS)
+    subject = rng.choice(terms) if rng.random() < 0.5 else rng.choice(SUBJECTS)
+    return f"{rng.choice(PEOPLE)}さんが{subject}の{rng.choice(TOPICS)}について{rng.choice(VERBS)}。"
+
+
+def make_fact(rng: random.Random, theme: str, number: int) -> Tuple[str, str, str]:
+    """(本文に入れる文, 自然文の質問, 型番を含む短い質問)"""
+    code = f"{theme[:2]}-{number:04d}"
+    term = rng.choice(THEME_TERMS.get(theme, SUBJECTS))
+    subject, metric = rng.choice(SUBJECTS), rng.choice(METRICS)
+    value = rng.randint(10, 999)
+    sentence = f"案件{code}では{term}に関する{subject}の{metric}が{value}件となり、{rng.choice(PEOPLE)}さんが担当する。"
+    return sentence, f"{term}に関する{subject}の{metric}はどうなりましたか？", f"案件{code}の担当者は？"
+
+
+def write_note(path: Path, rng: random.Random, theme: str, number: int, paragraphs: int) -> Tuple[str, str]:
+    """議事録を1件作成し、その議事録から答えられる質問を返す"""
+    fact, question, keyword_question = make_fact(rng, theme, number)
+    doc = Document()
+    doc.add_heading(f"{theme}定例会議 第{number + 1}回", level=1)
+    fact_at = rng.randrange(paragraphs)
+    for i in range(paragraphs):
+        if i % 5 == 0:
+            doc.add_heading(f"{i // 5 + 1}. {rng.choice(SUBJECTS)}の{rng.choice(TOPICS)}", level=2)
+        text = "".join(make_sentence(rng, theme) for _ in range(rng.randint(3, 8)))
+        if i == fact_at:
+            text += fact
+        doc.add_paragraph(text)
+    table = doc.add_table(rows=3, cols=3)
+    for row in table.rows:
+        for cell in row.cells:
+            cell.text = f"{rng.choice(METRICS)} {rng.randint(1, 100)}"
+    doc.save(path)
+    return question, keyword_question
+
+
+def generate_corpus(root: Path, files_per_theme: int, paragraphs: int = 12, seed: int = 0,
+                    themes: List[str] = THEMES) -> List[Tuple[str, str]]:
+    """疑似議事録を作成し、ベンチマークで使う (質問, 正解のテーマ) の一覧を返す"""
+    rng = random.Random(seed)
+    questions = []
+    for theme in themes:
+        source_dir = Path(root) / theme / "データベース化前"
+        source_dir.mkdir(parents=True, exist_ok=True)
+        for number in range(files_per_theme):
+            for question in write_note(source_dir / f"{theme}_{number:04d}.docx", rng, theme, number, paragraphs):
+                questions.append((question, theme))
+    rng.shuffle(questions)
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用の疑似議事録を生成")
+    parser.add_argument("root", type=Path, help="出力先（議事録のルートディレクトリ）")
+    parser.add_argument("--files-per-theme", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=12, help="1ファイルあたりの段落数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    questions = generate_corpus(args.root, args.files_per_theme, args.paragraphs, args.seed)
+    print(f"{len(THEMES) * args.files_per_theme}件の議事録を作成しました: {args.root}")
+    print(f"質問の例: {[question for question, _ in questions[:3]]}")
+
+
+if __name__ == "__main__":
+    main()
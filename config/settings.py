@@ -14,15 +14,129 @@ DATA_DIR = ROOT_DIR / "data"
 # 会議議事録のディレクトリ（環境変数で上書き可能）
 MEETING_NOTES_DIR = Path(os.getenv("MEETING_NOTES_DIR", DATA_DIR / "オンラインMTG議事録"))
 
+# 永続インデックスモード（有効時は.dbのインデックスを読み込み、追加・変更・削除されたファイルのみ反映）
+PERSIST_INDEX = os.getenv("PERSIST_INDEX", "true").lower() in ("1", "true", "yes")
+
 # OpenAI API設定
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# チャンク分割設定
+# 議事録読み込みの並列プロセス数（1で逐次処理）
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+# フォルダ監視設定（ポーリング間隔、変更が落ち着くまでの待機秒数、最大待機秒数）
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "2.0"))
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "3.0"))
+WATCH_MAX_DELAY = float(os.getenv("WATCH_MAX_DELAY", "30.0"))
+
+# 埋め込みバックエンド（"openai" またはオフライン検証用の "fake"）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+# チャットモデルのバックエンド（"openai" またはオフライン検証・ベンチマーク用の "fake"）
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+# 埋め込みパイプライン設定（1リクエストあたりの件数・トークン数上限、同時実行数、429時の最大リトライ回数）
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "60000"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+# 埋め込みキャッシュ（インデックスを作り直しても残るよう.dbの外に保存）
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBED_CACHE_PATH = Path(os.getenv("EMBED_CACHE_PATH", DATA_DIR / ".cache" / "embeddings.sqlite3"))
+EMBED_CACHE_MAX_ENTRIES = 10000
+EMBED_CACHE_MAX_DISK_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_DISK_ENTRIES", "500000"))
+
+# チャンク分割設定（トークン数。見出し・段落・文の境界で区切る）
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 
 # 埋め込み検索設定
 SEARCH_K = 2
 
+# ベクターストア（chroma / compact: メモリマップしたNumPy行列。大規模コーパス向け）と、compactでのベクトルの保存形式（float32 / float16 / int8）
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+COMPACT_STORE_DTYPE = os.getenv("COMPACT_STORE_DTYPE", "float32")
+
+# 全テーマ横断検索の近似最近傍（ANN）インデックス（none / ivf。compactストアで有効）
+# ivfはチャンク数がANN_MIN_CHUNKS以上になったら学習し、ANN_NLIST個（0でチャンク数の平方根）のクラスタのうち
+# 質問に近いANN_NPROBE個だけを検索する。ANN_NPROBEを増やすほど再現率が上がり、遅くなる
+ANN_INDEX = os.getenv("ANN_INDEX", "none")
+ANN_MIN_CHUNKS = int(os.getenv("ANN_MIN_CHUNKS", "20000"))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+ANN_KMEANS_ITERS = 10
+ANN_TRAIN_SAMPLE = 50000
+# chromaストアのHNSWパラメータ（chromaは常にHNSWで検索する。作成済みのコレクションには作り直すまで反映されない）
+CHROMA_HNSW_M = int(os.getenv("CHROMA_HNSW_M", "16"))
+CHROMA_HNSW_CONSTRUCTION_EF = int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", "100"))
+CHROMA_HNSW_SEARCH_EF = int(os.getenv("CHROMA_HNSW_SEARCH_EF", "100"))
+
+# 検索方式（hybrid: ベクトル検索とBM25をRRFで統合 / vector: ベクトル検索のみ / keyword: BM25のみ）
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# ハイブリッド検索で各方式から取得する候補数と、RRFの定数
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "10"))
+RRF_K = 60
+
+# 二段階検索のリランカー（none / lexical: 語の一致による軽量な採点 / cross-encoder: sentence-transformersのモデル）
+RERANKER = os.getenv("RERANKER", "lexical")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# リランク前に一次検索で取得する候補数と、リランクにかける時間の上限（ミリ秒。超えたら残りの候補は採点しない）
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "30"))
+RERANK_MAX_MS = float(os.getenv("RERANK_MAX_MS", "50"))
+# 軽量リランカーで一次検索の順位を混ぜる割合
+RERANK_PRIOR_WEIGHT = 0.3
+
+# 回答生成に渡すコンテキストのトークン数の上限と、ほぼ同じ内容の候補とみなすSimHashのハミング距離（64bit中）
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+CONTEXT_DEDUP_BITS = int(os.getenv("CONTEXT_DEDUP_BITS", "3"))
+# SimHashが近いチャンクを重複として除くのに必要な、文字3-gramのJaccard係数の下限
+CONTEXT_DEDUP_JACCARD = float(os.getenv("CONTEXT_DEDUP_JACCARD", "0.9"))
+
+# AIエージェントのテーマ振り分け（チャンクから学習した分類器で、LLMを呼ばずに検索するテーマを決める）
+THEME_ROUTER_ENABLED = os.getenv("THEME_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+# 選んだテーマの確率の合計がこれ未満ならエージェントに任せる
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.8"))
+# 確率がこれ以上のテーマは一緒に検索する（最大ROUTER_MAX_THEMESテーマ）
+ROUTER_MULTI_THRESHOLD = float(os.getenv("ROUTER_MULTI_THRESHOLD", "0.2"))
+ROUTER_MAX_THEMES = 3
+
+# 会話履歴を反映した質問の書き換えに使う軽量モデルと、書き換え不要（独立した質問）とみなす最小文字数
+REWRITE_MODEL = os.getenv("REWRITE_MODEL", "gpt-4o-mini")
+STANDALONE_MIN_CHARS = 12
+
+# 会話履歴の上限（そのまま保持する直近のターン数と、要約を含めたトークン数の上限）
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "4"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "2000"))
+
+# 一括回答（RAGSystem.abatch）で同時に処理する質問数の上限
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# HTTPサーバー（server.py）設定（同時に処理するリクエスト数、処理待ちの上限、1リクエストのタイムアウト秒、
+# リクエスト本文の上限バイト数）
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "8"))
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "32"))
+SERVER_TIMEOUT = float(os.getenv("SERVER_TIMEOUT", "120"))
+SERVER_MAX_BODY = int(os.getenv("SERVER_MAX_BODY", str(64 * 1024)))
+
+# HTTPサーバーの会話履歴（最後の質問から破棄するまでの秒数と、保持する会話数の上限）
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(30 * 60)))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+
+# 回答キャッシュ設定（有効期限秒、メモリ内・ディスクの最大件数、類似一致とみなすコサイン類似度。0で類似一致を無効化）
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_MAX_DISK_ENTRIES = 20000
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+
+# 計測（段階ごとのパーセンタイルに使う直近の件数と、料金の計算に使う1000トークンあたりの単価USD（入力, 出力））
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))
+LLM_PRICES_PER_1K = {
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4": (0.03, 0.06),
+}
+
 # 対応テーマ
 THEMES = ["営業", "マーケティング", "採用", "開発", "教育", "全社", "顧客"]
@@ -51,8 +51,12 @@ def main():
         print(f"\n質問: {query}")
         print("-" * 50)
         try:
-            response = rag_system.query(query)
-            print(f"回答: {response}")
+            # 回答はトークンが届き次第表示
+            print("回答: ", end="", flush=True)
+            for chunk in rag_system.stream_query(query):
+                if "answer" in chunk:
+                    print(chunk["answer"], end="", flush=True)
+            print()
         except Exception as e:
             print(f"エラーが発生しました: {e}")
         print()
@@ -72,9 +76,8 @@ def create_sample_data_structure():
         theme_dir = MEETING_NOTES_DIR / theme
         theme_dir.mkdir(exist_ok=True)
         
-        # サブディレクトリの作成
+        # サブディレクトリの作成（処理済みの判定は.db内のマニフェストで行う）
         (theme_dir / "データベース化前").mkdir(exist_ok=True)
-        (theme_dir / "データベース化済み").mkdir(exist_ok=True)
     
     # .dbディレクトリの作成
     (MEETING_NOTES_DIR / ".db").mkdir(exist_ok=True)
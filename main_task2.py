@@ -61,8 +61,11 @@ def main():
         print(f"\n質問: {query}")
         print("-" * 50)
         try:
-            response = ai_agent.run(query)
-            print(f"回答: {response}")
+            # 最終回答はトークンが届き次第表示
+            print("回答: ", end="", flush=True)
+            for token in ai_agent.stream_run(query):
+                print(token, end="", flush=True)
+            print()
         except Exception as e:
             print(f"エラーが発生しました: {e}")
         print()
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+RAGエージェントシステム - HTTPサーバー
+
+インデックスを1回だけ読み込み、他のツールからHTTPで質問できるようにします（標準ライブラリのみで動作）。
+
+    POST /query          {"question": "...", "session_id": "..."} -> {"answer", "session_id", "sources"}
+    POST /query/stream   同じ入力で、回答をServer-Sent Events（context / token / done / error）で返す
+    POST /agent          AIエージェントで回答（/agent/stream はSSE）
+    DELETE /sessions/<id> 会話履歴を破棄
+    GET  /health         稼働状況（処理中・待機中のリクエスト数、会話数、インデックスバージョン）
+    GET  /metrics        段階ごとの所要時間・トークン数・料金・キャッシュのヒット数（Prometheusのテキスト形式）
+    GET  /metrics.json   同じ内容のJSON
+
+session_idを省略すると新しい会話になり、レスポンスのsession_idを次の質問で渡すと会話履歴を引き継ぎます。
+回答の生成はSERVER_WORKERS個のワーカーで行い、処理待ちがSERVER_QUEUE_SIZEを超えた場合は503、
+SERVER_TIMEOUT秒以内に終わらない場合は504（SSEではerrorイベント）、同じ会話の前の質問をまだ処理している場合は
+409を返します。
+本文がSERVER_MAX_BODYバイトを超える場合は413、Content-Lengthが不正な場合は400を返します。
+
+例: python server.py --port 8000 --watch
+"""
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(str(Path(__file__).parent))
+
+from config.settings import (
+    MEETING_NOTES_DIR, OPENAI_API_KEY, SERVER_HOST, SERVER_MAX_BODY, SERVER_PORT, SERVER_QUEUE_SIZE, SERVER_TIMEOUT,
+    SERVER_WORKERS
+)
+from src.agent.ai_agent import AIAgent
+from src.rag.backends import requires_openai_key
+from src.rag.rag_system import RAGSystem
+from src.utils.metrics import metrics
+from src.utils.sessions import Session, SessionStore
+
+# ストリーム終了を表す番兵
+_DONE = object()
+
+
+class ServiceBusy(Exception):
+    """処理待ちのリクエストが上限に達している"""
+
+
+class SessionBusy(Exception):
+    """同じ会話の前の質問をまだ処理している（タイムアウトした質問の処理が終わっていない場合など）"""
+
+
+class QueryService:
+    """共有のRAGシステムに対する質問を、ワーカープールと会話ごとの履歴で処理する
+
+    同時に処理するのはworkers件まで、処理待ちはqueue_size件までで、それを超えた分はすぐにServiceBusyにする。
+    同じ会話の質問は会話のロックで1つずつ処理し、別の会話の質問は並行して処理する。
+    会話のロックは待たずに取り、取れない場合はSessionBusyにする（タイムアウト後も処理が続いている会話の質問で
+    ワーカーを塞がないため）。
+    """
+
+    def __init__(self, rag_system: RAGSystem, workers: int = SERVER_WORKERS, queue_size: int = SERVER_QUEUE_SIZE,
+                 timeout: float = SERVER_TIMEOUT):
+        self.rag_system = rag_system
+        self.timeout = timeout
+        self.sessions = SessionStore(rag_system.create_chat_history)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-worker")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._router = (None, None)
+        self._lock = threading.Lock()
+        self.stats = {"pending": 0, "running": 0, "completed": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+        metrics.register_stats("server", self.stats)
+
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self.stats[key] += delta
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """ワーカーで実行する（処理待ちが上限に達している場合はServiceBusy）"""
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise ServiceBusy("処理待ちのリクエストが上限に達しています")
+
+        def _run():
+            self._count("running")
+            try:
+                return fn(*args)
+            except SessionBusy:
+                self._count("rejected")
+                raise
+            except Exception:
+                self._count("errors")
+                raise
+            finally:
+                self._count("running", -1)
+
+        self._count("pending")
+        future = self._executor.submit(_run)
+
+        def _release(done: Future):
+            # 開始前に取り消された場合もここで枠を返す
+            self._slots.release()
+            self._count("pending", -1)
+            # 取り消し・失敗はrejected・errorsで数えるため、正常に終わったものだけを数える
+            if not done.cancelled() and done.exception() is None:
+                self._count("completed")
+
+        future.add_done_callback(_release)
+        return future
+
+    def run(self, fn: Callable[[threading.Event], object]):
+        """fn(cancelled)をワーカーで実行して結果を待つ
+
+        timeout秒を超えた場合はTimeoutError。開始前なら取り消し、実行中ならcancelledをセットする
+        （fnはcancelledを見て途中で処理を打ち切る）。
+        """
+        cancelled = threading.Event()
+        future = self.submit(fn, cancelled)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            cancelled.set()
+            future.cancel()
+            self._count("timeouts")
+            raise TimeoutError(f"{self.timeout:g}秒以内に回答できませんでした")
+
+    @staticmethod
+    @contextmanager
+    def _session_lock(session: Session):
+        """会話のロックを取る（前の質問をまだ処理している場合は待たずにSessionBusy）"""
+        if not session.lock.acquire(blocking=False):
+            raise SessionBusy("この会話の前の質問をまだ処理しています")
+        try:
+            yield
+        finally:
+            session.lock.release()
+
+    def stream(self, make_iterator: Callable[[], Iterator], session: Session) -> Iterator:
+        """make_iteratorの要素をワーカーで順に作り、届いた順に返す
+
+        全体でtimeout秒を超えた場合はTimeoutError。呼び出し元が途中でやめた場合（クライアントの切断など）は
+        ワーカー側も次の要素で打ち切る。
+        """
+        items = queue.Queue()
+        cancelled = threading.Event()
+
+        def _pump():
+            try:
+                with self._session_lock(session):
+                    for item in make_iterator():
+                        if cancelled.is_set():
+                            break
+                        items.put(item)
+            except Exception as e:
+                items.put(e)
+                raise
+            finally:
+                items.put(_DONE)
+
+        self.submit(_pump)
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    self._count("timeouts")
+                    raise TimeoutError(f"{self.timeout:g}秒以内に回答できませんでした")
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+
+    def rag_stream(self, question: str, session: Session) -> Iterator[dict]:
+        return self.stream(lambda: self.rag_system.stream_query(question, chat_history=session.history), session)
+
+    def rag_answer(self, question: str, session: Session):
+        """RAGで回答し、(回答, 参照したチャンク) を返す"""
+        def _answer(cancelled: threading.Event):
+            with self._session_lock(session):
+                answer, sources = "", []
+                for chunk in self.rag_system.stream_query(question, chat_history=session.history):
+                    if cancelled.is_set():
+                        # タイムアウトした回答は会話履歴に残さずに打ち切る
+                        return None
+                    sources.extend(chunk.get("context", []))
+                    answer += chunk.get("answer", "")
+                return answer, sources
+        return self.run(_answer)
+
+    def agent_stream(self, question: str, session: Session) -> Iterator[str]:
+        return self.stream(lambda: self._agent(session).stream_run(question), session)
+
+    def agent_answer(self, question: str, session: Session) -> str:
+        """AIエージェントで回答（エージェントの実行は途中で止められないため、タイムアウト後も会話はSessionBusyになる）"""
+        def _answer(cancelled: threading.Event):
+            with self._session_lock(session):
+                if cancelled.is_set():
+                    return None
+                return self._agent(session).run(question)
+        return self.run(_answer)
+
+    def _agent(self, session: Session) -> AIAgent:
+        """会話ごとのAIエージェント（履歴は会話ごと、ルーターは同じインデックスバージョンの間共有する）"""
+        version = self.rag_system.index_version
+        if session.agent is None or session.agent_version != version:
+            theme_retriever = self.rag_system.theme_retriever
+            if not theme_retriever:
+                raise ValueError("テーマ別リトリーバーがありません。議事録ファイルを確認してください。")
+            router_version, router = self._router
+            session.agent = AIAgent(theme_retriever, session.history,
+                                    router=router if router_version == version else None)
+            session.agent_version = version
+            self._router = (version, session.agent.router)
+        return session.agent
+
+    def health(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            "status": "ok",
+            "index_version": self.rag_system.index_version,
+            "themes": list(self.rag_system.theme_retriever or {}),
+            "sessions": len(self.sessions),
+            "running": stats["running"],
+            "queued": stats["pending"] - stats["running"],
+            **{key: stats[key] for key in ("completed", "rejected", "timeouts", "errors")},
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def serialize_sources(docs) -> list:
+    """参照したチャンクをJSONで返せる形にする（本文は先頭200文字）"""
+    return [
+        {
+            "theme": doc.metadata.get("theme", ""),
+            "file_name": doc.metadata.get("file_name", ""),
+            "excerpt": doc.page_content[:200],
+        }
+        for doc in docs
+    ]
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """QueryServiceへのHTTPの入り口（serverにservice属性が必要）"""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self) -> QueryService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        # アクセスログは1行で標準出力に出す
+        print(f"🌐 {self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        self._send_body(status, json.dumps(body, ensure_ascii=False), "application/json; charset=utf-8", headers)
+
+    def _send_body(self, status: int, text: str, content_type: str, headers: Optional[dict] = None):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, headers: Optional[dict] = None):
+        self._send_json(status, {"error": message}, headers)
+
+    def _send_event(self, event: str, data: dict):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _read_request(self):
+        """JSONの本文から (質問, 会話) を取り出す（不正な場合はNone）"""
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            # 本文を読めないため、接続を閉じて残りのデータを次のリクエストとして読まないようにする
+            self.close_connection = True
+            self._send_error(HTTPStatus.BAD_REQUEST, "Content-Lengthが不正です")
+            return None
+        if length > SERVER_MAX_BODY:
+            self.close_connection = True
+            self._send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"本文は{SERVER_MAX_BODY}バイト以内にしてください")
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            question = str(body.get("question", "")).strip()
+        except (ValueError, AttributeError):
+            self._send_error(HTTPStatus.BAD_REQUEST, "本文は {\"question\": \"...\"} 形式のJSONにしてください")
+            return None
+        if not question:
+            self._send_error(HTTPStatus.BAD_REQUEST, "questionを指定してください")
+            return None
+        session_id = body.get("session_id")
+        if session_id is not None and not isinstance(session_id, str):
+            self._send_error(HTTPStatus.BAD_REQUEST, "session_idは文字列で指定してください")
+            return None
+        return question, self.service.sessions.get(session_id)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(HTTPStatus.OK, self.service.health())
+        elif self.path == "/metrics":
+            self._send_body(HTTPStatus.OK, metrics.to_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+        elif self.path == "/metrics.json":
+            self._send_json(HTTPStatus.OK, metrics.snapshot())
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, f"{self.path} は存在しません")
+
+    def do_DELETE(self):
+        prefix = "/sessions/"
+        if self.path.startswith(prefix) and self.service.sessions.delete(self.path[len(prefix):]):
+            self._send_json(HTTPStatus.OK, {"deleted": self.path[len(prefix):]})
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, f"{self.path} は存在しません")
+
+    def do_POST(self):
+        routes = {
+            "/query": self._query,
+            "/query/stream": self._query_stream,
+            "/agent": self._agent,
+            "/agent/stream": self._agent_stream,
+        }
+        handler = routes.get(self.path)
+        if handler is None:
+            self._send_error(HTTPStatus.NOT_FOUND, f"{self.path} は存在しません")
+            return
+        request = self._read_request()
+        if request is None:
+            return
+        # エンドポイントごとの応答時間（SSEは最後のイベントを送り終えるまで）
+        started = time.perf_counter()
+        try:
+            handler(*request)
+            metrics.observe(f"http{self.path.replace('/', '_')}", time.perf_counter() - started)
+        except ServiceBusy as e:
+            self._send_error(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {"Retry-After": "1"})
+        except SessionBusy as e:
+            self._send_error(HTTPStatus.CONFLICT, str(e), {"Retry-After": "1"})
+        except TimeoutError as e:
+            self._send_error(HTTPStatus.GATEWAY_TIMEOUT, str(e))
+        except Exception as e:
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(e).__name__}: {e}")
+
+    def _query(self, question: str, session: Session):
+        answer, sources = self.service.rag_answer(question, session)
+        self._send_json(HTTPStatus.OK, {
+            "answer": answer, "session_id": session.session_id, "sources": serialize_sources(sources)
+        })
+
+    def _agent(self, question: str, session: Session):
+        answer = self.service.agent_answer(question, session)
+        self._send_json(HTTPStatus.OK, {"answer": answer, "session_id": session.session_id})
+
+    def _query_stream(self, question: str, session: Session):
+        def _events():
+            for chunk in self.service.rag_stream(question, session):
+                if "context" in chunk:
+                    yield "context", {"sources": serialize_sources(chunk["context"])}
+                if "answer" in chunk:
+                    yield "token", {"text": chunk["answer"]}
+        self._stream_events(_events(), session)
+
+    def _agent_stream(self, question: str, session: Session):
+        events = (("token", {"text": token}) for token in self.service.agent_stream(question, session))
+        self._stream_events(events, session)
+
+    def _stream_events(self, events: Iterator, session: Session):
+        """SSEで送る（最初のイベントまでのエラーは通常のエラーレスポンス、それ以降はerrorイベントで返す）"""
+        first = next(events, None)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        # 長さが決まらないため、送り終えたら接続を閉じる
+        self.send_header("Connection", "close")
+        self.close_connection = True
+        self.end_headers()
+
+        answer = ""
+        try:
+            while first is not None:
+                event, data = first
+                answer += data.get("text", "")
+                self._send_event(event, data)
+                first = next(events, None)
+            self._send_event("done", {"answer": answer, "session_id": session.session_id})
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアントが切断した（eventsを閉じてワーカー側の生成も打ち切る）
+            events.close()
+        except Exception as e:
+            self._send_event("error", {"error": str(e) if isinstance(e, TimeoutError) else f"{type(e).__name__}: {e}"})
+
+
+class QueryServer(ThreadingHTTPServer):
+    """接続ごとのスレッドでリクエストを受け付け、回答の生成はQueryServiceのワーカーに任せる"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, service: QueryService):
+        super().__init__(address, RequestHandler)
+        self.service = service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAGエージェントシステムのHTTPサーバー")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="同時に回答を生成するリクエスト数")
+    parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE, help="処理待ちにできるリクエスト数")
+    parser.add_argument("--timeout", type=float, default=SERVER_TIMEOUT, help="1リクエストのタイムアウト秒")
+    parser.add_argument("--notes-dir", type=Path, default=MEETING_NOTES_DIR, help="議事録のルートディレクトリ")
+    parser.add_argument("--watch", action="store_true", help="議事録フォルダを監視してインデックスを自動更新")
+    args = parser.parse_args()
+
+    if requires_openai_key() and not OPENAI_API_KEY:
+        print("エラー: OPENAI_API_KEYが設定されていません（オフラインで動かす場合はEMBEDDING_BACKEND=fake、LLM_BACKEND=fake）。")
+        return
+
+    rag_system = RAGSystem(args.notes_dir)
+    rag_system.ensure_initialized()
+    if args.watch:
+        rag_system.start_watcher()
+
+    service = QueryService(rag_system, args.workers, args.queue_size, args.timeout)
+    server = QueryServer((args.host, args.port), service)
+    print(f"🚀 http://{args.host}:{args.port} で待ち受けています（ワーカー {args.workers}、処理待ち上限 {args.queue_size}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nサーバーを停止します")
+    finally:
+        server.server_close()
+        service.shutdown()
+        rag_system.stop_watcher()
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,7 @@ if not exist .env (
 
 REM データディレクトリの作成
 echo 📁 データディレクトリを作成しています...
-python -c "from pathlib import Path; from config.settings import MEETING_NOTES_DIR, THEMES; MEETING_NOTES_DIR.mkdir(parents=True, exist_ok=True); [((theme_dir := MEETING_NOTES_DIR / theme).mkdir(exist_ok=True), (theme_dir / 'データベース化前').mkdir(exist_ok=True), (theme_dir / 'データベース化済み').mkdir(exist_ok=True)) for theme in THEMES]; print('✅ データディレクトリ構造が作成されました')"
+python -c "from pathlib import Path; from config.settings import MEETING_NOTES_DIR, THEMES; MEETING_NOTES_DIR.mkdir(parents=True, exist_ok=True); [((theme_dir := MEETING_NOTES_DIR / theme).mkdir(exist_ok=True), (theme_dir / 'データベース化前').mkdir(exist_ok=True)) for theme in THEMES]; print('✅ データディレクトリ構造が作成されました')"
 
 echo.
 echo 🎉 セットアップが完了しました！
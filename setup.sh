@@ -42,7 +42,6 @@ for theme in THEMES:
     
     # サブディレクトリ作成
     (theme_dir / 'データベース化前').mkdir(exist_ok=True)
-    (theme_dir / 'データベース化済み').mkdir(exist_ok=True)
 
 print('✅ データディレクトリ構造が作成されました')
 "
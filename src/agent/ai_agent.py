@@ -1,68 +1,101 @@
 import unicodedata
-from typing import Dict
+from functools import cached_property
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains import create_retrieval_chain
 from langchain.tools import Tool
-from langchain.agents import AgentType, initialize_agent
 from langchain.schema import HumanMessage, AIMessage
-from langchain.chat_models import ChatOpenAI
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+from langchain_core.runnables import RunnableLambda
 
-from config.settings import THEMES
+from config.settings import REWRITE_MODEL, THEME_ROUTER_ENABLED, THEMES
+from src.agent.theme_router import ThemeRouter
+from src.rag.backends import create_chat_model
+from src.rag.query_rewriter import QueryRewriter
+from src.rag.context_packer import ContextPacker
+from src.rag.multi_theme_retriever import MultiThemeRetriever
+from src.utils.metrics import metrics, metrics_callback
+from src.utils.streaming import FINAL_ANSWER_TAG, FinalAnswerQueueHandler, stream_from_thread
+
+QGEN_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "会話履歴と最新の入力をもとに、履歴の内容を反映した独立した質問を日本語で生成してください。"),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """あなたは優秀な質問応答アシスタント。{context}のみを根拠として、日本語で質問に回答する。
+        わからない時はちゃんとわからないという。"""),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+# 複数テーマ検索ツールの入力でテーマ一覧と質問を区切る記号
+MULTI_THEME_SEPARATOR = "|"
+
+
+def normalize(s: str) -> str:
+    """テーマ名の表記ゆれ（全角半角など）を吸収する"""
+    return unicodedata.normalize("NFKC", s)
 
 
 class AIAgent:
-    def __init__(self, theme_retriever: Dict, chat_history: list):
+    def __init__(self, theme_retriever: Dict, chat_history: list, router: Optional[ThemeRouter] = None):
         if not theme_retriever:
             raise ValueError("theme_retrieverが空です。RAGシステムの初期化を確認してください。")
         
         self.theme_retriever = theme_retriever
         self.chat_history = chat_history
+        # 検索結果の重複除去・連続チャンクの結合・トークン予算内への詰め込み
+        self.context_packer = ContextPacker()
         
         try:
-            self.llm = ChatOpenAI(
-                model_name="gpt-4",
-                temperature=0.0,
-                streaming=True,
-                callbacks=[StreamingStdOutCallbackHandler()]
-            )
+            # 最終回答のトークンはstream_run()で呼び出し元に逐次返す
+            self.llm = create_chat_model("gpt-4", streaming=True)
+            # 質問の書き換えは軽量モデルで行う
+            self.rewrite_llm = create_chat_model(REWRITE_MODEL)
+            
+            # 質問の書き換え（ルーター・複数テーマ検索・テーマ別ツールで共用し、書き換え済みの質問は書き換え直さない）
+            self.question_rewriter = QueryRewriter(self.rewrite_llm, QGEN_PROMPT)
+            # テーマを指定した検索・回答（ルーターの振り分け先と複数テーマ横断ツールで共用）
+            self.multi_theme_retriever = MultiThemeRetriever(self.theme_retriever)
+            self.multi_theme_qa_chain = create_stuff_documents_chain(llm=self.llm, prompt=QA_PROMPT)
             
             self.tools = self._create_tools()
             if not self.tools:
                 raise ValueError("AIエージェント用のツールが作成されませんでした。")
             
-            self.agent_executor = self._create_agent()
-            
         except Exception as e:
             raise RuntimeError(f"AIエージェントの初期化に失敗しました: {str(e)}")
+        
+        # 確信度の高い質問はエージェント（ツール選択のLLM呼び出し）を通さずに回答する
+        # （同じインデックスで複数のエージェントを作る場合は、作成済みのルーターを渡して共有できる）
+        if router is None and THEME_ROUTER_ENABLED:
+            router = self._create_router()
+        self.router = router
+        if router is not None:
+            metrics.register_stats("theme_router", router.stats)
+    
+    def _create_router(self) -> Optional[ThemeRouter]:
+        """インデックス済みのチャンクからテーマ振り分け用のルーターを作成（作れない場合はNone）"""
+        retriever = next(iter(self.theme_retriever.values()))
+        keyword_index = getattr(retriever, "keyword_index", None)
+        if keyword_index is None:
+            print("キーワードインデックスがないため、テーマ振り分けを使わずにエージェントで回答します。")
+            return None
+        try:
+            return ThemeRouter.from_keyword_index(keyword_index, list(self.theme_retriever))
+        except Exception as e:
+            print(f"テーマ振り分けを使わずにエージェントで回答します: {e}")
+            return None
     
     def _create_rag_chain(self, retriever, llm):
         """テーマ別RAGチェーンを作成"""
-        qgen_text = "会話履歴と最新の入力をもとに、履歴の内容を反映した独立した質問を日本語で生成してください。"
-        qgen_prompt = ChatPromptTemplate.from_messages([
-            ("system", qgen_text),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}"),
-        ])
-        
-        history_aware_retriever = create_history_aware_retriever(
-            llm=llm,
-            retriever=retriever,
-            prompt=qgen_prompt
-        )
-        
-        qa_system = """あなたは優秀な質問応答アシスタント。{context}のみを根拠として、日本語で質問に回答する。
-        わからない時はちゃんとわからないという。"""
-        
-        qa_prompt = ChatPromptTemplate.from_messages([
-            ("system", qa_system),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}"),
-        ])
+        # 履歴がない・独立した質問の場合は書き換えのLLM呼び出しを省略
+        history_aware_retriever = self.question_rewriter.as_retriever_input() | retriever | RunnableLambda(self.context_packer.pack)
         
-        qa_chain = create_stuff_documents_chain(llm=llm, prompt=qa_prompt)
+        qa_chain = create_stuff_documents_chain(llm=llm, prompt=QA_PROMPT)
         return create_retrieval_chain(history_aware_retriever, qa_chain)
     
     def _make_tool(self, theme_name: str):
@@ -70,7 +103,7 @@ class AIAgent:
         chain = self._create_rag_chain(self.theme_retriever[theme_name], self.llm)
         
         def _run(q: str):
-            res = chain.invoke({"input": q, "chat_history": self.chat_history})
+            res = chain.invoke({"input": q, "chat_history": list(self.chat_history)})
             answer = res.get("answer", "")
             self.chat_history.extend([
                 HumanMessage(content=q),
@@ -85,14 +118,60 @@ class AIAgent:
             {theme_name}テーマのベクターストアのみを参照しなさい。"""
         )
     
+    def _parse_multi_theme_input(self, text: str):
+        """「テーマ1,テーマ2|質問」形式の入力をテーマ一覧と質問に分ける（テーマが不明な場合は全テーマ）"""
+        text = normalize(text).strip()
+        themes_part, sep, question = text.partition(MULTI_THEME_SEPARATOR)
+        if not sep:
+            return list(self.theme_retriever.keys()), text
+        norm2real = {normalize(k): k for k in self.theme_retriever.keys()}
+        themes = []
+        for name in themes_part.replace("、", ",").split(","):
+            real = norm2real.get(name.strip())
+            if real and real not in themes:
+                themes.append(real)
+        return themes or list(self.theme_retriever.keys()), question.strip()
+    
+    def multi_theme_query(self, question: str, themes, callbacks=None, standalone: Optional[str] = None) -> str:
+        """複数テーマを並列に検索し、統合したコンテキストから1回の生成で回答する（standaloneは書き換え済みの質問）"""
+        history = list(self.chat_history)
+        if standalone is None:
+            standalone = self.question_rewriter.rewrite(question, history)
+        with metrics.timer("retrieve"):
+            docs = self.context_packer.pack(self.multi_theme_retriever.retrieve(standalone, themes))
+        print(f"🔀 {', '.join(themes)} を並列検索しました（{len(docs)}件）")
+        
+        with metrics.timer("generation"):
+            answer = self.multi_theme_qa_chain.invoke(
+                {"input": question, "chat_history": history, "context": docs},
+                config={"callbacks": callbacks, "tags": [FINAL_ANSWER_TAG]}
+            )
+        self.chat_history.extend([
+            HumanMessage(content=question),
+            AIMessage(content=answer)
+        ])
+        return answer
+    
+    def _make_multi_theme_tool(self):
+        """複数テーマ横断ツールを作成（エージェントはテーマを選ぶだけで、回答はツールがそのまま返す）"""
+        def _run(text: str, callbacks=None):
+            themes, question = self._parse_multi_theme_input(text)
+            return self.multi_theme_query(question, themes, callbacks=callbacks)
+        
+        theme_names = "、".join(self.theme_retriever.keys())
+        return Tool(
+            name="MultiThemeRAG",
+            func=_run,
+            return_direct=True,
+            description=f"""複数のテーマにまたがる質問に日本語で回答してください。
+            入力は「テーマ1,テーマ2{MULTI_THEME_SEPARATOR}質問」の形式で、関係するテーマをすべて指定しなさい。
+            指定できるテーマ: {theme_names}"""
+        )
+    
     def _create_tools(self):
         """全テーマのツールを作成"""
         tools = []
         
-        # 正規化のヘルパー関数
-        def normalize(s: str) -> str:
-            return unicodedata.normalize("NFKC", s)
-        
         # 正規化キー -> 実キーのマッピング
         norm2real = {normalize(k): k for k in self.theme_retriever.keys()}
         
@@ -103,10 +182,17 @@ class AIAgent:
                 tool = self._make_tool(real_theme)
                 tools.append(tool)
         
+        # 複数テーマにまたがる質問は1回のツール呼び出しで並列に検索する
+        if len(tools) > 1:
+            tools.append(self._make_multi_theme_tool())
+        
         return tools
     
-    def _create_agent(self):
-        """エージェントを作成"""
+    @cached_property
+    def agent_executor(self):
+        """エージェント（ルーターで振り分けられない質問で初めて使うときに作る）"""
+        # langchain.agentsのインポートは重いため、エージェントが必要になるまで遅らせる
+        from langchain.agents import AgentType, initialize_agent
         return initialize_agent(
             llm=self.llm,
             tools=self.tools,
@@ -114,6 +200,36 @@ class AIAgent:
             verbose=True
         )
     
-    def run(self, query: str) -> str:
-        """クエリを実行"""
-        return self.agent_executor.run(query)
+    def _route(self, query: str) -> Tuple[List[str], Optional[str]]:
+        """ルーターで検索するテーマを決める（確信度が低い場合は空のリスト）と、書き換え済みの質問"""
+        if self.router is None:
+            return [], None
+        standalone = self.question_rewriter.rewrite(query, list(self.chat_history))
+        decision = self.router.route(standalone)
+        if decision.themes:
+            print(f"🧭 テーマ振り分け: {', '.join(decision.themes)}（確信度 {decision.confidence:.3f}, {decision.elapsed_ms:.1f}ms）")
+        else:
+            print(f"🧭 確信度が低いためエージェントで回答します（確信度 {decision.confidence:.3f}）")
+        return decision.themes, standalone
+    
+    def _run_agent(self, query: str, callbacks=None) -> str:
+        """ReActエージェントで回答（ツールの実行時間はmetrics_callbackでagent_stepとして記録）"""
+        with metrics.timer("agent"):
+            config = {"callbacks": [*(callbacks or []), metrics_callback]}
+            return self.agent_executor.invoke({"input": query}, config=config)["output"]
+    
+    def run(self, query: str, callbacks=None) -> str:
+        """クエリを実行
+        
+        エージェントに任せる場合は、振り分けのために書き換えた独立質問をそのまま渡す
+        （ツールの書き換えは共用のrewriterが書き換え済みと判定してLLMを呼ばない）。
+        """
+        themes, standalone = self._route(query)
+        if themes:
+            return self.multi_theme_query(query, themes, callbacks=callbacks, standalone=standalone)
+        return self._run_agent(standalone or query, callbacks=callbacks)
+    
+    def stream_run(self, query: str) -> Iterator[str]:
+        """クエリを実行し、最終回答のトークンを生成され次第返す（質問の書き換えと振り分けもストリームの中で行う）"""
+        handler = FinalAnswerQueueHandler()
+        return stream_from_thread(lambda: self.run(query, callbacks=[handler]), handler)
@@ -0,0 +1,81 @@
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+
+from config.settings import ROUTER_MAX_THEMES, ROUTER_MIN_CONFIDENCE, ROUTER_MULTI_THRESHOLD
+from src.rag.keyword_index import KeywordIndex, tokenize
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """振り分けの結果（themesが空の場合は確信度が低く、エージェントに任せる）"""
+    themes: List[str]
+    confidence: float
+    probabilities: Dict[str, float]
+    elapsed_ms: float
+
+
+class ThemeRouter:
+    """インデックス済みのチャンクから学習した多項ナイーブベイズで、LLMを呼ばずに検索するテーマを選ぶ
+
+    特徴量はキーワード検索と同じトークン（英数字の語と日本語の文字bigram）で、埋め込みAPIも呼ばない。
+    事後確率（テーマの事前確率は一様）の高い順に、確率がmulti_threshold以上のテーマを最大max_themes個選び、
+    その合計（確信度）がmin_confidence未満、または全テーマが残った場合はエージェントに任せる。
+    確率なので埋め込みモデルによらず同じしきい値を使える。
+    """
+
+    def __init__(self, term_counts: Dict[str, Counter], min_confidence: float = ROUTER_MIN_CONFIDENCE,
+                 multi_threshold: float = ROUTER_MULTI_THRESHOLD, max_themes: int = ROUTER_MAX_THEMES,
+                 alpha: float = 1.0):
+        self.themes = [theme for theme, counts in term_counts.items() if counts]
+        if not self.themes:
+            raise ValueError("テーマ振り分けの学習に使うチャンクがありません。")
+        self.min_confidence = min_confidence
+        self.multi_threshold = multi_threshold
+        self.max_themes = max_themes
+
+        vocabulary = sorted(set().union(*(term_counts[theme] for theme in self.themes)))
+        self._term_ids = {term: i for i, term in enumerate(vocabulary)}
+        counts = np.zeros((len(self.themes), len(vocabulary)), dtype=np.float32)
+        for row, theme in enumerate(self.themes):
+            for term, count in term_counts[theme].items():
+                counts[row, self._term_ids[term]] = count
+        # ラプラス平滑化した log P(トークン | テーマ)
+        totals = counts.sum(axis=1, keepdims=True) + alpha * len(vocabulary)
+        self._log_likelihood = np.log((counts + alpha) / totals).astype(np.float32)
+        self.stats = {"routed": 0, "fallback": 0, "total_ms": 0.0}
+
+    @classmethod
+    def from_keyword_index(cls, keyword_index: KeywordIndex, themes: List[str], **kwargs) -> "ThemeRouter":
+        """キーワードインデックスのチャンクからテーマごとのトークン分布を学習する"""
+        counts = keyword_index.term_counts("theme")
+        return cls({theme: counts.get(theme, Counter()) for theme in themes}, **kwargs)
+
+    def probabilities(self, query: str) -> Dict[str, float]:
+        """各テーマの事後確率（学習時に出てこなかったトークンは無視し、手がかりがなければ一様）"""
+        term_ids = [self._term_ids[term] for term in tokenize(query) if term in self._term_ids]
+        if not term_ids:
+            return {theme: 1.0 / len(self.themes) for theme in self.themes}
+        scores = self._log_likelihood[:, term_ids].sum(axis=1)
+        scores = np.exp(scores - scores.max())
+        return {theme: float(p) for theme, p in zip(self.themes, scores / scores.sum())}
+
+    def route(self, query: str) -> RouteDecision:
+        started = time.perf_counter()
+        probabilities = self.probabilities(query)
+        ranked = sorted(probabilities, key=probabilities.get, reverse=True)
+        selected = [theme for theme in ranked[:self.max_themes] if probabilities[theme] >= self.multi_threshold]
+        confidence = math.fsum(probabilities[theme] for theme in selected)
+        if len(selected) == len(self.themes) > 1:
+            # 全テーマが候補に残る（手がかりになるトークンがない）場合は絞り込めていない
+            confidence = 0.0
+        themes = selected if confidence >= self.min_confidence else []
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self.stats["routed" if themes else "fallback"] += 1
+        self.stats["total_ms"] += elapsed_ms
+        return RouteDecision(themes, confidence, probabilities, elapsed_ms)
@@ -0,0 +1,123 @@
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from config.settings import ANN_KMEANS_ITERS, ANN_NLIST, ANN_NPROBE, ANN_TRAIN_SAMPLE
+
+# 割り当て・学習時に一度に内積を計算する行数
+_ASSIGN_BLOCK = 65536
+
+
+def default_nlist(count: int) -> int:
+    """クラスタ数の既定値（チャンク数の平方根。検索対象がおおよそ sqrt(N) * nprobe 件になる）"""
+    return max(1, int(np.sqrt(count)))
+
+
+class IVFIndex:
+    """転置ファイル（IVF）による近似最近傍探索
+
+    正規化済みベクトルを球面k-meansでnlist個のクラスタに分け、検索時は質問に近い
+    nprobe個のクラスタに属する行だけを候補にする。nprobeを増やすほど再現率が上がり、遅くなる。
+    学習後に追加された行も最も近いクラスタに割り当てるため、再学習なしで差分更新に追従する。
+    """
+
+    def __init__(self, nlist: int = ANN_NLIST, nprobe: int = ANN_NPROBE, iters: int = ANN_KMEANS_ITERS,
+                 train_sample: int = ANN_TRAIN_SAMPLE, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iters = iters
+        self.train_sample = train_sample
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_count = 0
+        self._lists = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def sample_rows(self, count: int) -> np.ndarray:
+        """学習に使う行番号（件数が多い場合は無作為に選んだ一部）"""
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist or default_nlist(count), count)
+        sample_size = min(count, max(self.train_sample, nlist * 4))
+        return np.sort(rng.choice(count, sample_size, replace=False))
+
+    def train(self, sample: np.ndarray, count: int):
+        """標本（正規化済みベクトル）から球面k-meansでクラスタ中心を学習する（countは全体の行数）"""
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist or default_nlist(count), len(sample))
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.iters):
+            labels = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # 空のクラスタは標本からランダムに選び直す
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = np.full(count, -1, dtype=np.int32)
+        self.trained_count = count
+        self._lists = None
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _ASSIGN_BLOCK):
+            block = np.asarray(vectors[start:start + _ASSIGN_BLOCK], dtype=np.float32)
+            labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """行を最も近いクラスタに割り当てる"""
+        rows = np.asarray(rows)
+        if not len(rows):
+            return
+        needed = int(rows.max()) + 1
+        if needed > len(self.assignments):
+            assignments = np.full(max(needed, len(self.assignments) * 2), -1, dtype=np.int32)
+            assignments[:len(self.assignments)] = self.assignments
+            self.assignments = assignments
+        self.assignments[rows] = self._nearest(vectors, self.centroids)
+        self._lists = None
+
+    def _inverted_lists(self):
+        """クラスタごとの行番号（割り当て順にソートした行番号と各クラスタの開始位置）"""
+        lists = self._lists
+        if lists is None:
+            order = np.argsort(self.assignments, kind="stable").astype(np.int64)
+            starts = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            lists = self._lists = (order, starts)
+        return lists
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """質問に近いnprobe個のクラスタに属する行番号"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        order, starts = self._inverted_lists()
+        scores = self.centroids @ query
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([order[starts[c]:starts[c + 1]] for c in probes])
+
+    def save(self, directory: Path):
+        np.save(directory / "ivf_centroids.npy", self.centroids)
+        np.save(directory / "ivf_assignments.npy", self.assignments)
+        (directory / "ivf_trained_count").write_text(str(self.trained_count))
+
+    def load(self, directory: Path) -> bool:
+        """保存済みのインデックスを読み込む（なければFalse）"""
+        path = directory / "ivf_centroids.npy"
+        if not path.exists():
+            return False
+        self.centroids = np.load(path)
+        self.assignments = np.load(directory / "ivf_assignments.npy")
+        self.trained_count = int((directory / "ivf_trained_count").read_text())
+        self._lists = None
+        return True
@@ -0,0 +1,37 @@
+from config.settings import EMBED_CACHE_ENABLED, EMBED_CACHE_PATH, EMBEDDING_BACKEND, LLM_BACKEND
+from src.rag.embedding_cache import CachedEmbeddings
+from src.rag.embedding_pipeline import BatchedEmbeddings
+from src.utils.metrics import metrics_callback
+
+
+def requires_openai_key() -> bool:
+    """埋め込み・チャットモデルのどちらかにOpenAIのAPIを使う設定か（両方fakeならAPIキーは不要）"""
+    return EMBEDDING_BACKEND != "fake" or LLM_BACKEND != "fake"
+
+
+def create_embeddings():
+    """設定に応じた埋め込みバックエンドを作成（バッチ化・並列化パイプラインで包み、その外側でキャッシュする）"""
+    if EMBEDDING_BACKEND == "fake":
+        from src.rag.fake_backends import LocalFakeEmbeddings
+        base = LocalFakeEmbeddings()
+    else:
+        from langchain.embeddings.openai import OpenAIEmbeddings
+        # リトライはパイプライン側で429を見ながら行う
+        base = OpenAIEmbeddings(max_retries=0)
+    embeddings = BatchedEmbeddings(base)
+    if EMBED_CACHE_ENABLED:
+        # キャッシュ済みのテキストはバッチにも載せない
+        embeddings = CachedEmbeddings(embeddings, EMBED_CACHE_PATH)
+    return embeddings
+
+
+def create_chat_model(model_name: str, streaming: bool = False):
+    """設定に応じたチャットモデルを作成（fakeの場合はネットワーク不要の疑似モデル）
+
+    すべての呼び出しの所要時間・トークン数・料金をmetrics_callbackで記録する。
+    """
+    if LLM_BACKEND == "fake":
+        from src.rag.fake_backends import LocalFakeChatModel
+        return LocalFakeChatModel(streaming=streaming, callbacks=[metrics_callback])
+    from langchain.chat_models import ChatOpenAI
+    return ChatOpenAI(model_name=model_name, temperature=0.0, streaming=streaming, callbacks=[metrics_callback])
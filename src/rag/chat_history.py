@@ -0,0 +1,101 @@
+from collections import deque
+from typing import Iterable, List
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+
+from config.settings import HISTORY_MAX_TOKENS, HISTORY_MAX_TURNS
+from src.utils.tokens import count_tokens
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "あなたは会話の要約担当です。これまでの要約に新しいやり取りを反映し、"
+               "後続の質問に答えるために必要な事実・固有名詞・ユーザーの要望を残した要約を日本語400字以内で出力してください。"),
+    ("human", "これまでの要約:\n{summary}\n\n新しいやり取り:\n{turns}"),
+])
+
+
+class ChatHistoryManager:
+    """トークン予算付きの会話履歴
+
+    直近HISTORY_MAX_TURNSターンはそのまま保持し、それより古いターンやトークン予算を超えた分は
+    要約に畳み込む。要約は追い出したターンと前回の要約だけから更新するため、会話が長くなっても
+    1ターンあたりのコストは一定になる。要約のLLM呼び出しは回答後のextend()では行わず、次にmessages()で
+    読むときにまとめて行う（回答の完了を要約で遅らせないため）。リストと同じように extend / clear / len / 反復 ができる。
+    llmにはモデルを返す関数も渡せ、その場合は初めて要約するときにモデルを作る。
+    """
+
+    def __init__(self, llm=None, max_turns: int = HISTORY_MAX_TURNS, max_tokens: int = HISTORY_MAX_TOKENS):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary = ""
+        self._llm = llm
+        self._summarizer = None
+        self._turns = deque()
+        self._evicted = []
+        self._pending_human = None
+
+    def extend(self, messages: Iterable[BaseMessage]):
+        """HumanMessage / AIMessage の組を追加（listのextendと同じ使い方ができる）"""
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                self._pending_human = message
+            elif self._pending_human is not None:
+                self._append(self._pending_human, message)
+                self._pending_human = None
+
+    def _append(self, human: BaseMessage, ai: BaseMessage):
+        tokens = count_tokens(human.content) + count_tokens(ai.content)
+        self._turns.append((human, ai, tokens))
+        self._trim()
+
+    def _trim(self):
+        """ターン数・トークン予算を超えた古いターンを、要約待ちに移す（直近1ターンは必ず残す）"""
+        while len(self._turns) > 1 and (
+            len(self._turns) > self.max_turns or self.token_count() > self.max_tokens
+        ):
+            self._evicted.append(self._turns.popleft())
+
+    def _get_summarizer(self):
+        if self._summarizer is None and self._llm is not None:
+            llm = self._llm if isinstance(self._llm, Runnable) else self._llm()
+            self._summarizer = SUMMARY_PROMPT | llm | StrOutputParser()
+        return self._summarizer
+
+    def _fold_into_summary(self):
+        """要約待ちのターンを1回のLLM呼び出しで要約に畳み込む"""
+        evicted, self._evicted = self._evicted, []
+        summarizer = self._get_summarizer()
+        if not evicted or summarizer is None:
+            return
+        turns = "\n".join(f"ユーザー: {human.content}\nAI: {ai.content}" for human, ai, _ in evicted)
+        try:
+            self.summary = summarizer.invoke({"summary": self.summary or "（なし）", "turns": turns})
+        except Exception as e:
+            print(f"会話履歴の要約に失敗したため古いターンを破棄しました: {e}")
+
+    def token_count(self) -> int:
+        return count_tokens(self.summary) + sum(tokens for _, _, tokens in self._turns)
+
+    def messages(self) -> List[BaseMessage]:
+        """プロンプトに渡すメッセージ（要約 + 直近のターン）"""
+        self._fold_into_summary()
+        messages = []
+        if self.summary:
+            messages.append(SystemMessage(content=f"これまでの会話の要約: {self.summary}"))
+        for human, ai, _ in self._turns:
+            messages.extend([human, ai])
+        return messages
+
+    def clear(self):
+        self.summary = ""
+        self._turns.clear()
+        self._evicted = []
+        self._pending_human = None
+
+    def __iter__(self):
+        return iter(self.messages())
+
+    def __len__(self) -> int:
+        return len(self.messages())
@@ -0,0 +1,411 @@
+import json
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from config.settings import ANN_INDEX, ANN_MIN_CHUNKS, COMPACT_STORE_DTYPE
+from src.rag.ann_index import IVFIndex
+
+# 行列ファイルを拡張するときの最小行数
+_MIN_CAPACITY = 1024
+# 検索時に一度にfloat32へ変換する行数（float16/int8の行列全体をコピーしないため）
+_SEARCH_BLOCK = 65536
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+class CompactVectorStore(VectorStore):
+    """NumPy行列をメモリマップで共有するコンパクトなベクターストア
+
+    ベクトルは正規化して float32 / float16 / int8（行ごとのスケール付き）の行列ファイルに保存し、
+    チャンク本文とメタデータはSQLiteの別テーブルに置く。メモリ上に持つのはIDと行番号の対応、
+    テーマ番号・削除フラグの配列だけで、本文は上位k件を返すときにだけ読み出す。
+    行列はOSのページキャッシュを通じて複数プロセスで共有されるため、ワーカーごとのRSSが小さく、起動も速い。
+    path=None の場合はファイルを作らずメモリ内で動作する。スコアはコサイン類似度（大きいほど近い）。
+    ann_index="ivf" の場合、チャンク数がANN_MIN_CHUNKS以上になるとIVFインデックスを学習し、
+    テーマで絞り込まない検索は近いクラスタの行だけを対象にする。
+    """
+
+    def __init__(self, path: Optional[Path], embedding: Embeddings, dtype: str = COMPACT_STORE_DTYPE,
+                 ann_index: str = ANN_INDEX):
+        if dtype not in _DTYPES:
+            raise ValueError(f"未対応のdtypeです: {dtype}")
+        self.path = Path(path) if path else None
+        self.embedding = embedding
+        self.dtype = dtype
+        self.ann_index = ann_index
+        self._ann: Optional[IVFIndex] = None
+        self._lock = threading.RLock()
+        self._dim = None
+        self._count = 0
+        self._capacity = 0
+        self._matrix = None
+        self._scales = None
+        self._row_of = {}
+        self._ids: List[str] = []
+        self._themes = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._theme_codes = {}
+
+        if self.path:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path / "chunks.sqlite3"), check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                theme TEXT,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+        self._load()
+        if self.path and self.ann_index == "ivf":
+            ann = IVFIndex()
+            if ann.load(self.path):
+                self._ann = ann
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    # --- 保存形式 ---------------------------------------------------------------
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _matrix_path(self) -> Path:
+        return self.path / f"vectors.{self.dtype}"
+
+    def _load(self):
+        """保存済みの行列をメモリマップで開き、ID・テーマ・削除フラグだけを読み込む"""
+        stored_dtype = self._meta("dtype")
+        if stored_dtype and stored_dtype != self.dtype:
+            # 作成時のdtypeで開く（変換する場合はインデックスを作り直す）
+            print(f"既存のコンパクトストアは{stored_dtype}で作成されているため、{stored_dtype}で開きます。")
+            self.dtype = stored_dtype
+        dim = self._meta("dim")
+        if dim is None:
+            return
+        self._dim = int(dim)
+        self._capacity = int(self._meta("capacity"))
+        self._count = int(self._meta("count"))
+        self._open_matrix()
+
+        rows = self._db.execute("SELECT row, id, theme, deleted FROM chunks ORDER BY row").fetchall()
+        self._ids = [None] * self._count
+        self._themes = np.full(self._capacity, -1, dtype=np.int32)
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        for row, chunk_id, theme, deleted in rows:
+            self._ids[row] = chunk_id
+            self._themes[row] = self._theme_code(theme)
+            if not deleted:
+                self._row_of[chunk_id] = row
+                self._alive[row] = True
+
+    def _open_matrix(self):
+        if self.path is None:
+            return
+        self._matrix = np.memmap(self._matrix_path(), dtype=_DTYPES[self.dtype], mode="r+",
+                                 shape=(self._capacity, self._dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self.path / "scales.float32", dtype=np.float32, mode="r+",
+                                     shape=(self._capacity,))
+
+    def _grow(self, needed: int):
+        """行列の容量を倍々に拡張する（検索中の古いメモリマップはそのまま有効）"""
+        capacity = max(_MIN_CAPACITY, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        if self.path is None:
+            matrix = np.zeros((capacity, self._dim), dtype=_DTYPES[self.dtype])
+            scales = np.zeros(capacity, dtype=np.float32)
+            if self._matrix is not None:
+                matrix[:self._count] = self._matrix[:self._count]
+                if self._scales is not None:
+                    scales[:self._count] = self._scales[:self._count]
+            self._matrix = matrix
+            self._scales = scales if self.dtype == "int8" else None
+        else:
+            if self._matrix is not None:
+                self._matrix.flush()
+            itemsize = np.dtype(_DTYPES[self.dtype]).itemsize
+            with open(self._matrix_path(), "ab") as f:
+                f.truncate(capacity * self._dim * itemsize)
+            if self.dtype == "int8":
+                with open(self.path / "scales.float32", "ab") as f:
+                    f.truncate(capacity * 4)
+            self._capacity = capacity
+            self._open_matrix()
+
+        themes = np.full(capacity, -1, dtype=np.int32)
+        alive = np.zeros(capacity, dtype=bool)
+        themes[:self._count] = self._themes[:self._count]
+        alive[:self._count] = self._alive[:self._count]
+        self._themes, self._alive = themes, alive
+        self._capacity = capacity
+
+    def _theme_code(self, theme: Optional[str]) -> int:
+        if theme is None:
+            return -1
+        return self._theme_codes.setdefault(theme, len(self._theme_codes))
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """正規化したベクトルを保存用のdtypeに変換（int8は行ごとのスケールも返す）"""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(_DTYPES[self.dtype]), None
+
+    # --- 書き込み ---------------------------------------------------------------
+
+    def add_embeddings(self, ids: List[str], vectors: List[List[float]], texts: List[str], metadatas: List[dict]):
+        """埋め込み済みのチャンクを追加（同じIDがあればその行を上書きする）"""
+        if not ids:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._dim is None:
+                self._dim = array.shape[1]
+                self._set_meta("dim", self._dim)
+                self._set_meta("dtype", self.dtype)
+            rows = []
+            next_row = self._count
+            assigned = {}
+            for chunk_id in ids:
+                row = assigned.get(chunk_id, self._row_of.get(chunk_id))
+                if row is None:
+                    row = next_row
+                    next_row += 1
+                assigned[chunk_id] = row
+                rows.append(row)
+            self._grow(next_row)
+
+            encoded, scales = self._encode(array)
+            rows_array = np.asarray(rows)
+            self._matrix[rows_array] = encoded
+            if scales is not None:
+                self._scales[rows_array] = scales
+            for chunk_id, row, metadata in zip(ids, rows, metadatas):
+                if row >= len(self._ids):
+                    self._ids.extend([None] * (row + 1 - len(self._ids)))
+                self._ids[row] = chunk_id
+                self._row_of[chunk_id] = row
+                self._themes[row] = self._theme_code(metadata.get("theme"))
+                self._alive[row] = True
+
+            # 再利用しない削除済みの行と同じIDが残っている場合は先に消す
+            self._db.executemany("DELETE FROM chunks WHERE id = ? AND row != ?", list(zip(ids, rows)))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, theme, text, metadata, deleted) VALUES (?, ?, ?, ?, ?, 0)",
+                [(row, chunk_id, metadata.get("theme"), text, json.dumps(metadata, ensure_ascii=False))
+                 for chunk_id, row, text, metadata in zip(ids, rows, texts, metadatas)]
+            )
+            self._count = max(self._count, next_row)
+            self._set_meta("count", self._count)
+            self._set_meta("capacity", self._capacity)
+            self._db.commit()
+            if isinstance(self._matrix, np.memmap):
+                self._matrix.flush()
+                if self._scales is not None:
+                    self._scales.flush()
+
+            if self._ann is not None:
+                self._ann.add(rows_array, self._decode(rows_array))
+            if not self._maybe_train_ann() and self._ann is not None and self.path:
+                self._ann.save(self.path)
+
+    def _decode(self, rows) -> np.ndarray:
+        """指定した行（スライスまたは行番号の配列）のベクトルをfloat32で返す"""
+        block = np.asarray(self._matrix[rows], dtype=np.float32)
+        if self._scales is not None:
+            block = block * self._scales[rows][:, None]
+        return block
+
+    def _maybe_train_ann(self, force: bool = False) -> bool:
+        """チャンク数がしきい値を超えた場合や、前回の学習時から倍に増えた場合にIVFインデックスを学習し直す"""
+        if not force:
+            if self.ann_index != "ivf" or len(self._row_of) < ANN_MIN_CHUNKS:
+                return False
+            if self._ann is not None and self._count < self._ann.trained_count * 2:
+                return False
+        ann = IVFIndex()
+        ann.train(self._decode(ann.sample_rows(self._count)), self._count)
+        for start in range(0, self._count, _SEARCH_BLOCK):
+            end = min(start + _SEARCH_BLOCK, self._count)
+            ann.add(np.arange(start, end), self._decode(slice(start, end)))
+        self._ann = ann
+        if self.path:
+            ann.save(self.path)
+        print(f"IVFインデックスを作成しました（{self._count}チャンク / {len(ann.centroids)}クラスタ）")
+        return True
+
+    def build_ann_index(self):
+        """チャンク数にかかわらずIVFインデックスを学習する"""
+        with self._lock:
+            if self._count:
+                self._maybe_train_ann(force=True)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in texts]
+        self.add_embeddings(ids, self.embedding.embed_documents(texts), texts, metadatas)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, path: Optional[Path] = None, **kwargs: Any):
+        store = cls(path, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """チャンクを削除済みにする（行は詰めずに残し、検索対象から外す）"""
+        if not ids:
+            return False
+        with self._lock:
+            rows = [self._row_of.pop(chunk_id) for chunk_id in ids if chunk_id in self._row_of]
+            if rows:
+                self._alive[np.asarray(rows)] = False
+            self._db.executemany("UPDATE chunks SET deleted = 1 WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            self._db.commit()
+        return True
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def get_documents(self) -> Tuple[List[str], List[Document]]:
+        """削除されていない全チャンクの (IDの一覧, Documentの一覧)"""
+        rows = self._db.execute("SELECT id, text, metadata FROM chunks WHERE deleted = 0 ORDER BY row").fetchall()
+        return [row[0] for row in rows], [Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows]
+
+    def delete_collection(self):
+        """メモリ内のストアを破棄する（差し替え後の古いストア用）"""
+        with self._lock:
+            self._ann = None
+            self._matrix = None
+            self._scales = None
+            self._row_of.clear()
+            self._ids = []
+            self._count = 0
+
+    def close(self):
+        """ファイルを閉じる（.dbフォルダ削除前に呼び出す）"""
+        with self._lock:
+            self._ann = None
+            self._matrix = None
+            self._scales = None
+            self._db.close()
+
+    # --- 検索 ------------------------------------------------------------------
+
+    def _mask(self, count: int, filter: Optional[dict]) -> np.ndarray:
+        mask = self._alive[:count]
+        if not filter:
+            return mask
+        unsupported = set(filter) - {"theme"}
+        if unsupported:
+            raise ValueError(f"コンパクトストアはthemeでの絞り込みのみ対応しています: {sorted(unsupported)}")
+        code = self._theme_codes.get(filter["theme"])
+        if code is None:
+            return np.zeros(count, dtype=bool)
+        return mask & (self._themes[:count] == code)
+
+    def _scores(self, query: np.ndarray, count: int) -> np.ndarray:
+        matrix, scales = self._matrix, self._scales
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, _SEARCH_BLOCK):
+            end = min(start + _SEARCH_BLOCK, count)
+            block = matrix[start:end]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            scores[start:end] = block @ query
+            if scales is not None:
+                scores[start:end] *= scales[start:end]
+        return scores
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None,
+                                               nprobe: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """質問ベクトルに近い順に (Document, コサイン類似度) を返す（nprobe=0でIVFを使わず全件検索）"""
+        with self._lock:
+            count = self._count
+            if not count or self._matrix is None:
+                return []
+            mask = self._mask(count, filter)
+            ids = self._ids
+            ann = self._ann
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        if filter is None and ann is not None and nprobe != 0:
+            # 全テーマ横断の検索は質問に近いクラスタの行だけを対象にする
+            rows = np.sort(ann.candidates(query, nprobe))
+            rows = rows[rows < count]
+            rows = rows[mask[rows]]
+            if len(rows) >= k:
+                return self._top_k(rows, self._decode(rows) @ query, k, ids)
+
+        scores = self._scores(query, count)
+        scores[~mask] = -np.inf
+        k = min(k, int(mask.sum()))
+        return self._top_k(np.arange(count), scores, k, ids)
+
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, k: int, ids: List[str]) -> List[Tuple[Document, float]]:
+        """スコアの高いk行を選び、本文とメタデータをSQLiteから読み出す"""
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        top_ids = [ids[rows[i]] for i in top]
+        placeholders = ",".join("?" * len(top_ids))
+        with self._lock:
+            found = {
+                row[0]: row for row in self._db.execute(
+                    f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", top_ids
+                ).fetchall()
+            }
+        return [
+            (Document(page_content=found[chunk_id][1], metadata=json.loads(found[chunk_id][2])), float(scores[i]))
+            for chunk_id, i in zip(top_ids, top) if chunk_id in found
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     filter: Optional[dict] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
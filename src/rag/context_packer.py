@@ -0,0 +1,154 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from config.settings import CONTEXT_DEDUP_BITS, CONTEXT_DEDUP_JACCARD, CONTEXT_MAX_TOKENS
+from src.rag.keyword_index import tokenize
+from src.rag.response_cache import chunk_key
+from src.utils.tokens import count_tokens
+
+
+def simhash(text: str) -> int:
+    """文字bigram・英数字語の64bit SimHash（内容がほぼ同じテキストはハミング距離が小さくなる）"""
+    weights = [0] * 64
+    for token in tokenize(text):
+        value = int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:8], "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# 数値（金額・日付・型番の数字など）
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    """空白を除いた文字size-gramの集合"""
+    text = "".join(unicodedata.normalize("NFKC", text).split())
+    return {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+# 連続するチャンクの重なりとみなす最短の文字数（偶然一致した数字1文字などでつなげないため）
+MIN_MERGE_OVERLAP = 20
+
+
+def _merge_text(first: str, second: str, section: Optional[str], min_overlap: int = MIN_MERGE_OVERLAP) -> str:
+    """同じファイルの連続するチャンクをつなげる（続きのチャンクの見出しと、min_overlap文字以上の重なり部分は除く）"""
+    if section and second.startswith(section + "\n"):
+        second = second[len(section) + 1:]
+    for size in range(min(len(first), len(second)), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+class ContextPacker:
+    """検索結果をプロンプトに入れる前に整理する
+
+    関連度順に見て、同じ内容のチャンク・他のチャンクに含まれるチャンク・ほぼ同じ内容のチャンクを除き、
+    同じファイルの連続するチャンクは重なりを除いて1つにまとめ、
+    CONTEXT_MAX_TOKENSトークンに収まるまで関連度の高い順に詰める。
+    ほぼ同じ内容とみなすのは、SimHashのハミング距離がCONTEXT_DEDUP_BITS以下で、文字3-gramのJaccard係数が
+    CONTEXT_DEDUP_JACCARD以上、かつ含まれる数値が同じ場合だけ（数値だけが違う定型のチャンクは残す）。
+    """
+
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, dedup_bits: int = CONTEXT_DEDUP_BITS,
+                 dedup_jaccard: float = CONTEXT_DEDUP_JACCARD):
+        self.max_tokens = max_tokens
+        self.dedup_bits = dedup_bits
+        self.dedup_jaccard = dedup_jaccard
+        self.stats = {"input_tokens": 0, "output_tokens": 0, "duplicates": 0, "merged": 0, "over_budget": 0}
+        self._lock = threading.Lock()
+
+    def _is_near_duplicate(self, text: str, fingerprint: int, other: str, other_fp: int) -> bool:
+        # SimHashで候補を絞り、Jaccard係数と数値の一致で確かめる
+        if _hamming(fingerprint, other_fp) > self.dedup_bits:
+            return False
+        if _NUMBER.findall(text) != _NUMBER.findall(other):
+            return False
+        return _jaccard(_shingles(text), _shingles(other)) >= self.dedup_jaccard
+
+    def _deduplicate(self, docs: List[Document]) -> List[Document]:
+        kept, fingerprints = [], []
+        for doc in docs:
+            text = doc.page_content.strip()
+            fingerprint = simhash(text)
+            duplicate = any(
+                text in other.page_content or self._is_near_duplicate(text, fingerprint, other.page_content, other_fp)
+                for other, other_fp in zip(kept, fingerprints)
+            )
+            if duplicate:
+                self.stats["duplicates"] += 1
+                continue
+            kept.append(doc)
+            fingerprints.append(fingerprint)
+        return kept
+
+    def _merge_adjacent(self, docs: List[Document]) -> List[Document]:
+        """同じファイルで通し番号が連続するチャンクを、関連度が高い方の位置に1つにまとめる"""
+        by_position = {}
+        for rank, doc in enumerate(docs):
+            index = doc.metadata.get("chunk_index")
+            if index is not None:
+                by_position[(doc.metadata.get("source"), index)] = rank
+
+        merged_into = {}
+        for rank, doc in enumerate(docs):
+            index = doc.metadata.get("chunk_index")
+            if index is None or rank in merged_into:
+                continue
+            source = doc.metadata.get("source")
+            run = [rank]
+            # 直前・直後のチャンクが結果に含まれていれば連結する
+            while (source, index - 1) in by_position and by_position[(source, index - 1)] not in merged_into:
+                index -= 1
+                run.insert(0, by_position[(source, index)])
+            index = doc.metadata["chunk_index"]
+            while (source, index + 1) in by_position and by_position[(source, index + 1)] not in merged_into:
+                index += 1
+                run.append(by_position[(source, index)])
+            if len(run) > 1:
+                head = min(run)
+                for member in run:
+                    merged_into[member] = head
+                self.stats["merged"] += len(run) - 1
+
+                text = docs[run[0]].page_content
+                for member in run[1:]:
+                    text = _merge_text(text, docs[member].page_content, docs[member].metadata.get("section"))
+                metadata = dict(docs[run[0]].metadata)
+                metadata["chunk_id"] = "+".join(chunk_key(docs[member]) for member in run)
+                docs[head] = Document(page_content=text, metadata=metadata)
+
+        return [doc for rank, doc in enumerate(docs) if merged_into.get(rank, rank) == rank]
+
+    def pack(self, docs: List[Document]) -> List[Document]:
+        """重複を除き、連続するチャンクをまとめ、トークン予算内に収めた検索結果（関連度順）"""
+        if not docs:
+            return docs
+        with self._lock:
+            self.stats["input_tokens"] += sum(count_tokens(doc.page_content) for doc in docs)
+            docs = self._merge_adjacent(self._deduplicate(list(docs)))
+
+            packed, used = [], 0
+            for doc in docs:
+                tokens = count_tokens(doc.page_content)
+                if packed and used + tokens > self.max_tokens:
+                    self.stats["over_budget"] += 1
+                    continue
+                packed.append(doc)
+                used += tokens
+            self.stats["output_tokens"] += used
+            return packed
@@ -0,0 +1,211 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from config.settings import EMBED_CACHE_MAX_DISK_ENTRIES, EMBED_CACHE_MAX_ENTRIES
+from src.rag.response_cache import normalize_question
+
+# SQLiteのIN句1回あたりのキー数
+_LOOKUP_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用に表記ゆれ（全角半角・連続する空白）を吸収したテキスト"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    """埋め込み結果のキャッシュ（メモリ内LRU + SQLite）
+
+    キーは「モデル名・正規化したテキストのハッシュ」。質問は回答キャッシュと同じ正規化を行うため、
+    表記ゆれだけの質問も埋め込みAPIを呼ばずに返せる。チャンクの埋め込みも同じキャッシュを使うため、
+    インデックスを作り直す場合も内容が変わっていないチャンクは再計算しない。
+    複数のスレッドが同時に同じテキストを埋め込もうとした場合は、1回だけAPIを呼んで結果を共有する。
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        path: Optional[Path],
+        max_entries: int = EMBED_CACHE_MAX_ENTRIES,
+        max_disk_entries: int = EMBED_CACHE_MAX_DISK_ENTRIES,
+    ):
+        self.base = base
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        self._memory = OrderedDict()
+        self._connection = None
+        self._disk_count = None
+        # 計算中のキー -> 結果を受け取るFuture（同時に同じテキストを埋め込まないため）
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def model(self) -> str:
+        return getattr(self.base, "model", type(self.base).__name__)
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings (last_access)")
+            conn.commit()
+            self._connection = conn
+            self._disk_count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._connection
+
+    def _key(self, normalized: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: array):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, array]:
+        """メモリ内LRU → SQLiteの順にキャッシュ済みのベクトルを探す"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+
+            conn = self._conn()
+            missing = [key for key in keys if key not in found]
+            if conn is None or not missing:
+                return found
+            now = time.time()
+            for start in range(0, len(missing), _LOOKUP_BATCH):
+                batch = missing[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob)
+                    found[key] = vector
+                    self._remember(key, vector)
+                if rows:
+                    conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key, _ in rows]
+                    )
+            conn.commit()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        with self._lock:
+            packed = {key: array("f", vector) for key, vector in vectors.items()}
+            for key, vector in packed.items():
+                self._remember(key, vector)
+            conn = self._conn()
+            if conn is None:
+                return
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(key, self.model, vector.tobytes(), now) for key, vector in packed.items()]
+            )
+            self._disk_count += len(packed)
+            # 件数上限を1割超えたら最終アクセスが古い順に削除
+            if self._disk_count > self.max_disk_entries * 1.1:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+                self._disk_count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            conn.commit()
+
+    def _embed_cached(self, keys: List[str], texts: List[str], compute) -> List[List[float]]:
+        """キャッシュにないテキストだけをcomputeで埋め込む
+
+        同じテキストを別のスレッドが計算中の場合は、APIを呼ばずにその結果を待って共有する（single-flight）。
+        キャッシュへの書き込みは計算中の印を外す前に行うため、キャッシュにも計算中にもないキーだけが計算される。
+        """
+        owned: Dict[str, Tuple[str, Future]] = {}
+        waiting: Dict[str, Future] = {}
+        with self._lock:
+            found = self._lookup(list(dict.fromkeys(keys)))
+            # 同じバッチ内の重複や計算中の結果待ちは数えず、LRU・SQLiteで見つかったキーだけをヒットとする
+            hits = len(found)
+            for key, text in zip(keys, texts):
+                if key in found or key in owned or key in waiting:
+                    continue
+                future = self._inflight.get(key)
+                if future is None:
+                    owned[key] = (text, self._inflight.setdefault(key, Future()))
+                else:
+                    waiting[key] = future
+
+        if owned:
+            try:
+                computed = dict(zip(owned, compute([text for text, _ in owned.values()])))
+                self._store(computed)
+                for key, (_, future) in owned.items():
+                    found[key] = array("f", computed[key])
+                    future.set_result(found[key])
+            except BaseException as e:
+                for _, future in owned.values():
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop(key, None)
+        for key, future in waiting.items():
+            found[key] = future.result()
+
+        with self._lock:
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(owned)
+            self.stats["coalesced"] += len(waiting)
+        return [list(found[key]) for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # 未キャッシュのテキストだけを（重複を除いて）まとめて埋め込む
+        keys = [self._key(normalize_text(text)) for text in texts]
+        return self._embed_cached(keys, texts, self.base.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(normalize_question(text))
+        return self._embed_cached([key], [text], lambda pending: [self.base.embed_query(pending[0])])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """複数の質問をまとめて埋め込む（未キャッシュの質問だけを質問用の埋め込みで計算し、embed_query()のキャッシュに入れる）"""
+        keys = [self._key(normalize_question(text)) for text in texts]
+        if hasattr(self.base, "embed_queries"):
+            return self._embed_cached(keys, texts, self.base.embed_queries)
+        return self._embed_cached(keys, texts, lambda pending: [self.base.embed_query(text) for text in pending])
+
+    def close(self):
+        """接続を閉じる（次回利用時に自動で開き直す）"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,193 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from config.settings import (
+    EMBED_BATCH_SIZE,
+    EMBED_BATCH_TOKENS,
+    EMBED_MAX_RETRIES,
+    EMBED_MAX_WORKERS,
+)
+from src.utils.metrics import metrics
+from src.utils.tokens import count_tokens
+
+# 429時のバックオフ（秒）
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """レート制限（HTTP 429）によるエラーかどうかを判定（メッセージ中の数字は見ない）"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """レスポンスのRetry-Afterヘッダーから待機秒数を取得"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrency:
+    """同時実行数の制御（429を受けたら半減して待機し、成功が続いたら1ずつ戻す）"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.limit = max_workers
+        self.active = 0
+        self.cooldown_until = 0.0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self.cooldown_until - time.monotonic()
+                if wait <= 0 and self.active < self.limit:
+                    self.active += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, rate_limited: bool = False, backoff: float = 0.0):
+        with self._cond:
+            self.active -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+                self.cooldown_until = max(self.cooldown_until, time.monotonic() + backoff)
+            else:
+                self._successes += 1
+                if self.limit < self.max_workers and self._successes >= self.limit:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class BatchedEmbeddings(Embeddings):
+    """件数とトークン数でバッチ化し、スレッドプールで並列に埋め込む（429時は適応的にバックオフ）"""
+
+    def __init__(
+        self,
+        base: Embeddings,
+        batch_size: int = EMBED_BATCH_SIZE,
+        max_batch_tokens: int = EMBED_BATCH_TOKENS,
+        max_workers: int = EMBED_MAX_WORKERS,
+        max_retries: int = EMBED_MAX_RETRIES,
+        progress_callback: Optional[Callable[[int, int, float], None]] = None,
+    ):
+        self.base = base
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.progress_callback = progress_callback
+        self.limiter = AdaptiveConcurrency(self.max_workers)
+        self._stats_lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        return getattr(self.base, "model", type(self.base).__name__)
+
+    def make_batches(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """テキストを件数上限・トークン上限を超えないバッチ（開始・終了インデックス）に分割"""
+        batches = []
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            text_tokens = count_tokens(text)
+            if i > start and (i - start >= self.batch_size or tokens + text_tokens > self.max_batch_tokens):
+                batches.append((start, i))
+                start = i
+                tokens = 0
+            tokens += text_tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def _call_with_retry(self, func, stats: Optional[dict] = None):
+        """レート制限を考慮したリトライ付き呼び出し（statsを渡すと429を受けた回数を数える）"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                result = func()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    self.limiter.release()
+                    raise
+                backoff = _retry_after(e) or min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+                backoff *= random.uniform(0.8, 1.2)
+                self.limiter.release(rate_limited=True, backoff=backoff)
+                if stats is not None:
+                    with self._stats_lock:
+                        stats["rate_limited"] += 1
+                continue
+            self.limiter.release()
+            return result
+
+    def _report(self, done: int, total: int, elapsed: float):
+        if self.progress_callback:
+            self.progress_callback(done, total, elapsed)
+        else:
+            rate = done / elapsed if elapsed > 0 else 0.0
+            print(f"埋め込み進捗: {done}/{total}件 ({rate:.1f}件/秒, 同時実行数 {self.limiter.limit})")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_with_stats(texts)[0]
+
+    def embed_documents_with_stats(self, texts: List[str]) -> Tuple[List[List[float]], Dict[str, float]]:
+        """embed_documents()と同じく埋め込み、この呼び出しの統計（件数・バッチ数・429の回数・所要時間）も返す
+
+        統計は呼び出しごとに作るため、差分反映と質問の埋め込みが同時に動いても混ざらない。
+        """
+        stats = {"texts": len(texts), "batches": 0, "rate_limited": 0}
+        if not texts:
+            return [], stats
+
+        batches = self.make_batches(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        stats["batches"] = len(batches)
+        started = time.perf_counter()
+        done = 0
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            futures = {
+                executor.submit(
+                    self._call_with_retry, lambda s=s, e=e: self.base.embed_documents(texts[s:e]), stats
+                ): (s, e)
+                for s, e in batches
+            }
+            for future in as_completed(futures):
+                s, e = futures[future]
+                results[s:e] = future.result()
+                done += e - s
+                if len(batches) > 1:
+                    self._report(done, len(texts), time.perf_counter() - started)
+
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = elapsed
+        stats["texts_per_second"] = len(texts) / elapsed if elapsed > 0 else 0.0
+        metrics.observe("embedding_documents", elapsed)
+        metrics.increment("embedded_texts_total", len(texts))
+        return results, stats
+
+    def embed_query(self, text: str) -> List[float]:
+        with metrics.timer("embedding"):
+            return self._call_with_retry(lambda: self.base.embed_query(text))
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """複数の質問を埋め込む（質問と文書で埋め込み方が異なるモデルもあるため、embed_queryを並列に呼ぶ）"""
+        if not texts:
+            return []
+        with metrics.timer("embedding"), ThreadPoolExecutor(max_workers=min(self.max_workers, len(texts))) as executor:
+            return list(executor.map(
+                lambda text: self._call_with_retry(lambda: self.base.embed_query(text)), texts
+            ))
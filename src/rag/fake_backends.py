@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeRateLimitError(Exception):
+    """ローカル疑似バックエンドが返すレート制限エラー（HTTP 429相当）"""
+
+    status_code = 429
+
+
+class LocalFakeEmbeddings(Embeddings):
+    """ネットワーク不要の決定的な疑似埋め込み（文字bi-gramのハッシュで近い文ほど近いベクトルになる）"""
+
+    def __init__(self, size: int = 256, latency: float = 0.0, per_text_latency: float = 0.0,
+                 requests_per_second: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.requests_per_second = requests_per_second
+        self.model = f"local-fake-{size}"
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def _check_rate_limit(self):
+        """1秒あたりのリクエスト数を超えた場合は429相当のエラーを送出"""
+        with self._lock:
+            self.request_count += 1
+            if not self.requests_per_second:
+                return
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            if self._window_count > self.requests_per_second:
+                raise FakeRateLimitError("429 Too Many Requests (local fake backend)")
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        grams = [text[i:i + 2] for i in range(max(len(text) - 1, 1))]
+        for gram in grams:
+            digest = hashlib.md5(gram.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._check_rate_limit()
+        if self.latency or self.per_text_latency:
+            time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class LocalFakeChatModel(BaseChatModel):
+    """ネットワーク不要の決定的な疑似チャットモデル
+
+    最後のユーザー入力をそのまま返す（質問の書き換えでは元の質問になる）。エージェントの
+    プロンプト（Final Answerの指示を含む）には質問を最終回答の形式で返す。streaming=Trueの場合は
+    数文字ずつトークンとして返し、latency（最初のトークンまで）とtoken_latency（1トークンごと）で
+    APIの応答時間を模擬する。
+    """
+
+    streaming: bool = False
+    latency: float = 0.0
+    token_latency: float = 0.0
+    chars_per_token: int = 2
+    call_count: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-fake-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        if "Final Answer" in question:
+            # エージェントのプロンプトは指示と質問（最後の「Question:」行）が1つのメッセージに入っている
+            question = question.rpartition("Question:")[2].split("\n", 1)[0].strip()
+            return f"Final Answer: {question}"
+        return question
+
+    def _should_stream(self, *, async_api: bool, run_manager=None, **kwargs: Any) -> bool:
+        return self.streaming or super()._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        self.call_count += 1
+        reply = self._reply(messages)
+        tokens = max(1, math.ceil(len(reply) / self.chars_per_token))
+        if self.latency or self.token_latency:
+            time.sleep(self.latency + self.token_latency * tokens)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.call_count += 1
+        reply = self._reply(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        for start in range(0, len(reply), self.chars_per_token):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            token = reply[start:start + self.chars_per_token]
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        self.call_count += 1
+        reply = self._reply(messages)
+        tokens = max(1, math.ceil(len(reply) / self.chars_per_token))
+        if self.latency or self.token_latency:
+            await asyncio.sleep(self.latency + self.token_latency * tokens)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.call_count += 1
+        reply = self._reply(messages)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for start in range(0, len(reply), self.chars_per_token):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            token = reply[start:start + self.chars_per_token]
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
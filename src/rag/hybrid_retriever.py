@@ -0,0 +1,101 @@
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from config.settings import HYBRID_FETCH_K, RERANK_FETCH_K, RETRIEVAL_MODE, RRF_K
+from src.rag.keyword_index import KeywordIndex, is_keyword_query
+from src.rag.reranker import Reranker
+from src.rag.response_cache import chunk_key
+from src.utils.metrics import metrics
+from src.utils.rwlock import ReadWriteLock
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], rrf_k: int = RRF_K) -> List[Document]:
+    """複数の検索結果の順位をRRF（1 / (rrf_k + 順位) の合計）で統合する"""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """ベクトル検索とBM25キーワード検索を組み合わせたリトリーバー
+
+    mode="hybrid" では両方の検索結果をRRFで統合する。型番や日付などを含む短い質問で、
+    キーワード検索で一致するチャンクが見つかった場合は埋め込みを計算せずに返す。
+    reranker を渡すと、各方式からrerank_fetch_k件の候補を取り、並べ替えた上位k件を返す。
+    search_kwargs は as_retriever() と同じく k と filter を受け付ける。
+    retrieve_with_embedding() は質問の埋め込みを呼び出し側から受け取る（複数テーマの検索で共有するため）。
+    index_lock を渡すと、ベクターストアとキーワードインデックスの検索をその読み取りロックの中で行う。
+    index_source を渡すと、読み取りロックの中でその時点で公開されている (ベクターストア, キーワードインデックス)
+    を取得して検索する（インデックスの作り直しで閉じたストアを、差し替え前のリトリーバーが使わないため）。
+    """
+
+    vector_store: Any
+    keyword_index: KeywordIndex
+    search_kwargs: dict = {}
+    mode: str = RETRIEVAL_MODE
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = RRF_K
+    reranker: Optional[Reranker] = None
+    rerank_fetch_k: int = RERANK_FETCH_K
+    index_lock: Optional[ReadWriteLock] = None
+    index_source: Optional[Callable[[], Tuple[Any, KeywordIndex]]] = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def k(self) -> int:
+        return self.search_kwargs.get("k", 4)
+
+    def _vector_search(self, vector_store, query: str, k: int, filter, get_embedding=None) -> List[Document]:
+        # 質問の埋め込み（キャッシュにない場合）を含む
+        with metrics.timer("vector_search"):
+            if get_embedding is not None:
+                return vector_store.similarity_search_by_vector(get_embedding(), k=k, filter=filter)
+            return vector_store.similarity_search(query, k=k, filter=filter)
+
+    def _candidates(self, query: str, fetch_k: int, filter, get_embedding=None) -> List[Document]:
+        if self.index_source is not None:
+            vector_store, keyword_index = self.index_source()
+            if vector_store is None:
+                return []
+        else:
+            vector_store, keyword_index = self.vector_store, self.keyword_index
+        if self.mode == "vector":
+            return self._vector_search(vector_store, query, fetch_k, filter, get_embedding)
+
+        with metrics.timer("keyword_search"):
+            keyword_docs = [doc for doc, _ in keyword_index.search(query, k=max(fetch_k, self.fetch_k), filter=filter)]
+        if self.mode == "keyword" or (keyword_docs and is_keyword_query(query)):
+            return keyword_docs[:fetch_k]
+
+        vector_docs = self._vector_search(vector_store, query, max(fetch_k, self.fetch_k), filter, get_embedding)
+        return reciprocal_rank_fusion([vector_docs, keyword_docs], self.rrf_k)[:fetch_k]
+
+    def _retrieve(self, query: str, get_embedding=None) -> List[Document]:
+        filter = self.search_kwargs.get("filter")
+        fetch_k = self.k if self.reranker is None else max(self.k, self.rerank_fetch_k)
+        # インデックスの差分反映中は書き換えが終わるまで待ち、反映途中の状態を検索しない
+        with self.index_lock.read() if self.index_lock is not None else nullcontext():
+            candidates = self._candidates(query, fetch_k, filter, get_embedding)
+        if self.reranker is None:
+            return candidates
+        with metrics.timer("rerank"):
+            return self.reranker.rerank(query, candidates, self.k)
+
+    def retrieve_with_embedding(self, query: str, get_embedding: Callable[[], List[float]]) -> List[Document]:
+        """質問の埋め込みを返す関数を受け取って検索する（get_embeddingはベクトル検索が必要なときだけ呼ぶ）"""
+        return self._retrieve(query, get_embedding)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._retrieve(query)
@@ -0,0 +1,222 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# 英数字の語（型番・日付・数値などは1語として扱う）
+_WORD = re.compile(r"[0-9a-z][0-9a-z\-_./:]*")
+# 日本語の文字列（ひらがな・カタカナ・漢字）
+_JAPANESE = re.compile(r"[ぁ-ゖァ-ヺー々一-鿿]+")
+# キーワード検索だけで足りる質問の手がかり（型番・数値・日付・「」や""で括った語）
+_KEYWORD_HINT = re.compile(r"[0-9a-z]*\d[0-9a-z\-_./:]*|「[^」]+」|\"[^\"]+\"")
+
+
+def tokenize(text: str) -> List[str]:
+    """検索用のトークン列（英数字は語単位、日本語は文字bigram。1文字だけの語はそのまま）"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = _WORD.findall(text)
+    for run in _JAPANESE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def is_keyword_query(text: str, max_chars: int = 30) -> bool:
+    """型番・日付・引用語などを含む短い質問かどうか（埋め込みを使わずキーワード検索だけで答える候補）"""
+    normalized = unicodedata.normalize("NFKC", text).strip().lower()
+    return len(normalized) <= max_chars and bool(_KEYWORD_HINT.search(normalized))
+
+
+def chroma_documents(vector_store) -> Tuple[List[str], List[Document]]:
+    """Chromaの永続コレクションに保存済みのチャンクを (IDの一覧, Documentの一覧) で返す（埋め込みは読まない）"""
+    data = vector_store._collection.get(include=["documents", "metadatas"])
+    docs = [
+        Document(page_content=text or "", metadata=metadata or {})
+        for text, metadata in zip(data["documents"], data["metadatas"])
+    ]
+    return data["ids"], docs
+
+
+class KeywordIndex:
+    """チャンクの転置インデックス（BM25）
+
+    ベクターストアと同じチャンクIDで add() / remove() し、差分更新に追従する。
+    転置リストとチャンク本文はSQLiteに置き、検索時は質問の語の転置リストと上位k件の本文だけを読む。
+    path を指定すると.db配下のファイルに保存され、次回の起動時は作り直さずにそのまま開く
+    （path=None の場合はメモリ内で動作）。version には反映済みのマニフェストの版を記録し、
+    ベクターストアとずれていないかの確認に使う。
+    検索はプロセス内で完結するため、埋め込みAPIを呼ばずに結果を返せる。
+    """
+
+    def __init__(self, path: Optional[Path] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                theme TEXT,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, row)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_row ON postings (row);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        self._db.commit()
+        # BM25の文書数・平均長は件数と長さの合計だけをメモリに持って計算する
+        self._count, self._total_len = self._db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+
+    @classmethod
+    def from_documents(cls, docs: List[Document], ids: List[str], path: Optional[Path] = None) -> "KeywordIndex":
+        index = cls(path)
+        index.rebuild(docs, ids)
+        return index
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def version(self) -> Optional[int]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else None
+
+    def set_version(self, version: int):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(version),))
+            self._db.commit()
+
+    def term_counts(self, field: str = "theme") -> Dict[str, Counter]:
+        """メタデータのfieldの値ごとのトークン出現回数（テーマ振り分けの学習に使う）"""
+        column = "d.theme" if field == "theme" else "json_extract(d.metadata, ?)"
+        params = () if field == "theme" else (f'$."{field}"',)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {column}, p.term, SUM(p.tf) FROM postings p JOIN docs d ON d.row = p.row "
+                f"GROUP BY 1, 2", params
+            ).fetchall()
+        counts: Dict[str, Counter] = {}
+        for value, term, tf in rows:
+            if value is not None:
+                counts.setdefault(value, Counter())[term] = tf
+        return counts
+
+    def _add(self, docs: List[Document], ids: List[str]):
+        self._remove(ids)
+        postings = []
+        for doc, doc_id in zip(docs, ids):
+            terms = Counter(tokenize(doc.page_content))
+            length = sum(terms.values())
+            row = self._db.execute(
+                "INSERT INTO docs (id, theme, length, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, doc.metadata.get("theme"), length, doc.page_content,
+                 json.dumps(doc.metadata, ensure_ascii=False)),
+            ).lastrowid
+            postings.extend((term, row, tf) for term, tf in terms.items())
+            self._count += 1
+            self._total_len += length
+        self._db.executemany("INSERT INTO postings (term, row, tf) VALUES (?, ?, ?)", postings)
+
+    def _remove(self, ids: List[str]):
+        for doc_id in ids:
+            found = self._db.execute("SELECT row, length FROM docs WHERE id = ?", (doc_id,)).fetchone()
+            if found is None:
+                continue
+            row, length = found
+            self._db.execute("DELETE FROM postings WHERE row = ?", (row,))
+            self._db.execute("DELETE FROM docs WHERE row = ?", (row,))
+            self._count -= 1
+            self._total_len -= length
+
+    def add(self, docs: List[Document], ids: List[str]):
+        """チャンクを追加（同じIDがあれば置き換える）"""
+        with self._lock:
+            self._add(docs, ids)
+            self._db.commit()
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            self._remove(ids)
+            self._db.commit()
+
+    def rebuild(self, docs: List[Document], ids: List[str]):
+        """全チャンクを入れ替える（ベクターストアの内容から作り直す場合に使用）"""
+        with self._lock:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM docs")
+            self._db.execute("DELETE FROM meta WHERE key = 'version'")
+            self._count, self._total_len = 0, 0
+            self._add(docs, ids)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        """BM25スコアの高い順に (Document, score) を返す（filterはメタデータの完全一致）"""
+        terms = sorted(set(tokenize(query)))
+        with self._lock:
+            n_docs, total_len = self._count, self._total_len
+            if not terms or not n_docs:
+                return []
+            avg_len = total_len / n_docs
+            placeholders = ",".join("?" * len(terms))
+            # idfは絞り込み前の全チャンクの文書頻度で計算する
+            doc_freq = dict(self._db.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ))
+            conditions, params = [], list(terms)
+            for key, value in (filter or {}).items():
+                if key == "theme":
+                    conditions.append("d.theme = ?")
+                else:
+                    conditions.append("json_extract(d.metadata, ?) = ?")
+                    params.append(f'$."{key}"')
+                params.append(value)
+            where = "".join(f" AND {condition}" for condition in conditions)
+            rows = self._db.execute(
+                f"SELECT p.term, p.row, p.tf, d.length FROM postings p JOIN docs d ON d.row = p.row "
+                f"WHERE p.term IN ({placeholders}){where}", params
+            ).fetchall()
+
+            scores: Dict[int, float] = {}
+            for term, row, tf, length in rows:
+                df = doc_freq[term]
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * length / avg_len)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            if not top:
+                return []
+            found = {
+                row: Document(page_content=text, metadata=json.loads(metadata))
+                for row, text, metadata in self._db.execute(
+                    f"SELECT row, text, metadata FROM docs WHERE row IN ({','.join('?' * len(top))})",
+                    [row for row, _ in top],
+                )
+            }
+            return [(found[row], score) for row, score in top]
@@ -0,0 +1,90 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from src.rag.hybrid_retriever import HybridRetriever
+from src.rag.response_cache import chunk_key
+
+
+class _SharedQueryEmbedding:
+    """質問の埋め込みを最初に必要になったときに1回だけ計算し、各テーマの検索で共有する
+
+    キーワード検索だけで済むテーマしかない場合は埋め込みを計算しない。
+    """
+
+    def __init__(self, embeddings, question: str):
+        self.embeddings = embeddings
+        self.question = question
+        self._vector = None
+        self._lock = threading.Lock()
+
+    def __call__(self) -> List[float]:
+        with self._lock:
+            if self._vector is None:
+                self._vector = self.embeddings.embed_query(self.question)
+            return self._vector
+
+
+class MultiThemeRetriever:
+    """複数テーマのリトリーバーを並列に検索し、結果を重複除去して1つにまとめる
+
+    同じベクターストア上のフィルタ付きリトリーバーであれば質問の埋め込みは1回だけ計算し、
+    各テーマの検索をスレッドプールで同時に実行する。結果は各テーマの順位を交互に並べて統合するため、
+    特定のテーマの結果だけでコンテキストが埋まることはない。
+    """
+
+    def __init__(self, theme_retriever: Dict, max_workers: Optional[int] = None):
+        self.theme_retriever = theme_retriever
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _store_of(retriever):
+        """埋め込みを共有できるリトリーバーのベクターストア（類似度検索のas_retriever()とHybridRetriever）"""
+        if isinstance(retriever, HybridRetriever):
+            return retriever.vector_store
+        if getattr(retriever, "search_type", None) == "similarity":
+            return getattr(retriever, "vectorstore", None)
+        return None
+
+    def _embed_once(self, retrievers, question: str):
+        """全リトリーバーが同じ埋め込みモデルを使う場合、質問の埋め込みを1回だけ計算する関数を返す"""
+        stores = [self._store_of(r) for r in retrievers]
+        if not stores or any(s is None for s in stores):
+            return None
+        embeddings = {id(getattr(s, "embeddings", None)) for s in stores}
+        if len(embeddings) != 1 or stores[0].embeddings is None:
+            return None
+        return _SharedQueryEmbedding(stores[0].embeddings, question)
+
+    @staticmethod
+    def _search(retriever, question: str, get_embedding) -> List[Document]:
+        if get_embedding is None:
+            return retriever.invoke(question)
+        if isinstance(retriever, HybridRetriever):
+            return retriever.retrieve_with_embedding(question, get_embedding)
+        return retriever.vectorstore.similarity_search_by_vector(get_embedding(), **retriever.search_kwargs)
+
+    def retrieve(self, question: str, themes: List[str]) -> List[Document]:
+        """指定テーマを並列に検索し、重複を除いた結果を返す"""
+        retrievers = [self.theme_retriever[t] for t in themes if t in self.theme_retriever]
+        if not retrievers:
+            return []
+
+        get_embedding = self._embed_once(retrievers, question)
+        workers = self.max_workers or len(retrievers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda r: self._search(r, question, get_embedding), retrievers))
+
+        merged, seen = [], set()
+        for rank in zip_longest(*results):
+            for doc in rank:
+                if doc is None:
+                    continue
+                key = chunk_key(doc)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(doc)
+        return merged
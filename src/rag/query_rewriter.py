@@ -0,0 +1,68 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+from config.settings import STANDALONE_MIN_CHARS
+from src.utils.metrics import metrics
+
+# 直前の会話を参照していることを示す表現（指示語・省略・続きや言い換えの依頼など）
+_CONTEXT_DEPENDENT = re.compile(
+    r"それ|これ|あれ|その|この|あの|そこ|ここ|前回|前の|さっき|先ほど|先程|上記|今の|同じ"
+    r"|もう(ちょい|少し|すこし|一度)|詳しく|くわしく|続き|他には|ほかには|他に|ほかに"
+    r"|要約|言い換え|まとめ|短く|簡単に|平易|具体的に|なぜ|どうして|つまり|じゃあ|では"
+    r"|\bit\b|\bthat\b|\bthis\b|\bmore\b"
+)
+
+# 書き換え結果として返した質問を覚えておく件数
+_REMEMBERED = 64
+
+
+def is_standalone_question(text: str) -> bool:
+    """会話履歴がなくても意味が通る質問かどうかを、指示語や省略表現の有無で簡易判定する"""
+    normalized = unicodedata.normalize("NFKC", text).strip().lower()
+    if len(normalized) < STANDALONE_MIN_CHARS:
+        return False
+    return not _CONTEXT_DEPENDENT.search(normalized)
+
+
+class QueryRewriter:
+    """会話履歴を反映した独立質問を生成する（履歴がない・独立した質問の場合はLLMを呼ばない）
+
+    書き換えた質問は直近_REMEMBERED件を覚えておき、同じ質問がもう一度渡された場合（エージェントが
+    書き換え済みの質問をツールに渡した場合など）は書き換え直さない。
+    """
+
+    def __init__(self, llm, prompt):
+        self.chain = prompt | llm | StrOutputParser()
+        self.stats = {"no_history": 0, "standalone": 0, "rewritten": 0, "reused": 0}
+        self._rewritten = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rewrite(self, user_input: str, chat_history) -> str:
+        if not chat_history:
+            self.stats["no_history"] += 1
+            return user_input
+        if is_standalone_question(user_input):
+            self.stats["standalone"] += 1
+            return user_input
+        with self._lock:
+            if user_input.strip() in self._rewritten:
+                self.stats["reused"] += 1
+                return user_input
+        self.stats["rewritten"] += 1
+        with metrics.timer("rewrite"):
+            rewritten = self.chain.invoke({"input": user_input, "chat_history": chat_history})
+        with self._lock:
+            self._rewritten[rewritten.strip()] = None
+            self._rewritten.move_to_end(rewritten.strip())
+            while len(self._rewritten) > _REMEMBERED:
+                self._rewritten.popitem(last=False)
+        return rewritten
+
+    def as_retriever_input(self):
+        """{"input", "chat_history"} を受け取り検索用の質問文を返すRunnable"""
+        return RunnableLambda(lambda x: self.rewrite(x["input"], x.get("chat_history")))
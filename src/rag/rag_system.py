@@ -1,53 +1,157 @@
+import asyncio
+import hashlib
 import os
+import threading
+import time
 import unicodedata
+import uuid
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import cached_property
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
-from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema import HumanMessage, AIMessage
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 
 from config.settings import *
 from src.utils.file_manager import FileManager
+from src.utils.manifest import ProcessedManifest
+from src.utils.file_watcher import MeetingNotesWatcher
+from src.rag.backends import create_chat_model, create_embeddings
+from src.rag.response_cache import ResponseCache, normalize_question
+from src.rag.query_rewriter import QueryRewriter
+from src.rag.chat_history import ChatHistoryManager
+from src.rag.keyword_index import KeywordIndex, chroma_documents
+from src.rag.hybrid_retriever import HybridRetriever
+from src.rag.compact_store import CompactVectorStore
+from src.rag.text_chunker import CHUNKER_VERSION, StructuredTextSplitter
+from src.rag.context_packer import ContextPacker
+from src.rag.reranker import create_reranker
+from src.utils.metrics import metrics
+from src.utils.rwlock import ReadWriteLock
+
+# 全テーマ共通の永続コレクション名（テーマはメタデータで区別）
+COLLECTION_NAME = "meeting_notes"
+
+# .db配下に保存するキーワードインデックス（BM25の転置リスト）のファイル名
+KEYWORD_INDEX_FILE = "keyword_index.sqlite3"
+
+# 永続コレクションへの1回あたりの書き込み件数
+ADD_BATCH_SIZE = 500
+
+# 一括作成で一度に分割・埋め込むチャンク数（埋め込みパイプラインの並列度を活かせる大きさで、全チャンクは持たない）
+BUILD_BATCH_SIZE = 2048
+
+# chromaコレクションのHNSWパラメータ（コレクション作成時のみ反映）
+HNSW_METADATA = {
+    "hnsw:M": CHROMA_HNSW_M,
+    "hnsw:construction_ef": CHROMA_HNSW_CONSTRUCTION_EF,
+    "hnsw:search_ef": CHROMA_HNSW_SEARCH_EF,
+}
+
+
+@dataclass(frozen=True)
+class RAGPipeline:
+    """あるインデックス版に対するRAGチェーンの各段階（質問の書き換え・検索・回答生成）"""
+    retriever: object
+    question_rewriter: object
+    answer_chain: object
+    index_version: int
 
 
 class RAGSystem:
     def __init__(self, meeting_notes_dir: Path):
         self.meeting_notes_dir = Path(meeting_notes_dir)
-        self.file_manager = FileManager(meeting_notes_dir)
+        self.index_dir = self.meeting_notes_dir / ".db"
+        self.manifest = ProcessedManifest(self.index_dir)
+        self.file_manager = FileManager(meeting_notes_dir, manifest=self.manifest)
+        self.persist_index = PERSIST_INDEX
         
         # LangChainコンポーネントを初期化
-        self.text_splitter = CharacterTextSplitter(
+        # 見出し・段落・文境界を考慮し、トークン数で分割する
+        self.text_splitter = StructuredTextSplitter(
             chunk_size=CHUNK_SIZE, 
             chunk_overlap=CHUNK_OVERLAP
         )
-        self.embeddings = OpenAIEmbeddings()
-        self.llm = ChatOpenAI(
-            model_name="gpt-4o",
-            temperature=0.0,
-            streaming=True,
-            callbacks=[StreamingStdOutCallbackHandler()]
-        )
+        # 検索結果の重複除去・連続チャンクの結合・トークン予算内への詰め込み
+        self.context_packer = ContextPacker()
+        # 多めに取った検索候補を並べ替えて上位SEARCH_K件に絞る（noneの場合は一次検索の上位のみ）
+        self.reranker = create_reranker()
+        metrics.register_stats("context_packer", self.context_packer.stats)
+        if self.reranker is not None:
+            metrics.register_stats("reranker", self.reranker.stats)
+        # 埋め込み・チャットモデル・回答キャッシュは初めて使うときに作る（openai等のインポートを起動時に行わない）
         
+        # インデックス関連の属性はプロセス内の全セッションで共有し、_publish()でまとめて差し替える
+        self.vector_store = None
+        self.keyword_index = KeywordIndex()
+        self.watcher = None
+        self.initialized = False
+        self._retired_store = None
+        self._index_lock = threading.RLock()
+        # 永続モードの差分反映・作り直しでベクターストアとキーワードインデックスを書き換える間は検索を待たせる
+        self._index_rw = ReadWriteLock()
         self.theme_retriever = {}
         self.all_retriever = None
         self.rag_chain = None
-        self.chat_history = []
+        self.chat_history = self.create_chat_history()
+    
+    @cached_property
+    def embeddings(self):
+        embeddings = create_embeddings()
+        if hasattr(embeddings, "stats"):
+            metrics.register_stats("embedding_cache", embeddings.stats)
+        return embeddings
+    
+    @cached_property
+    def llm(self):
+        # トークンはstream_query()で呼び出し元に逐次返す
+        return create_chat_model("gpt-4o", streaming=True)
+    
+    @cached_property
+    def rewrite_llm(self):
+        # 質問の書き換えは軽量モデルで行う
+        return create_chat_model(REWRITE_MODEL)
+    
+    @cached_property
+    def response_cache(self) -> Optional[ResponseCache]:
+        if not RESPONSE_CACHE_ENABLED:
+            return None
+        response_cache = ResponseCache(self.index_dir / "response_cache.sqlite3", self.embeddings)
+        metrics.register_stats("response_cache", response_cache.stats)
+        return response_cache
+    
+    def create_chat_history(self) -> ChatHistoryManager:
+        """トークン予算付きの会話履歴を作成（古いターンは軽量モデルで要約に畳み込む。モデルは初めて要約するときに作る）"""
+        return ChatHistoryManager(lambda: self.rewrite_llm)
     
     def reset_data(self):
         """データベース化済みフォルダと.dbフォルダを初期化"""
+        # 回答キャッシュは作成済みの場合のみ閉じる
+        response_cache = self.__dict__.get("response_cache")
+        if response_cache:
+            response_cache.close()
+        if self.persist_index and isinstance(self.vector_store, CompactVectorStore):
+            # 削除前に行列ファイルとSQLiteを閉じる
+            self.vector_store.close()
+        if self.persist_index and self.keyword_index.path:
+            self.keyword_index.close()
+        if self.persist_index:
+            # 削除前に開いている永続クライアントのキャッシュを破棄
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
         self.file_manager.clear_complete_dir(self.meeting_notes_dir)
     
     def load_and_process_files(self) -> Dict[str, List]:
         """ファイルを読み込み、処理する"""
         theme_docs = {}
-        self.file_manager.recursive_file_check(self.meeting_notes_dir, theme_docs)
+        with metrics.timer("ingest"):
+            self.file_manager.recursive_file_check(self.meeting_notes_dir, theme_docs)
+        self.manifest.commit()
         return theme_docs
     
     def get_theme_list(self) -> List[str]:
@@ -62,52 +166,332 @@ class RAGSystem:
         return theme_list
     
     def create_vector_stores(self, theme_docs: Dict[str, List]):
-        """ベクターストアを作成または更新"""
-        theme_list = self.get_theme_list()
-        all_combined_docs = []
-        
-        # 各テーマごとのベクターストアを作成（メモリ内で動作）
-        for theme_name in theme_list:
-            if theme_name in theme_docs:
-                splitted_docs = self.text_splitter.split_documents(theme_docs[theme_name])
-                
-                # メモリ内ベクターストアを使用（永続化を避ける）
-                try:
-                    db = Chroma.from_documents(
-                        splitted_docs,
-                        self.embeddings,
-                        # persist_directory を指定せずメモリ内で動作
+        """ベクターストアを作成または更新（全チャンクを1回だけ埋め込み、テーマ別はメタデータで絞り込む）"""
+        with metrics.timer("index_build"):
+            return self._create_vector_stores(theme_docs)
+    
+    def _create_vector_stores(self, theme_docs: Dict[str, List]):
+        # チャンクは分割しながらBUILD_BATCH_SIZE件ずつ埋め込んで追加し、全チャンクのリストは作らない
+        chunk_ids_by_key = {}
+        chunks = self._iter_chunks(theme_docs, chunk_ids_by_key)
+        vector_store = None
+        keyword_index = KeywordIndex()
+        themes = set()
+        try:
+            for batch in iter(lambda: list(islice(chunks, BUILD_BATCH_SIZE)), []):
+                ids = [doc.metadata["chunk_id"] for doc in batch]
+                if vector_store is None:
+                    # 実行中のクエリに影響しないよう新しいコレクションに構築（persist_directory を指定せずメモリ内で動作）
+                    if VECTOR_STORE_BACKEND == "compact":
+                        vector_store = CompactVectorStore(None, self.embeddings)
+                    else:
+                        vector_store = Chroma(
+                            collection_name=f"{COLLECTION_NAME}_{uuid.uuid4().hex[:8]}",
+                            embedding_function=self.embeddings,
+                            collection_metadata=HNSW_METADATA,
+                        )
+                vector_store.add_documents(batch, ids=ids)
+                keyword_index.add(batch, ids)
+                themes.update(doc.metadata["theme"] for doc in batch)
+                metrics.increment("indexed_chunks_total", len(batch))
+        except Exception as e:
+            print(f"❌ ベクターストア作成でエラー: {e}")
+            return self.theme_retriever
+        
+        if vector_store is None:
+            with self._index_rw.write():
+                self._publish(None, set())
+            return self.theme_retriever
+        print("✅ 全テーマ共通ベクターストア作成完了")
+        
+        for key, chunk_ids in chunk_ids_by_key.items():
+            self.manifest.set_chunk_ids(key, chunk_ids)
+        self.manifest.bump_version()
+        self.manifest.set_meta("chunker", CHUNKER_VERSION)
+        self.manifest.commit()
+        keyword_index.set_version(self.manifest.version)
+        
+        with self._index_rw.write():
+            self._publish(vector_store, themes, keyword_index)
+        return self.theme_retriever
+    
+    def _iter_chunks(self, theme_docs: Dict[str, List], chunk_ids_by_key: Dict[str, List[str]]) -> Iterator:
+        """テーマごとのDocumentを1チャンクずつ分割し、テーマとマニフェストの内容ハッシュから決定的なチャンクIDを付けて返す
+        
+        ファイルごとに割り当てたチャンクIDはchunk_ids_by_keyに追記する。
+        """
+        prefixes = {}
+        for theme_name in self.get_theme_list():
+            for doc in self.text_splitter.iter_documents(theme_docs.get(theme_name, [])):
+                key = self.file_manager.relative_key(Path(doc.metadata["source"]))
+                if key not in prefixes:
+                    entry = self.manifest.get(key)
+                    prefixes[key] = self._chunk_id_prefix(key, entry["hash"] if entry else "")
+                chunk_ids = chunk_ids_by_key.setdefault(key, [])
+                chunk_id = f"{prefixes[key]}-{len(chunk_ids)}"
+                chunk_ids.append(chunk_id)
+                doc.metadata["theme"] = theme_name
+                doc.metadata["chunk_id"] = chunk_id
+                yield doc
+    
+    def _make_retriever(self, vector_store, keyword_index: KeywordIndex, search_kwargs: dict):
+        """設定された検索方式（RETRIEVAL_MODE）のリトリーバーを作成
+        
+        差分反映・作り直しの書き換え中は検索を待ち、検索時点で公開されているストアを使う。
+        """
+        return HybridRetriever(
+            vector_store=vector_store,
+            keyword_index=keyword_index,
+            search_kwargs=search_kwargs,
+            reranker=self.reranker,
+            index_lock=self._index_rw,
+            index_source=self._published_index,
+        )
+    
+    def _published_index(self):
+        """公開中のベクターストアとキーワードインデックス（_index_rwの読み取りロックの中で呼ぶ）"""
+        return self.vector_store, self.keyword_index
+    
+    def _publish(self, vector_store, themes, keyword_index: Optional[KeywordIndex] = None):
+        """共通ベクターストアからテーマ別（メタデータフィルタ）と全テーマ横断のリトリーバーを作成して差し替える
+        
+        _index_rwの書き込みロックの中で呼び出す。リトリーバーは検索のたびに読み取りロックの中で
+        公開中のストアを参照するため、差し替え前のチェーンを取得済みのクエリも差し替え後のストアを検索する。
+        永続モードの差分反映・作り直しは同じ.dbを書き換えるため、書き換えから差し替えまでを書き込みロックの
+        中で行い、その間の検索は反映前か反映後のどちらかの状態だけを見る（閉じたストアは検索しない）。
+        """
+        if keyword_index is None:
+            keyword_index = self.keyword_index
+        theme_retriever = {}
+        all_retriever = None
+        if vector_store is not None and themes:
+            for theme_name in self.get_theme_list():
+                if theme_name in themes:
+                    theme_retriever[theme_name] = self._make_retriever(
+                        vector_store, keyword_index, {"filter": {"theme": theme_name}}
                     )
-                    print(f"✅ {theme_name}テーマのベクターストア作成完了")
-                except Exception as e:
-                    print(f"❌ {theme_name}テーマでエラー: {e}")
-                    continue
-                
-                self.theme_retriever[theme_name] = db.as_retriever()
-                all_combined_docs.extend(splitted_docs)
-        
-        # 全テーマ横断のベクターストアを処理（メモリ内）
-        if all_combined_docs:
+                    print(f"✅ {theme_name}テーマのリトリーバー作成完了")
+            all_retriever = self._make_retriever(vector_store, keyword_index, {"k": SEARCH_K})
+        
+        rag_chain = self.rag_chain
+        if rag_chain is not None:
+            rag_chain = self._build_rag_chain(all_retriever) if all_retriever else None
+        
+        # インデックスが更新された場合は古い版に対する回答キャッシュを破棄
+        if self.response_cache:
+            self.response_cache.invalidate_before(self.manifest.version)
+        
+        previous_store = self.vector_store
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+        self.theme_retriever = theme_retriever
+        self.all_retriever = all_retriever
+        self.rag_chain = rag_chain
+        
+        if not self.persist_index and previous_store is not None and previous_store is not vector_store:
+            self._retire_store(previous_store)
+    
+    def _retire_store(self, store):
+        """差し替え前のメモリ内ストアは実行中のクエリのため1世代だけ残し、それより古いものを削除"""
+        if self._retired_store is not None:
             try:
-                all_db = Chroma.from_documents(
-                    all_combined_docs,
-                    self.embeddings
-                    # persist_directory を指定せずメモリ内で動作
-                )
-                print("✅ 全テーマ横断ベクターストア作成完了")
+                self._retired_store.delete_collection()
             except Exception as e:
-                print(f"❌ 全テーマ横断ベクターストアでエラー: {e}")
-                # 空のリトリーバーを作成
-                self.all_retriever = None
-                return self.theme_retriever
+                print(f"古いベクターストアの削除でエラー: {e}")
+        self._retired_store = store
+    
+    def _open_store(self):
+        """.db配下の永続コレクションを開く"""
+        if VECTOR_STORE_BACKEND == "compact":
+            return CompactVectorStore(self.index_dir / "compact", self.embeddings)
+        return Chroma(
+            collection_name=COLLECTION_NAME,
+            embedding_function=self.embeddings,
+            persist_directory=str(self.index_dir),
+            collection_metadata=HNSW_METADATA,
+        )
+    
+    def _chunk_id_prefix(self, key: str, content_hash: str) -> str:
+        """ファイルパスと内容ハッシュから決定的なチャンクIDの接頭辞を生成（IDは「接頭辞-ファイル内の通し番号」）"""
+        return hashlib.sha1(f"{key}:{content_hash}:{CHUNKER_VERSION}".encode("utf-8")).hexdigest()[:16]
+    
+    def _chunk_ids(self, key: str, content_hash: str, count: int) -> List[str]:
+        """ファイルパスと内容ハッシュから決定的なチャンクIDを生成"""
+        prefix = self._chunk_id_prefix(key, content_hash)
+        return [f"{prefix}-{i}" for i in range(count)]
+    
+    def _add_chunks(self, docs: List, ids: List[str], vectors: List[List[float]]):
+        """埋め込み済みのチャンクを永続コレクションとキーワードインデックスに追加"""
+        texts = [doc.page_content for doc in docs]
+        if isinstance(self.vector_store, CompactVectorStore):
+            self.vector_store.add_embeddings(ids, vectors, texts, [doc.metadata for doc in docs])
+            self.keyword_index.add(docs, ids)
+            return
+        for start in range(0, len(docs), ADD_BATCH_SIZE):
+            end = start + ADD_BATCH_SIZE
+            self.vector_store._collection.upsert(
+                ids=ids[start:end],
+                embeddings=vectors[start:end],
+                documents=texts[start:end],
+                metadatas=[doc.metadata for doc in docs[start:end]],
+            )
+        self.keyword_index.add(docs, ids)
+    
+    def _store_count(self) -> int:
+        """ベクターストアに登録されているチャンク数"""
+        if isinstance(self.vector_store, CompactVectorStore):
+            return self.vector_store.count()
+        return self.vector_store._collection.count()
+    
+    @property
+    def index_version(self) -> int:
+        """インデックスの内容が変わるたびに増えるバージョン番号"""
+        return self.manifest.version
+    
+    def sync_index(self) -> Dict[str, int]:
+        """インデックスに追加・変更・削除されたファイルの差分のみ反映する（同時に1つだけ実行）
+
+        ファイルの読み込みと埋め込みは検索を止めずに行い、ストアの書き換えと差し替えの間だけ検索を待たせる。
+        """
+        with self._index_lock, metrics.timer("index_sync"):
+            return self._sync_index()
+    
+    def _sync_index(self, locked: bool = False) -> Dict[str, int]:
+        # locked=Trueの場合は呼び出し側が_index_rwの書き込みロックを持っている（作り直し）
+        write_lock = nullcontext if locked else self._index_rw.write
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self.manifest
+        if self.vector_store is None:
+            # 永続インデックスを読み込む（メモリ内モードで作成済みの場合はそのストアを差分更新）
+            self.vector_store = self._open_store()
+            self.keyword_index = KeywordIndex(self.index_dir / KEYWORD_INDEX_FILE)
+        
+        if manifest.keys() and self._store_count() == 0:
+            # マニフェストだけが残っている場合は全ファイルを埋め込み直す
+            print("ベクターストアが空のため、全ファイルを再インデックスします。")
+            manifest.clear()
+        
+        store_count = self._store_count()
+        if len(self.keyword_index) != store_count or (store_count and self.keyword_index.version != manifest.version):
+            # 保存済みのキーワードインデックスがない・ベクターストアとずれている場合だけチャンクから作り直す
+            if isinstance(self.vector_store, CompactVectorStore):
+                ids, docs = self.vector_store.get_documents()
+            else:
+                ids, docs = chroma_documents(self.vector_store)
+            with write_lock():
+                self.keyword_index.rebuild(docs, ids)
+            print(f"キーワードインデックスを作成しました（{len(self.keyword_index)}チャンク）")
+        
+        # チャンク分割方式が変わった場合は内容が同じファイルも分割し直す
+        rechunk = bool(manifest.keys()) and manifest.get_meta("chunker") != CHUNKER_VERSION
+        if rechunk:
+            print("チャンク分割方式が変わったため、全ファイルを再分割します。")
+        
+        stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        seen_keys = set()
+        candidates = []
+        pending = []
+        
+        for file_path in self.file_manager.iter_source_files(self.meeting_notes_dir):
+            theme_name = self.file_manager._extract_theme_name(file_path)
+            if not theme_name:
+                continue
             
-            self.all_retriever = all_db.as_retriever(search_kwargs={"k": SEARCH_K})
+            key = self.file_manager.relative_key(file_path)
+            seen_keys.add(key)
+            stat = file_path.stat()
+            if not rechunk and manifest.is_unchanged(key, stat.st_size, stat.st_mtime):
+                stats["unchanged"] += 1
+                continue
+            
+            content_hash = self.file_manager.compute_file_hash(file_path)
+            entry = manifest.get(key)
+            if not rechunk and entry and entry["hash"] == content_hash and entry["theme"] == theme_name:
+                # 内容が同じ（タイムスタンプのみ更新）なら再埋め込みしない
+                manifest.record(key, stat.st_size, stat.st_mtime, content_hash, theme_name, entry["chunk_ids"])
+                stats["unchanged"] += 1
+                continue
+            
+            candidates.append((file_path, key, stat, content_hash, theme_name, entry))
+        
+        # 追加・変更されたファイルをプロセスプールで並列に読み込む
+        loaded = self.file_manager.load_files([
+            (file_path, theme_name) for file_path, _, _, _, theme_name, _ in candidates
+        ])
+        for (file_path, key, stat, content_hash, theme_name, entry), docs in zip(candidates, loaded):
+            if docs is None:
+                continue
+            splitted_docs = self.text_splitter.split_documents(docs)
+            chunk_ids = self._chunk_ids(key, content_hash, len(splitted_docs))
+            for doc, chunk_id in zip(splitted_docs, chunk_ids):
+                doc.metadata["chunk_id"] = chunk_id
+            pending.append((file_path, key, stat, content_hash, theme_name, entry, splitted_docs, chunk_ids))
+        
+        # 追加・変更されたファイルのチャンクを一括で埋め込む（バッチ化・並列化はパイプライン側で実施）
+        all_docs = [doc for item in pending for doc in item[6]]
+        all_ids = [chunk_id for item in pending for chunk_id in item[7]]
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in all_docs]) if all_docs else []
+        
+        # ここからリトリーバーの差し替えまでは検索を待たせ、反映途中の状態（同じファイルの新旧のチャンクが
+        # 混在する・ベクターストアとキーワードインデックスがずれている等）を検索に見せない
+        with write_lock():
+            if all_docs:
+                metrics.increment("indexed_chunks_total", len(all_docs))
+                self._add_chunks(all_docs, all_ids, vectors)
+            
+            for file_path, key, stat, content_hash, theme_name, entry, splitted_docs, chunk_ids in pending:
+                if entry:
+                    self._delete_chunks(entry, keep=set(chunk_ids))
+                manifest.record(key, stat.st_size, stat.st_mtime, content_hash, theme_name, chunk_ids)
+                stats["changed" if entry else "added"] += 1
+                print(f"ファイルをインデックスに反映しました: {file_path}")
+            
+            # 削除されたファイルのベクトルを除去
+            for key in manifest.keys():
+                if key not in seen_keys:
+                    entry = manifest.remove(key)
+                    self._delete_chunks(entry)
+                    stats["removed"] += 1
+                    print(f"削除されたファイルをインデックスから除去しました: {key}")
+            
+            if stats["added"] or stats["changed"] or stats["removed"]:
+                manifest.bump_version()
+            manifest.set_meta("chunker", CHUNKER_VERSION)
+            manifest.commit()
+            self.keyword_index.set_version(manifest.version)
+            
+            # チャンクを持つテーマのみリトリーバーを作成
+            self._publish(self.vector_store, set(manifest.indexed_themes()))
+        
+        print(f"インデックス差分: 追加{stats['added']}件 / 変更{stats['changed']}件 / "
+              f"削除{stats['removed']}件 / 変更なし{stats['unchanged']}件")
+        return stats
+    
+    def _delete_chunks(self, entry: dict, keep=frozenset()):
+        """マニフェストに記録されたチャンクIDのベクトルを削除（keepに含まれるIDは残す）"""
+        chunk_ids = [chunk_id for chunk_id in entry.get("chunk_ids") or [] if chunk_id not in keep]
+        if chunk_ids:
+            self.vector_store.delete(ids=chunk_ids)
+            self.keyword_index.remove(chunk_ids)
+    
+    def start_watcher(self):
+        """議事録フォルダの監視を開始し、変更があれば差分のみインデックスに反映する"""
+        if self.watcher is None:
+            self.watcher = MeetingNotesWatcher(self.file_manager, on_change=lambda changes: self.sync_index())
+        self.watcher.start()
+    
+    def stop_watcher(self):
+        if self.watcher is not None:
+            self.watcher.stop()
     
     def setup_rag_chain(self):
         """RAGチェーンを設定"""
         if not self.all_retriever:
             raise ValueError("全テーマ横断のretrieverが設定されていません")
-        
+        self.rag_chain = self._build_rag_chain(self.all_retriever)
+    
+    def _build_rag_chain(self, all_retriever) -> RAGPipeline:
+        """全テーマ横断のretrieverからRAGチェーン（質問の書き換え・検索・回答生成）を組み立てる"""
         # 履歴を考慮したクエリ生成
         question_generator = "会話履歴と最新の入力をもとに、会話履歴なしでも理解できる独立した入力テキストを生成してください。"
         question_generator_prompt = ChatPromptTemplate.from_messages([
@@ -115,12 +499,7 @@ class RAGSystem:
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ])
-        
-        all_history_retriever = create_history_aware_retriever(
-            llm=self.llm,
-            retriever=self.all_retriever,
-            prompt=question_generator_prompt
-        )
+        question_rewriter = QueryRewriter(self.rewrite_llm, question_generator_prompt)
         
         # 質問応答のプロンプト
         question_answer_template = """
@@ -145,46 +524,222 @@ class RAGSystem:
             prompt=question_answer_prompt
         )
         
-        self.rag_chain = create_retrieval_chain(
-            all_history_retriever,
-            question_answer_chain
+        return RAGPipeline(
+            retriever=all_retriever,
+            question_rewriter=question_rewriter,
+            answer_chain=question_answer_chain,
+            index_version=self.manifest.version,
         )
     
-    def query(self, user_input: str) -> str:
-        """ユーザークエリに対して回答を生成"""
-        if not self.rag_chain:
+    def _retrieve(self, rag_chain: RAGPipeline, user_input: str, chat_history: list):
+        """会話履歴を反映した独立質問を作り（不要な場合はLLMを呼ばない）、関連チャンクを検索して整理する"""
+        question = rag_chain.question_rewriter.rewrite(user_input, chat_history)
+        with metrics.timer("retrieve"):
+            return question, self.context_packer.pack(rag_chain.retriever.invoke(question))
+    
+    def _get_rag_chain(self) -> RAGPipeline:
+        rag_chain = self.rag_chain
+        if not rag_chain:
             raise ValueError("RAGチェーンが設定されていません")
+        return rag_chain
+    
+    def query(self, user_input: str, chat_history: Optional[list] = None) -> str:
+        """ユーザークエリに対して回答を生成（chat_historyを渡すとその履歴を使用・更新する）"""
+        rag_chain = self._get_rag_chain()
+        if chat_history is None:
+            chat_history = self.chat_history
+        
+        # 要約と直近のターンだけをプロンプトに渡す
+        history_messages = list(chat_history)
+        question, docs = self._retrieve(rag_chain, user_input, history_messages)
         
-        response = self.rag_chain.invoke({
-            "input": user_input,
-            "chat_history": self.chat_history
-        })
+        # 同じ質問・同じ検索結果・同じインデックス版の回答があればLLMを呼ばずに返す
+        answer = None
+        if self.response_cache:
+            answer = self.response_cache.get(question, docs, rag_chain.index_version, history_messages)
+        if answer is None:
+            with metrics.timer("generation"):
+                answer = rag_chain.answer_chain.invoke({
+                    "input": user_input,
+                    "chat_history": history_messages,
+                    "context": docs
+                })
+            if self.response_cache:
+                self.response_cache.put(question, docs, rag_chain.index_version, answer, history_messages)
         
         # 会話履歴を更新
-        self.chat_history.extend([
+        chat_history.extend([
             HumanMessage(content=user_input),
-            AIMessage(content=response["answer"])
+            AIMessage(content=answer)
         ])
         
-        return response["answer"]
+        return answer
     
-    def initialize(self):
-        """RAGシステムを初期化"""
-        print("RAGシステムを初期化しています...")
+    def stream_query(self, user_input: str, chat_history: Optional[list] = None) -> Iterator[dict]:
+        """ユーザークエリに対する回答をストリーミングで生成
+        
+        検索結果は {"context": [Document, ...]}、回答のトークンは {"answer": "..."} として順に返す。
+        """
+        rag_chain = self._get_rag_chain()
+        if chat_history is None:
+            chat_history = self.chat_history
+        
+        # 要約と直近のターンだけをプロンプトに渡す
+        history_messages = list(chat_history)
+        question, docs = self._retrieve(rag_chain, user_input, history_messages)
+        yield {"context": docs}
         
-        # リセット処理
-        self.reset_data()
+        answer = None
+        if self.response_cache:
+            answer = self.response_cache.get(question, docs, rag_chain.index_version, history_messages)
+        if answer is not None:
+            yield {"answer": answer}
+        else:
+            answer = ""
+            started = time.perf_counter()
+            first_token_at = None
+            for token in rag_chain.answer_chain.stream({
+                "input": user_input,
+                "chat_history": history_messages,
+                "context": docs
+            }):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    metrics.observe("first_token", first_token_at - started)
+                answer += token
+                yield {"answer": token}
+            metrics.observe("generation", time.perf_counter() - started)
+            if self.response_cache:
+                self.response_cache.put(question, docs, rag_chain.index_version, answer, history_messages)
         
-        # ファイルの読み込みと処理
-        theme_docs = self.load_and_process_files()
-        print(f"読み込んだテーマ: {list(theme_docs.keys())}")
+        # 会話履歴を更新
+        chat_history.extend([
+            HumanMessage(content=user_input),
+            AIMessage(content=answer)
+        ])
+    
+    async def aquery(self, user_input: str, chat_history: Optional[list] = None) -> str:
+        """query()の非同期版（chat_historyを省略すると共有の履歴ではなく、この質問だけの履歴を使う）"""
+        rag_chain = self._get_rag_chain()
+        if chat_history is None:
+            chat_history = []
+        
+        history_messages = list(chat_history)
+        # 質問の書き換え・検索・回答キャッシュは同期処理のため、イベントループを止めないようスレッドで実行
+        question, docs = await asyncio.to_thread(self._retrieve, rag_chain, user_input, history_messages)
+        
+        answer = None
+        if self.response_cache:
+            answer = await asyncio.to_thread(self.response_cache.get, question, docs, rag_chain.index_version,
+                                             history_messages)
+        if answer is None:
+            with metrics.timer("generation"):
+                answer = await rag_chain.answer_chain.ainvoke({
+                    "input": user_input,
+                    "chat_history": history_messages,
+                    "context": docs
+                })
+            if self.response_cache:
+                await asyncio.to_thread(self.response_cache.put, question, docs, rag_chain.index_version, answer,
+                                        history_messages)
+        
+        chat_history.extend([
+            HumanMessage(content=user_input),
+            AIMessage(content=answer)
+        ])
+        return answer
+    
+    async def abatch(self, questions: List[str], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                     return_exceptions: bool = False) -> AsyncIterator[Tuple[int, object]]:
+        """複数の質問にそれぞれ独立した履歴で並行して回答し、終わった順に (質問の位置, 回答) を返す
+        
+        同時に処理するのはmax_concurrency問まで。表記ゆれだけが異なる同じ質問は1回だけ検索・生成し、
+        質問の埋め込みは最初にまとめて計算する。return_exceptions=Trueの場合、失敗した質問は
+        回答の代わりに例外を返し、残りの質問の処理を続ける。
+        """
+        positions: Dict[str, List[int]] = {}
+        unique = {}
+        for i, question in enumerate(questions):
+            key = normalize_question(question)
+            positions.setdefault(key, []).append(i)
+            unique.setdefault(key, question)
+        
+        # 検索で使う質問の埋め込みを1回のバッチで計算し、キャッシュに入れておく
+        if hasattr(self.embeddings, "embed_queries") and RETRIEVAL_MODE != "keyword":
+            await asyncio.to_thread(self.embeddings.embed_queries, list(unique.values()))
         
-        # ベクターストアの作成
-        self.create_vector_stores(theme_docs)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def _answer(key: str, question: str):
+            async with semaphore:
+                try:
+                    return key, await self.aquery(question, [])
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    return key, e
+        
+        tasks = [asyncio.ensure_future(_answer(key, question)) for key, question in unique.items()]
+        try:
+            for future in asyncio.as_completed(tasks):
+                key, answer = await future
+                for i in positions[key]:
+                    yield i, answer
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def batch(self, questions: List[str], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+              return_exceptions: bool = False) -> list:
+        """abatch()を同期的に実行し、質問と同じ順の回答のリストを返す（スクリプトからの一括回答用）"""
+        async def _collect():
+            answers = [None] * len(questions)
+            async for i, answer in self.abatch(questions, max_concurrency, return_exceptions):
+                answers[i] = answer
+            return answers
+        return asyncio.run(_collect())
+    
+    def ensure_initialized(self):
+        """未初期化の場合のみ初期化する（複数セッションから同時に呼ばれても1回だけ実行）"""
+        with self._index_lock:
+            if not self.initialized:
+                self.initialize()
+        return self.theme_retriever
+    
+    def initialize(self, rebuild: bool = False):
+        """RAGシステムを初期化（rebuild=Trueの場合は永続インデックスも作り直す）"""
+        with self._index_lock:
+            return self._initialize(rebuild)
+    
+    def _initialize(self, rebuild: bool):
+        print("RAGシステムを初期化しています...")
+        
+        if self.persist_index:
+            if rebuild:
+                # 開いているストアを閉じて削除するため、作り直して差し替えるまで検索を待たせる
+                with self._index_rw.write(), metrics.timer("index_sync"):
+                    self.reset_data()
+                    self.vector_store = None
+                    self.keyword_index = KeywordIndex()
+                    self._sync_index(locked=True)
+            else:
+                # 永続インデックスを読み込み、差分のみ埋め込み
+                self.sync_index()
+        else:
+            # リセット処理
+            self.reset_data()
+            
+            # ファイルの読み込みと処理
+            theme_docs = self.load_and_process_files()
+            print(f"読み込んだテーマ: {list(theme_docs.keys())}")
+            
+            # ベクターストアの作成
+            self.create_vector_stores(theme_docs)
         print(f"作成したリトリーバー: {list(self.theme_retriever.keys())}")
         
         # RAGチェーンの設定
         self.setup_rag_chain()
+        self.initialized = True
         print("RAGシステムの初期化が完了しました。")
         
         return self.theme_retriever
@@ -0,0 +1,121 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config.settings import RERANK_MAX_MS, RERANK_PRIOR_WEIGHT, RERANKER, RERANKER_MODEL
+from src.rag.keyword_index import tokenize
+
+
+class Reranker(ABC):
+    """一次検索で多めに取った候補を並べ替え、上位k件を返す
+
+    候補は一次検索の順にbatch_size件ずつ採点し、max_msを超えたら残りの候補は採点せずに打ち切る
+    （一次検索で下位の候補ほど落ちるだけで、応答時間の上限は守られる）。
+    処理時間はstatsに記録する。
+    """
+
+    batch_size = 32
+
+    def __init__(self, max_ms: float = RERANK_MAX_MS):
+        self.max_ms = max_ms
+        self.stats = {"calls": 0, "candidates": 0, "total_ms": 0.0, "max_ms": 0.0, "truncated": 0}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _score(self, query: str, docs: List[Document], offset: int) -> np.ndarray:
+        """候補の採点（offsetはdocsの先頭の一次検索での順位）"""
+
+    def rerank(self, query: str, docs: List[Document], k: int) -> List[Document]:
+        if len(docs) <= 1:
+            return docs[:k]
+        started = time.perf_counter()
+        scores = []
+        truncated = False
+        for start in range(0, len(docs), self.batch_size):
+            if scores and (time.perf_counter() - started) * 1000 > self.max_ms:
+                truncated = True
+                break
+            scores.append(self._score(query, docs[start:start + self.batch_size], start))
+        scores = np.concatenate(scores)
+        # 同点は一次検索の順を保つ
+        order = np.argsort(-scores, kind="stable")[:k]
+        elapsed = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["candidates"] += len(scores)
+            self.stats["total_ms"] += elapsed
+            self.stats["max_ms"] = max(self.stats["max_ms"], elapsed)
+            self.stats["truncated"] += int(truncated)
+        return [docs[i] for i in order]
+
+
+class LexicalReranker(Reranker):
+    """質問の語との一致による軽量な採点（モデル不要・CPUのみ）
+
+    候補集合の中でのBM25と、質問の語（IDF重み付き）を何割含むかを行列演算でまとめて計算し、
+    一次検索の順位（prior_weight）と混ぜる。意味的に近いだけの候補も一次検索の順位で残る。
+    """
+
+    batch_size = 256
+
+    def __init__(self, max_ms: float = RERANK_MAX_MS, prior_weight: float = RERANK_PRIOR_WEIGHT,
+                 k1: float = 1.5, b: float = 0.75):
+        super().__init__(max_ms)
+        self.prior_weight = prior_weight
+        self.k1 = k1
+        self.b = b
+
+    def _score(self, query: str, docs: List[Document], offset: int) -> np.ndarray:
+        terms = list(dict.fromkeys(tokenize(query)))
+        prior = 1.0 / (1.0 + np.arange(offset, offset + len(docs), dtype=np.float32))
+        if not terms:
+            return prior
+
+        counts = [Counter(tokenize(doc.page_content)) for doc in docs]
+        tf = np.array([[c.get(term, 0) for term in terms] for c in counts], dtype=np.float32)
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5)) + 1e-3
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+        bm25 = (tf * (self.k1 + 1) / (tf + norm[:, None])) @ idf
+        coverage = (tf > 0) @ idf / idf.sum()
+
+        lexical = 0.5 * bm25 / max(bm25.max(), 1e-6) + 0.5 * coverage
+        return (1 - self.prior_weight) * lexical + self.prior_weight * prior
+
+
+class CrossEncoderReranker(Reranker):
+    """クロスエンコーダ（sentence-transformers）で質問とチャンクの組を採点する
+
+    精度は高いが候補ごとにモデルを通すため、候補数とmax_msで処理時間を抑える。
+    """
+
+    batch_size = 8
+
+    def __init__(self, model_name: str = RERANKER_MODEL, max_ms: float = RERANK_MAX_MS):
+        from sentence_transformers import CrossEncoder
+        super().__init__(max_ms)
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def _score(self, query: str, docs: List[Document], offset: int) -> np.ndarray:
+        pairs = [(query, doc.page_content) for doc in docs]
+        return np.asarray(self.model.predict(pairs, batch_size=self.batch_size), dtype=np.float32)
+
+
+def create_reranker(name: str = RERANKER) -> Optional[Reranker]:
+    """設定に応じたリランカーを作成（noneの場合はNone）"""
+    if name == "none":
+        return None
+    if name == "cross-encoder":
+        try:
+            return CrossEncoderReranker()
+        except Exception as e:
+            print(f"クロスエンコーダを読み込めないため軽量リランカーを使います: {e}")
+    return LexicalReranker()
@@ -0,0 +1,253 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from config.settings import (
+    RESPONSE_CACHE_MAX_DISK_ENTRIES,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_TTL,
+)
+
+# 正規化時に末尾から取り除く記号
+_TRAILING_PUNCTUATION = "?？!！。.、, 　"
+
+# get()で計算した質問の埋め込みをput()まで保持する件数の上限
+_PENDING_VECTORS = 1024
+
+
+def normalize_question(text: str) -> str:
+    """表記ゆれ（全角半角・大文字小文字・空白・末尾の記号）を吸収した質問文"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = " ".join(text.split())
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+def chunk_key(doc) -> str:
+    """検索結果のチャンクを識別するキー（チャンクIDがなければ本文のハッシュ）"""
+    chunk_id = doc.metadata.get("chunk_id")
+    if chunk_id:
+        return chunk_id
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """回答キャッシュ
+
+    キーは「正規化した独立質問・検索されたチャンクIDの集合と会話履歴・インデックスのバージョン」。
+    回答は会話履歴にも左右されるため、履歴がある質問は同じ履歴の回答だけを使う（履歴のない質問は会話をまたいで共有）。
+    完全一致はメモリ内LRU → SQLiteの順に検索し、外れた場合は同じチャンク集合・同じ履歴・同じバージョンの
+    エントリの中から質問の埋め込みが十分に近いものを探す。外れたときに計算した埋め込みはput()で再利用する。
+    インデックスが更新されるとバージョンが変わるため古い回答は使われず、invalidate_before()で削除される。
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        embeddings=None,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_disk_entries: int = RESPONSE_CACHE_MAX_DISK_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        similarity_threshold: float = RESPONSE_CACHE_SIMILARITY,
+    ):
+        self.path = Path(path) if path else None
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._memory = OrderedDict()
+        self._pending_vectors = OrderedDict()
+        self._valid_from = None
+        self._connection = None
+        self._lock = threading.RLock()
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    context_key TEXT NOT NULL,
+                    index_version INTEGER NOT NULL,
+                    answer TEXT NOT NULL,
+                    vector BLOB,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_context ON responses (context_key, index_version)")
+            conn.commit()
+            self._connection = conn
+        return self._connection
+
+    @staticmethod
+    def _context_key(docs: List, history: Optional[Sequence] = None) -> str:
+        """検索されたチャンクIDの集合と、会話履歴（要約を含むメッセージの種類と本文）のハッシュ"""
+        parts = sorted(chunk_key(doc) for doc in docs)
+        if history:
+            parts.append("\x00".join(f"{getattr(m, 'type', '')}:{getattr(m, 'content', m)}" for m in history))
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _key(question: str, context_key: str, index_version: int) -> str:
+        return hashlib.sha256(f"{question}\x00{context_key}\x00{index_version}".encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return bool(self.ttl) and time.time() - created_at > self.ttl
+
+    def _embed(self, question: str):
+        if self.embeddings is None or not self.similarity_threshold:
+            return None
+        try:
+            return self.embeddings.embed_query(question)
+        except Exception as e:
+            print(f"回答キャッシュの類似検索をスキップしました: {e}")
+            return None
+
+    def get(self, question: str, docs: List, index_version: int, history: Optional[Sequence] = None) -> Optional[str]:
+        """キャッシュ済みの回答を返す（なければNone。historyは回答の生成に渡す会話履歴）"""
+        normalized = normalize_question(question)
+        context_key = self._context_key(docs, history)
+        key = self._key(normalized, context_key, index_version)
+
+        with self._lock:
+            # 完全一致（メモリ内LRU）
+            entry = self._memory.get(key)
+            if entry and not self._is_expired(entry["created_at"]):
+                self._memory.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry["answer"]
+
+            conn = self._conn()
+            if conn is not None:
+                # 完全一致（ディスク）
+                row = conn.execute("SELECT answer, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and not self._is_expired(row[1]):
+                    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                    conn.commit()
+                    self._remember(key, row[0], row[1])
+                    self.stats["exact_hits"] += 1
+                    return row[0]
+
+        # 類似一致（同じチャンク集合・同じ履歴・同じバージョンのエントリのみ比較）
+        answer, vector = self._semantic_lookup(normalized, context_key, index_version)
+        with self._lock:
+            if answer is not None:
+                self.stats["semantic_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                if vector is not None:
+                    # 外れた質問は続けてput()されるため、計算した埋め込みを渡せるよう残しておく
+                    self._pending_vectors[key] = vector
+                    while len(self._pending_vectors) > _PENDING_VECTORS:
+                        self._pending_vectors.popitem(last=False)
+        return answer
+
+    def _semantic_lookup(self, normalized: str, context_key: str, index_version: int):
+        """(類似した質問の回答またはNone, 計算した質問の埋め込みまたはNone) を返す"""
+        with self._lock:
+            conn = self._conn()
+            if conn is None or not self.similarity_threshold:
+                return None, None
+            rows = conn.execute(
+                "SELECT answer, vector, created_at FROM responses "
+                "WHERE context_key = ? AND index_version = ? AND vector IS NOT NULL",
+                (context_key, index_version)
+            ).fetchall()
+        if not rows:
+            return None, None
+
+        vector = self._embed(normalized)
+        if vector is None:
+            return None, None
+        best_answer, best_score = None, self.similarity_threshold
+        for answer, blob, created_at in rows:
+            if self._is_expired(created_at):
+                continue
+            score = _cosine(vector, array("f", blob))
+            if score >= best_score:
+                best_answer, best_score = answer, score
+        return best_answer, vector
+
+    def put(self, question: str, docs: List, index_version: int, answer: str, history: Optional[Sequence] = None):
+        """回答を保存（メモリ内LRUとディスクの両方。get()で埋め込みを計算済みならそれを使う）"""
+        normalized = normalize_question(question)
+        context_key = self._context_key(docs, history)
+        key = self._key(normalized, context_key, index_version)
+        with self._lock:
+            vector = self._pending_vectors.pop(key, None)
+        if vector is None and self.path is not None:
+            # 類似一致はディスクのエントリだけを比較するため、メモリ内だけのキャッシュでは埋め込まない
+            vector = self._embed(normalized)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, answer, now)
+            conn = self._conn()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, question, context_key, index_version, answer, vector, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, normalized, context_key, index_version, answer,
+                 array("f", vector).tobytes() if vector is not None else None, now, now)
+            )
+            # 件数上限を超えた分は最終アクセスが古い順に削除
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+            conn.commit()
+
+    def _remember(self, key: str, answer: str, created_at: float):
+        self._memory[key] = {"answer": answer, "created_at": created_at}
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def invalidate_before(self, index_version: int):
+        """指定したバージョンより古いインデックスに対する回答を削除"""
+        with self._lock:
+            if self._valid_from == index_version:
+                return
+            self._valid_from = index_version
+            self._memory.clear()
+            self._pending_vectors.clear()
+            conn = self._conn()
+            if conn is not None:
+                conn.execute("DELETE FROM responses WHERE index_version < ?", (index_version,))
+                if self.ttl:
+                    conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+                conn.commit()
+
+    def close(self):
+        """接続を閉じる（.dbフォルダ削除前に呼び出す。次回利用時に自動で開き直す）"""
+        with self._lock:
+            self._memory.clear()
+            self._pending_vectors.clear()
+            self._valid_from = None
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
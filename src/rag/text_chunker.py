@@ -0,0 +1,150 @@
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+
+from src.utils.tokens import count_tokens
+
+# チャンク分割方式のバージョン（変えると既存のインデックスは全ファイル再分割される）
+CHUNKER_VERSION = "structured-2"
+
+# 見出しとみなす行（Markdown形式の見出し・「第N章」などの短い行・【】で始まる短い行）
+# 箇条書きの記号（■●◆など）や番号付きの行は本文として扱う（「12.5万円の…」を見出しにしないため）
+_HEADING = re.compile(
+    r"^(#{1,6}\s+.+|第[0-9０-９一二三四五六七八九十]+[章節回部].{0,30}|【[^】]{1,20}】.{0,20})$"
+)
+# 文末（句点・感嘆符・疑問符と、それに続く閉じ括弧）
+_SENTENCE_END = re.compile(r"[^。！？!?]*(?:[。！？!?]+[」』）)】]*|$)")
+
+
+def is_heading(line: str) -> bool:
+    return bool(_HEADING.match(line)) and not line.endswith("。")
+
+
+def iter_sentences(paragraph: str) -> Iterator[str]:
+    """段落を文に分割する（。！？で区切り、閉じ括弧は直前の文に含める）"""
+    for match in _SENTENCE_END.finditer(paragraph):
+        sentence = match.group().strip()
+        if sentence:
+            yield sentence
+
+
+def iter_blocks(text: str) -> Iterator[Tuple[str, str]]:
+    """テキストを1行ずつ読み、("heading" | "paragraph", 行) を返す（空行は段落の区切り）"""
+    for match in re.finditer(r"[^\n]+", text):
+        line = match.group().strip()
+        if line:
+            yield ("heading" if is_heading(line) else "paragraph", line)
+
+
+class StructuredTextSplitter(TextSplitter):
+    """見出し・段落・日本語の文境界を考慮し、トークン数で長さを揃えるチャンク分割
+
+    見出しが現れたらチャンクを区切り、同じ節の続きのチャンクには見出しを先頭に付ける。
+    文の途中では区切らず（1文がchunk_sizeを超える場合のみトークン数で分割）、重なりは
+    直前のチャンク末尾の文をchunk_overlapトークン以内で引き継ぐ。
+    iter_chunks() / iter_documents() はジェネレータで、長い文書でもチャンクの一覧を一度に作らない。
+    入力が同じなら出力も常に同じになるため、チャンクIDは再インデックスしても変わらない。
+    """
+
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, **kwargs):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=count_tokens, **kwargs)
+
+    def _split_long_sentence(self, sentence: str) -> Iterator[str]:
+        """chunk_sizeを超える1文をトークン数の上限に収まるよう文字位置で分割する"""
+        if self._length_function(sentence) <= self._chunk_size:
+            yield sentence
+            return
+        start = 0
+        while start < len(sentence):
+            end = len(sentence)
+            # 二分探索で上限に収まる最長の位置を探す
+            low, high = start + 1, end
+            while low < high:
+                mid = (low + high + 1) // 2
+                if self._length_function(sentence[start:mid]) <= self._chunk_size:
+                    low = mid
+                else:
+                    high = mid - 1
+            yield sentence[start:low]
+            start = low
+
+    def _iter_units(self, text: str) -> Iterator[Tuple[str, bool, bool]]:
+        """(文, 段落の先頭かどうか, 見出しかどうか) を順に返す"""
+        for kind, line in iter_blocks(text):
+            if kind == "heading":
+                for piece in self._split_long_sentence(line):
+                    yield piece, True, True
+                continue
+            first = True
+            for sentence in iter_sentences(line):
+                for piece in self._split_long_sentence(sentence):
+                    yield piece, first, False
+                    first = False
+
+    @staticmethod
+    def _render(units) -> str:
+        """文をつなげてチャンク本文にする（段落の先頭と見出しの直後で改行する）"""
+        parts = []
+        previous_heading = False
+        for i, (unit, _, new_paragraph, heading) in enumerate(units):
+            if i and (new_paragraph or previous_heading):
+                parts.append("\n")
+            parts.append(unit)
+            previous_heading = heading
+        return "".join(parts)
+
+    def iter_chunks(self, text: str) -> Iterator[Tuple[str, Optional[str]]]:
+        """(チャンク本文, 見出し) を順に返す"""
+        current: List[Tuple[str, int, bool, bool]] = []
+        tokens = 0
+        section = None
+
+        for unit, new_paragraph, heading in self._iter_units(text):
+            # 段落の先頭の文は直前の改行も含めて数え、つなげた本文がchunk_sizeを超えないようにする
+            unit_tokens = self._length_function(unit) + (1 if new_paragraph else 0)
+            if heading:
+                # 新しい節の見出しではチャンクを区切る（見出しが続く場合はchunk_sizeまでまとめて次のチャンクの先頭に置く）
+                if any(not item[3] for item in current) or (current and tokens + unit_tokens > self._chunk_size):
+                    yield self._render(current), section
+                    current, tokens = [], 0
+                section = unit
+            elif current and tokens + unit_tokens > self._chunk_size:
+                yield self._render(current), section
+                # 末尾の文をchunk_overlapトークン以内で次のチャンクに引き継ぐ
+                overlap, overlap_tokens = [], 0
+                for item in reversed(current):
+                    if item[3] or overlap_tokens + item[1] > min(self._chunk_overlap, self._chunk_size - unit_tokens):
+                        break
+                    overlap.insert(0, item)
+                    overlap_tokens += item[1]
+                current, tokens = overlap, overlap_tokens
+                if section:
+                    # 続きのチャンクにも見出しを付けて、どの節の内容か分かるようにする
+                    heading_tokens = self._length_function(section) + 1
+                    if tokens + heading_tokens + unit_tokens <= self._chunk_size:
+                        current.insert(0, (section, heading_tokens, True, True))
+                        tokens += heading_tokens
+            current.append((unit, unit_tokens, new_paragraph, heading))
+            tokens += unit_tokens
+
+        # 見出しだけが続く文書（本文のない議事録の骨子など）も見出しを本文としてチャンクにする
+        if current:
+            yield self._render(current), section
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for chunk, _ in self.iter_chunks(text)]
+
+    def iter_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Documentを分割したチャンクを順に返す（見出しとファイル内の通し番号をメタデータに付ける）"""
+        for doc in documents:
+            for index, (chunk, section) in enumerate(self.iter_chunks(doc.page_content)):
+                metadata = dict(doc.metadata)
+                metadata["chunk_index"] = index
+                if section:
+                    metadata["section"] = section
+                yield Document(page_content=chunk, metadata=metadata)
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        return list(self.iter_documents(documents))
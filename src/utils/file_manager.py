@@ -1,12 +1,81 @@
+import hashlib
 import os
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from docx import Document
-from langchain_community.document_loaders import Docx2txtLoader
+from typing import List, Optional, Tuple
+from langchain_core.documents import Document
+
+from config.settings import INGEST_WORKERS
+from src.utils.manifest import ProcessedManifest
+from src.utils.metrics import metrics
+
+# インデックス対象外のフォルダ（データベース化済みは旧バージョンのコピー保存先）
+SKIP_DIR_NAMES = ["データベース化済み", ".db"]
+
+
+def _heading_level(paragraph) -> int:
+    """見出しスタイル（Heading 1 / 見出し 1 など）の段落なら見出しレベル、それ以外は0"""
+    name = paragraph.style.name if paragraph.style is not None else ""
+    if name.startswith(("Heading", "見出し")) or name == "Title":
+        digits = "".join(c for c in name if c.isdigit())
+        return int(digits) if digits else 1
+    return 0
+
+
+def _docx_text(file_path: str) -> str:
+    """docxの本文を段落・表の順に取り出す（見出しは「# 」形式、表は1行ずつ「 | 」区切り）"""
+    # python-docxは読み込むときだけインポートする（起動を速くするため）
+    import docx
+    from docx.table import Table
+
+    blocks = []
+    for item in docx.Document(file_path).iter_inner_content():
+        if isinstance(item, Table):
+            for row in item.rows:
+                cells = [cell.text.strip() for cell in row.cells]
+                if any(cells):
+                    blocks.append(" | ".join(cells))
+            continue
+        text = item.text.strip()
+        if not text:
+            continue
+        level = _heading_level(item)
+        blocks.append(f"{'#' * min(level, 6)} {text}" if level else text)
+    return "\n\n".join(blocks)
+
+
+def _load_docx(file_path: str, theme_name: str):
+    """docxを読み込み、(ドキュメント, エラー, 読み込みにかかった秒数)を返す
+
+    プロセスプールのワーカーから呼び出すためモジュールレベルに定義している。
+    """
+    started = time.perf_counter()
+    try:
+        docs = [Document(page_content=_docx_text(file_path), metadata={"source": file_path})]
+        for doc in docs:
+            doc.metadata["theme"] = theme_name
+            doc.metadata["file_name"] = Path(file_path).name
+        return docs, None, time.perf_counter() - started
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - started
+
+
+def _record_load(docs, error, seconds: float):
+    """1ファイルの読み込み時間・文字数を計測値に記録（ワーカープロセスではなく呼び出し元で記録する）"""
+    metrics.observe("ingest_file", seconds)
+    metrics.increment("ingested_files_total", result="error" if error else "ok")
+    if docs:
+        metrics.increment("ingested_chars_total", sum(len(doc.page_content) for doc in docs))
+
 
 class FileManager:
-    def __init__(self, base_dir: Path):
+    def __init__(self, base_dir: Path, max_workers: int = INGEST_WORKERS,
+                 manifest: Optional[ProcessedManifest] = None):
         self.base_dir = Path(base_dir)
+        self.max_workers = max(1, max_workers)
+        self.manifest = manifest or ProcessedManifest(self.base_dir / ".db")
     
     def clear_complete_dir(self, dir_path: Path):
         """データベース化済みフォルダと.dbフォルダ内のファイルを削除する処理"""
@@ -14,6 +83,8 @@ class FileManager:
         
         if dir_path.is_dir():
             if dir_path.name == ".db":
+                # 台帳（マニフェスト）も.db内にあるため接続を閉じてから削除
+                self.manifest.close()
                 shutil.rmtree(dir_path)
                 dir_path.mkdir()
                 print("作成済みの全てのベクターストアを削除しました。")
@@ -33,9 +104,13 @@ class FileManager:
     
     def recursive_file_check(self, path: Path, theme_docs: dict):
         """階層の深いフォルダ内のファイルを再帰的にチェックして読み込む"""
+        if self.max_workers > 1 and path.is_dir():
+            self._parallel_file_check(path, theme_docs)
+            return
+        
         if path.is_dir():
             # データベース化済みフォルダや.dbフォルダはスキップ
-            if path.name in ["データベース化済み", ".db"]:
+            if path.name in SKIP_DIR_NAMES:
                 return
             
             # フォルダ内を再帰的に処理
@@ -46,35 +121,139 @@ class FileManager:
             self.file_load(path, theme_docs)
     
     def file_load(self, file_path: Path, theme_docs: dict):
-        """ファイルを読み込み、データベース化済みフォルダにコピーする"""
+        """ファイルを読み込み、マニフェストに処理済みとして記録する"""
         # パスからテーマ名を取得
         theme_name = self._extract_theme_name(file_path)
         if not theme_name:
             return
         
-        # データベース化済みファイルのパスを構築
-        save_filepath = self._get_save_filepath(file_path)
+        # まだデータベース化されていない場合のみ処理（マニフェストの主キー検索1回で判定）
+        if not self._needs_processing(file_path):
+            return
         
-        # まだデータベース化されていない場合のみ処理
-        if not save_filepath.exists():
-            try:
-                # docxファイルを読み込み
-                loader = Docx2txtLoader(str(file_path))
-                doc = loader.load()
-                
-                # データベース化済みフォルダに保存
-                self._save_to_processed_folder(doc[0].page_content, save_filepath)
-                
-                # theme_docsに追加
-                if theme_name in theme_docs:
-                    theme_docs[theme_name] += doc
-                else:
-                    theme_docs[theme_name] = doc
-                    
-                print(f"ファイルを処理しました: {file_path}")
+        try:
+            # docxファイルを読み込み
+            doc = self.load_file(file_path)
+            
+            # マニフェストに記録
+            self._record_processed(file_path, theme_name)
+            
+            # theme_docsに追加
+            if theme_name in theme_docs:
+                theme_docs[theme_name] += doc
+            else:
+                theme_docs[theme_name] = doc
                 
-            except Exception as e:
-                print(f"ファイル処理でエラーが発生しました {file_path}: {e}")
+            print(f"ファイルを処理しました: {file_path}")
+            
+        except Exception as e:
+            print(f"ファイル処理でエラーが発生しました {file_path}: {e}")
+    
+    def _needs_processing(self, file_path: Path) -> bool:
+        """マニフェストに同じサイズ・更新時刻で記録済みでなければTrue"""
+        stat = file_path.stat()
+        return not self.manifest.is_unchanged(self.relative_key(file_path), stat.st_size, stat.st_mtime)
+    
+    def _record_processed(self, file_path: Path, theme_name: str, chunk_ids: Optional[List[str]] = None):
+        """処理済みファイルをマニフェストに記録（チャンクIDはベクターストア登録時に更新）"""
+        stat = file_path.stat()
+        self.manifest.record(
+            self.relative_key(file_path),
+            stat.st_size,
+            stat.st_mtime,
+            self.compute_file_hash(file_path),
+            theme_name,
+            chunk_ids or [],
+        )
+    
+    def _collect_files(self, path: Path, files: list):
+        """recursive_file_checkと同じ順序でファイルを列挙"""
+        if path.is_dir():
+            if path.name in SKIP_DIR_NAMES:
+                return
+            for item in path.iterdir():
+                self._collect_files(item, files)
+        else:
+            files.append(path)
+    
+    def _parallel_file_check(self, path: Path, theme_docs: dict):
+        """未処理ファイルをプロセスプールで並列に読み込み、走査順にtheme_docsへマージ"""
+        files = []
+        self._collect_files(path, files)
+        
+        targets = []
+        for file_path in files:
+            theme_name = self._extract_theme_name(file_path)
+            if theme_name and self._needs_processing(file_path):
+                targets.append((file_path, theme_name))
+        
+        results = self.load_files(targets)
+        for (file_path, theme_name), docs in zip(targets, results):
+            if docs is None:
+                continue
+            self._record_processed(file_path, theme_name)
+            if theme_name in theme_docs:
+                theme_docs[theme_name] += docs
+            else:
+                theme_docs[theme_name] = docs
+            print(f"ファイルを処理しました: {file_path}")
+    
+    def load_files(self, targets: List[Tuple[Path, str]]) -> List[Optional[list]]:
+        """(ファイルパス, テーマ名)のリストを並列に読み込み、入力と同じ順序で結果を返す
+
+        読み込みに失敗したファイルはNoneとなり、他のファイルの処理には影響しない。
+        """
+        args = [(str(file_path), theme) for file_path, theme in targets]
+        if self.max_workers <= 1 or len(args) <= 1:
+            outcomes = [_load_docx(*arg) for arg in args]
+        else:
+            outcomes = []
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(args))) as executor:
+                futures = [executor.submit(_load_docx, *arg) for arg in args]
+                for future in futures:
+                    try:
+                        outcomes.append(future.result())
+                    except Exception as e:
+                        # ワーカープロセス自体が異常終了した場合もファイル単位で扱う
+                        outcomes.append((None, f"{type(e).__name__}: {e}", 0.0))
+        
+        results = []
+        for (file_path, _), (docs, error, seconds) in zip(targets, outcomes):
+            _record_load(docs, error, seconds)
+            if error:
+                print(f"ファイル処理でエラーが発生しました {file_path}: {error}")
+            results.append(docs)
+        return results
+    
+    def iter_source_files(self, path: Path):
+        """インデックス対象の.docxファイルを再帰的に列挙する"""
+        if path.is_dir():
+            if path.name in SKIP_DIR_NAMES:
+                return
+            for item in sorted(path.iterdir()):
+                yield from self.iter_source_files(item)
+        elif path.suffix.lower() == ".docx" and not path.name.startswith("~$"):
+            yield path
+    
+    def load_file(self, file_path: Path) -> list:
+        """docxファイルを読み込み、テーマ・ファイル名をメタデータに付与して返す"""
+        docs, error, seconds = _load_docx(str(file_path), self._extract_theme_name(file_path))
+        _record_load(docs, error, seconds)
+        if error:
+            raise ValueError(error)
+        return docs
+    
+    def compute_file_hash(self, file_path: Path) -> str:
+        """ファイル内容のSHA-256ハッシュを計算"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def relative_key(self, file_path: Path) -> str:
+        """base_dirからの相対パス（マニフェストのキーとして使用）"""
+        return Path(file_path).relative_to(self.base_dir).as_posix()
     
     def _extract_theme_name(self, file_path: Path) -> str:
         """ファイルパスからテーマ名を抽出"""
@@ -93,17 +272,3 @@ class FileManager:
             pass
         
         return None
-    
-    def _get_save_filepath(self, file_path: Path) -> Path:
-        """データベース化済みフォルダのファイルパスを取得"""
-        # 親ディレクトリの2つ上まで移動して、データベース化済みフォルダに保存
-        parent_dir = file_path.parent.parent
-        save_dir = parent_dir / "データベース化済み"
-        save_dir.mkdir(exist_ok=True)
-        return save_dir / file_path.name
-    
-    def _save_to_processed_folder(self, content: str, save_path: Path):
-        """コンテンツをデータベース化済みフォルダに保存"""
-        new_doc = Document()
-        new_doc.add_paragraph(content)
-        new_doc.save(str(save_path))
@@ -0,0 +1,112 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config.settings import WATCH_DEBOUNCE, WATCH_INTERVAL, WATCH_MAX_DELAY
+from src.utils.file_manager import FileManager
+
+
+class MeetingNotesWatcher:
+    """議事録フォルダをポーリングで監視し、追加・変更・削除をまとめてコールバックに通知する
+
+    短時間に続く変更（フォルダへの一括コピーなど）は、WATCH_DEBOUNCE秒間変化がなくなるまで待ってから
+    1回にまとめて通知する。変更が続く場合でもWATCH_MAX_DELAY秒経過したら通知する。
+    """
+
+    def __init__(
+        self,
+        file_manager: FileManager,
+        on_change: Callable[[Dict[str, List[str]]], None],
+        interval: float = WATCH_INTERVAL,
+        debounce: float = WATCH_DEBOUNCE,
+        max_delay: float = WATCH_MAX_DELAY,
+    ):
+        self.file_manager = file_manager
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot(self) -> Dict[str, Tuple[int, float]]:
+        """監視対象ファイルの(サイズ, 更新時刻)を取得"""
+        result = {}
+        for file_path in self.file_manager.iter_source_files(self.file_manager.base_dir):
+            try:
+                stat = file_path.stat()
+            except OSError:
+                # 列挙後に削除されたファイルは次回のポーリングで反映
+                continue
+            result[self.file_manager.relative_key(file_path)] = (stat.st_size, stat.st_mtime)
+        return result
+
+    @staticmethod
+    def diff(old: Dict[str, Tuple[int, float]], new: Dict[str, Tuple[int, float]]) -> Dict[str, List[str]]:
+        return {
+            "added": [key for key in new if key not in old],
+            "changed": [key for key in new if key in old and new[key] != old[key]],
+            "removed": [key for key in old if key not in new],
+        }
+
+    def start(self):
+        """バックグラウンドスレッドで監視を開始"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="meeting-notes-watcher", daemon=True)
+        self._thread.start()
+        print(f"フォルダ監視を開始しました: {self.file_manager.base_dir}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+            self._thread = None
+        print("フォルダ監視を停止しました。")
+
+    def _run(self):
+        previous = self.snapshot()
+        pending = {"added": set(), "changed": set(), "removed": set()}
+        first_change_at = None
+        last_change_at = None
+
+        while not self._stop_event.wait(self.interval):
+            current = self.snapshot()
+            changes = self.diff(previous, current)
+            now = time.monotonic()
+
+            if any(changes.values()):
+                for kind, keys in changes.items():
+                    pending[kind].update(keys)
+                first_change_at = first_change_at or now
+                last_change_at = now
+                previous = current
+                if now - first_change_at < self.max_delay:
+                    continue
+            elif first_change_at is None or now - last_change_at < self.debounce:
+                continue
+
+            self._notify(pending)
+            pending = {"added": set(), "changed": set(), "removed": set()}
+            first_change_at = None
+            last_change_at = None
+
+    def _notify(self, pending: Dict[str, set]):
+        # 追加後に削除されたファイルなどを整理してから通知
+        removed = pending["removed"] - pending["added"]
+        changes = {
+            "added": sorted(pending["added"] - pending["removed"]),
+            "changed": sorted(pending["changed"] - removed),
+            "removed": sorted(removed),
+        }
+        print(f"フォルダの変更を検知しました: 追加{len(changes['added'])}件 / "
+              f"変更{len(changes['changed'])}件 / 削除{len(changes['removed'])}件")
+        try:
+            self.on_change(changes)
+        except Exception as e:
+            print(f"インデックスの自動更新でエラーが発生しました: {e}")
@@ -0,0 +1,144 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class ProcessedManifest:
+    """インデックス済みファイルの台帳（.db配下のSQLite）
+
+    パス・サイズ・更新時刻・内容ハッシュ・テーマ・チャンクIDを記録し、
+    「処理済みかどうか」の判定はこの台帳の主キー検索1回で行う。
+    """
+
+    FILE_NAME = "manifest.sqlite3"
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.path = self.index_dir / self.FILE_NAME
+        self._connection = None
+        self._lock = threading.RLock()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    theme TEXT NOT NULL,
+                    chunk_ids TEXT NOT NULL,
+                    indexed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.commit()
+            self._connection = conn
+        return self._connection
+
+    def _row_to_entry(self, row) -> dict:
+        return {
+            "path": row[0],
+            "size": row[1],
+            "mtime": row[2],
+            "hash": row[3],
+            "theme": row[4],
+            "chunk_ids": json.loads(row[5]),
+        }
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT path, size, mtime, content_hash, theme, chunk_ids FROM files WHERE path = ?", (key,)
+            ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def is_unchanged(self, key: str, size: int, mtime: float) -> bool:
+        """サイズと更新時刻が記録と一致するか（一致すればハッシュ計算を省略できる）"""
+        entry = self.get(key)
+        return bool(entry) and entry["size"] == size and entry["mtime"] == mtime
+
+    def record(self, key: str, size: int, mtime: float, content_hash: str, theme: str, chunk_ids: List[str]):
+        with self._lock:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime, content_hash, theme, chunk_ids, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, size, mtime, content_hash, theme, json.dumps(chunk_ids), time.time())
+            )
+
+    def set_chunk_ids(self, key: str, chunk_ids: List[str]):
+        with self._lock:
+            self._conn().execute("UPDATE files SET chunk_ids = ? WHERE path = ?", (json.dumps(chunk_ids), key))
+
+    def remove(self, key: str) -> Optional[dict]:
+        entry = self.get(key)
+        if entry:
+            with self._lock:
+                self._conn().execute("DELETE FROM files WHERE path = ?", (key,))
+        return entry
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn().execute("SELECT path FROM files")]
+
+    def entries(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT path, size, mtime, content_hash, theme, chunk_ids FROM files"
+            ).fetchall()
+        return {row[0]: self._row_to_entry(row) for row in rows}
+
+    def indexed_themes(self) -> List[str]:
+        """チャンクを1つ以上持つテーマの一覧"""
+        with self._lock:
+            rows = self._conn().execute("SELECT DISTINCT theme FROM files WHERE chunk_ids != '[]'").fetchall()
+        return [row[0] for row in rows]
+
+    def _set_meta(self, key: str, value: str):
+        self._conn().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._set_meta(key, value)
+
+    @property
+    def version(self) -> int:
+        """インデックスの内容が変わるたびに増えるバージョン番号"""
+        with self._lock:
+            row = self._conn().execute("SELECT value FROM meta WHERE key = 'index_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def bump_version(self) -> int:
+        with self._lock:
+            version = self.version + 1
+            self._set_meta("index_version", str(version))
+            return version
+
+    def clear(self):
+        """台帳を空にする（バージョン番号は引き継ぐ）"""
+        with self._lock:
+            self._conn().execute("DELETE FROM files")
+
+    def commit(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.commit()
+
+    def close(self):
+        """接続を閉じる（.dbフォルダ削除前に呼び出す。次回利用時に自動で開き直す）"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.commit()
+                self._connection.close()
+                self._connection = None
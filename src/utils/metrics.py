@@ -0,0 +1,246 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config.settings import LLM_PRICES_PER_1K, METRICS_WINDOW
+from src.utils.tokens import count_tokens
+
+# 段階ごとの所要時間のヒストグラムの境界（秒）
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _percentile(ordered, q: float) -> float:
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _StageHistogram:
+    """1つの段階の所要時間（Prometheus用の累積ヒストグラムと、パーセンタイル用の直近window件）"""
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(STAGE_BUCKETS)
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def summary(self) -> dict:
+        ordered = sorted(self.recent)
+        return {
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 1),
+            "p50_ms": round(_percentile(ordered, 50) * 1000, 2),
+            "p95_ms": round(_percentile(ordered, 95) * 1000, 2),
+            "p99_ms": round(_percentile(ordered, 99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class MetricsRegistry:
+    """プロセス内の計測値（段階ごとの所要時間・カウンター・各コンポーネントのstats）を集める
+
+    段階の所要時間は observe() / timer()、トークン数やファイル数などの累計は increment() で記録する。
+    キャッシュやリランカーなどが持つstats辞書は register_stats() で登録すると、書き出すときに値を読む。
+    snapshot() はJSON用の辞書、to_prometheus() はPrometheusのテキスト形式を返す。
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW, prefix: str = "rag"):
+        self.window = window
+        self.prefix = prefix
+        self._stages: Dict[str, _StageHistogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._stats: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = _StageHistogram(self.window)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """withブロックの所要時間をstageとして記録（例外で抜けた場合も記録する）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def total(self, name: str, **labels) -> float:
+        """nameのカウンターのうち、labelsがすべて一致するものの合計"""
+        wanted = {key: str(value) for key, value in labels.items()}
+        with self._lock:
+            return sum(
+                value for (counter, counter_labels), value in self._counters.items()
+                if counter == name and wanted.items() <= dict(counter_labels).items()
+            )
+
+    def register_stats(self, name: str, stats: dict):
+        """コンポーネントのstats辞書を登録（同じ名前で登録し直すと新しい辞書に置き換わる）"""
+        with self._lock:
+            self._stats[name] = stats
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {stage: histogram.summary() for stage, histogram in sorted(self._stages.items())}
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                label_text = ",".join(f"{k}={v}" for k, v in labels)
+                counters.setdefault(name, {})[label_text] = round(value, 6)
+            stats = {
+                name: {key: value for key, value in values.items() if isinstance(value, (int, float))}
+                for name, values in sorted(self._stats.items())
+            }
+        return {"stages": stages, "counters": counters, "stats": stats}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        stage_metric = f"{self.prefix}_stage_seconds"
+        with self._lock:
+            if self._stages:
+                lines.append(f"# HELP {stage_metric} Time spent in each stage of query answering and indexing.")
+                lines.append(f"# TYPE {stage_metric} histogram")
+            for stage, histogram in sorted(self._stages.items()):
+                for bound, count in zip(STAGE_BUCKETS, histogram.buckets):
+                    lines.append(f"{stage_metric}_bucket{_labels({'stage': stage, 'le': bound})} {count}")
+                lines.append(f"{stage_metric}_bucket{_labels({'stage': stage, 'le': '+Inf'})} {histogram.count}")
+                lines.append(f"{stage_metric}_sum{_labels({'stage': stage})} {histogram.total:.6f}")
+                lines.append(f"{stage_metric}_count{_labels({'stage': stage})} {histogram.count}")
+
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{_labels(dict(labels))} {value:g}")
+
+            for name, values in sorted(self._stats.items()):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                for key, value in values.items():
+                    if isinstance(value, (int, float)):
+                        lines.append(f"{metric}{_labels({'stat': key})} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def llm_cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """LLM_PRICES_PER_1Kからトークン数の料金（USD）を計算（日付付きのモデル名は前方一致。不明なモデルは0）"""
+    matches = [name for name in LLM_PRICES_PER_1K if model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = LLM_PRICES_PER_1K[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """LLM呼び出しの所要時間・トークン数・料金と、エージェントのツール実行時間を記録するコールバック
+
+    APIがトークン数を返さない場合（ストリーミングなど）はtiktokenで数える。モデルに設定したコールバックと
+    実行時に渡したコールバックの両方から同じ呼び出しが届いても、run_idごとに1回だけ数える。
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._llm_runs: Dict = {}
+        self._tool_runs: Dict = {}
+        self._lock = threading.Lock()
+
+    def _start_llm(self, run_id, model: str, prompt_text: str):
+        with self._lock:
+            if run_id in self._llm_runs:
+                return
+            self._llm_runs[run_id] = (time.perf_counter(), model, prompt_text)
+
+    @staticmethod
+    def _model_name(serialized: Optional[dict], kwargs: dict) -> str:
+        params = kwargs.get("invocation_params") or {}
+        return str(params.get("model_name") or params.get("model") or params.get("_type")
+                   or (serialized or {}).get("name") or "unknown")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt_text = "\n".join(str(message.content) for batch in messages for message in batch)
+        self._start_llm(run_id, self._model_name(serialized, kwargs), prompt_text)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start_llm(run_id, self._model_name(serialized, kwargs), "\n".join(prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._llm_runs.pop(run_id, None)
+        if run is None:
+            return
+        started, model, prompt_text = run
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or count_tokens(prompt_text)
+        completion_tokens = usage.get("completion_tokens") or sum(
+            count_tokens(generation.text) for generations in response.generations for generation in generations
+        )
+        self.registry.observe("llm_call", time.perf_counter() - started)
+        self.registry.increment("llm_requests_total", model=model)
+        self.registry.increment("llm_tokens_total", prompt_tokens, model=model, kind="prompt")
+        self.registry.increment("llm_tokens_total", completion_tokens, model=model, kind="completion")
+        self.registry.increment("llm_cost_usd_total", llm_cost_usd(model, prompt_tokens, completion_tokens), model=model)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._llm_runs.pop(run_id, None)
+        if run is not None:
+            self.registry.increment("llm_errors_total", model=run[1])
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        with self._lock:
+            self._tool_runs.setdefault(run_id, time.perf_counter())
+
+    def _end_tool(self, run_id, result: str):
+        with self._lock:
+            started = self._tool_runs.pop(run_id, None)
+        if started is not None:
+            self.registry.observe("agent_step", time.perf_counter() - started)
+            self.registry.increment("agent_steps_total", result=result)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, "error")
+
+
+# プロセス共通の計測値と、チャットモデル・エージェントに渡すコールバック
+metrics = MetricsRegistry()
+metrics_callback = MetricsCallbackHandler(metrics)
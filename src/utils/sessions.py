@@ -0,0 +1,64 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from config.settings import SESSION_MAX, SESSION_TTL
+
+
+@dataclass
+class Session:
+    """1つの会話（HTTPサーバーのsession_idごと）の状態
+
+    lockで同じ会話の質問を1つずつ処理し、会話履歴に回答が混ざらないようにする。
+    agentは初めてエージェントで回答するときに作り、index_versionが変わったら作り直す。
+    """
+    session_id: str
+    history: Any
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    agent: Any = None
+    agent_version: Optional[int] = None
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SessionStore:
+    """session_idごとの会話履歴（最後に使ってからttl秒経った会話と、max_sessionsを超えた古い会話は破棄する）"""
+
+    def __init__(self, create_history: Callable[[], Any], ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX):
+        self.create_history = create_history
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """会話を取得（session_idが未指定・不明な場合は新しい会話を作る）"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id or uuid.uuid4().hex, self.create_history())
+                self._sessions[session.session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            session.last_used = now
+            self._sessions.move_to_end(session.session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self, now: float):
+        # 最後に使った順に並んでいるため、先頭から期限切れの会話だけを取り除けばよい
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl:
+                break
+            self._sessions.popitem(last=False)
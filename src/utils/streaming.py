@@ -0,0 +1,71 @@
+import queue
+import threading
+from typing import Callable, Iterator
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# ストリーム終了を表す番兵
+_DONE = object()
+
+# このタグが付いたLLM呼び出しのトークンは「Final Answer:」を待たずにそのまま流す（return_directなツールの回答生成など）
+FINAL_ANSWER_TAG = "final_answer"
+
+
+class FinalAnswerQueueHandler(BaseCallbackHandler):
+    """ReActエージェントの出力のうち「Final Answer:」以降のトークンだけをキューに流す"""
+
+    def __init__(self, answer_prefix: str = "Final Answer:"):
+        self.queue = queue.Queue()
+        self.answer_prefix = answer_prefix
+        self.streamed = False
+        self._buffers = {}
+        self._streaming_runs = set()
+
+    def on_llm_new_token(self, token: str, *, run_id, tags=None, **kwargs):
+        if tags and FINAL_ANSWER_TAG in tags:
+            self.streamed = True
+            self.queue.put(token)
+            return
+        if run_id in self._streaming_runs:
+            self.queue.put(token)
+            return
+
+        buffer = self._buffers.get(run_id, "") + token
+        self._buffers[run_id] = buffer
+        index = buffer.find(self.answer_prefix)
+        if index >= 0:
+            self._streaming_runs.add(run_id)
+            self.streamed = True
+            rest = buffer[index + len(self.answer_prefix):].lstrip()
+            if rest:
+                self.queue.put(rest)
+
+
+def stream_from_thread(target: Callable[[], str], handler: FinalAnswerQueueHandler) -> Iterator[str]:
+    """targetを別スレッドで実行し、handlerのキューに届いたトークンを順に返す
+
+    回答がストリーミングされなかった場合（出力形式の解析に失敗した場合など）は、最終的な出力をまとめて返す。
+    """
+    result = {}
+
+    def _worker():
+        try:
+            result["output"] = target()
+        except Exception as e:
+            result["error"] = e
+        finally:
+            handler.queue.put(_DONE)
+
+    thread = threading.Thread(target=_worker, daemon=True)
+    thread.start()
+    while True:
+        token = handler.queue.get()
+        if token is _DONE:
+            break
+        yield token
+    thread.join()
+
+    if "error" in result:
+        raise result["error"]
+    if not handler.streamed:
+        yield result.get("output", "")
@@ -0,0 +1,23 @@
+from functools import lru_cache
+
+# tiktokenのエンコーディング名（OpenAIの埋め込み・チャットモデル共通）
+DEFAULT_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str):
+    """tiktokenのエンコーディングを取得（オフライン等で取得できない場合はNone）"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        print(f"tiktokenのエンコーディングを取得できないため文字数で概算します: {e}")
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """テキストのトークン数を数える（tiktokenが使えない場合は文字数で概算）"""
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return len(text)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,13 @@
+import os
+import sys
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+# テストはAPIを呼ばず、議事録・インデックス・キャッシュも本番のdataディレクトリに書かない
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["EMBEDDING_BACKEND"] = "fake"
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["EMBED_CACHE_ENABLED"] = "false"
+os.environ["RESPONSE_CACHE_ENABLED"] = "false"
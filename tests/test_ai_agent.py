@@ -0,0 +1,57 @@
+import pytest
+from docx import Document as DocxDocument
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agent.ai_agent import AIAgent
+from src.agent.theme_router import RouteDecision
+from src.rag.rag_system import RAGSystem
+
+
+def _write_note(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc = DocxDocument()
+    doc.add_paragraph(text)
+    doc.save(path)
+
+
+class _LowConfidenceRouter:
+    """常に確信度が低いと判定するルーター（エージェントに任せる経路の確認用）"""
+
+    stats = {}
+
+    def route(self, query):
+        return RouteDecision([], 0.0, {}, 0.0)
+
+
+@pytest.fixture
+def agent(tmp_path):
+    _write_note(tmp_path / "営業" / "a.docx", "新製品Aの価格は1000円に決定した。")
+    _write_note(tmp_path / "採用" / "b.docx", "採用面接は10月5日に実施する。")
+    rag = RAGSystem(tmp_path)
+    rag.sync_index()
+    history = [HumanMessage(content="新製品Aの価格は？"), AIMessage(content="1000円です。")]
+    return AIAgent(rag.theme_retriever, history)
+
+
+def test_stream_run_rewrites_inside_the_stream(agent):
+    tokens = agent.stream_run("もう少し詳しく")
+    # イテレーターを受け取った時点では、まだ書き換えのLLMを呼ばない
+    assert agent.question_rewriter.stats["rewritten"] == 0
+    assert "".join(tokens)
+    assert agent.question_rewriter.stats["rewritten"] == 1
+
+
+def test_fallback_reuses_the_routing_rewrite(agent):
+    agent.router = _LowConfidenceRouter()
+    received = []
+
+    def run_agent(query, callbacks=None):
+        # エージェントが受け取った質問をそのままテーマ別ツールに渡す
+        received.append(query)
+        return agent.tools[0].func(query)
+
+    agent._run_agent = run_agent
+    agent.run("もう少し詳しく")
+    assert len(received) == 1
+    assert agent.question_rewriter.stats["rewritten"] == 1
+    assert agent.question_rewriter.stats["reused"] == 1
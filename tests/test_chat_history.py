@@ -0,0 +1,40 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from src.rag.chat_history import ChatHistoryManager
+
+
+def _turn(question: str, answer: str):
+    return [HumanMessage(content=question), AIMessage(content=answer)]
+
+
+def test_summary_is_deferred_until_the_history_is_read():
+    calls = []
+
+    def summarize(prompt):
+        calls.append(prompt.to_string())
+        return "要約"
+
+    history = ChatHistoryManager(RunnableLambda(summarize), max_turns=1)
+    for i in range(3):
+        history.extend(_turn(f"質問{i}", f"回答{i}"))
+    # 回答後の履歴の更新ではLLMを呼ばない
+    assert calls == []
+
+    messages = history.messages()
+    assert len(calls) == 1
+    assert "質問0" in calls[0] and "質問1" in calls[0]
+    assert messages[0].content.endswith("要約")
+    assert [m.content for m in messages[1:]] == ["質問2", "回答2"]
+
+    history.messages()
+    assert len(calls) == 1
+
+
+def test_failed_summary_drops_old_turns():
+    def summarize(prompt):
+        raise RuntimeError("error")
+
+    history = ChatHistoryManager(RunnableLambda(summarize), max_turns=1)
+    history.extend(_turn("質問0", "回答0") + _turn("質問1", "回答1"))
+    assert [m.content for m in history] == ["質問1", "回答1"]
@@ -0,0 +1,60 @@
+from langchain_core.documents import Document
+
+from src.rag.context_packer import ContextPacker
+
+
+def _doc(text, **metadata):
+    return Document(page_content=text, metadata=metadata)
+
+
+TEMPLATE = "月次報告: {month}月の売上は{sales}万円、前年同月比は{ratio}%でした。来月も同じ施策を継続し、担当者が進捗を確認します。"
+
+
+def test_templated_chunks_with_different_numbers_are_kept():
+    packer = ContextPacker(max_tokens=10000)
+    docs = [_doc(TEMPLATE.format(month=m, sales=100 + m, ratio=90 + m), chunk_id=str(m)) for m in range(1, 6)]
+    assert len(packer.pack(docs)) == 5
+    assert packer.stats["duplicates"] == 0
+
+
+def test_exact_contained_and_near_duplicates_are_removed():
+    packer = ContextPacker(max_tokens=10000)
+    base = TEMPLATE.format(month=4, sales=120, ratio=105)
+    docs = [
+        _doc(base, chunk_id="a"),
+        _doc(base, chunk_id="b"),
+        _doc("前年同月比は105%でした。", chunk_id="c"),
+        _doc(base.replace("、", " 、 ").replace("。", "。 "), chunk_id="d"),
+    ]
+    assert [doc.metadata["chunk_id"] for doc in packer.pack(docs)] == ["a"]
+    assert packer.stats["duplicates"] == 3
+
+
+def test_pack_respects_token_budget():
+    packer = ContextPacker(max_tokens=120)
+    docs = [_doc(TEMPLATE.format(month=m, sales=m, ratio=m), chunk_id=str(m)) for m in range(1, 6)]
+    packed = packer.pack(docs)
+    assert 0 < len(packed) < 5
+    assert packed[0].metadata["chunk_id"] == "1"
+
+
+def test_adjacent_chunks_are_merged_on_overlap():
+    packer = ContextPacker(max_tokens=10000)
+    overlap = "担当者は来週までに見積もりを作成し、部長の承認を得る。"
+    docs = [
+        _doc("# 営業会議\n新製品Aの価格を決定した。" + overlap, source="a.docx", chunk_index=0, chunk_id="a0"),
+        _doc("# 営業会議\n" + overlap + "次回は10月5日に開催する。", source="a.docx", chunk_index=1,
+             chunk_id="a1", section="# 営業会議"),
+    ]
+    packed = packer.pack(docs)
+    assert len(packed) == 1
+    assert packed[0].page_content == "# 営業会議\n新製品Aの価格を決定した。" + overlap + "次回は10月5日に開催する。"
+
+
+def test_short_accidental_overlap_is_not_merged():
+    packer = ContextPacker(max_tokens=10000)
+    docs = [
+        _doc("売上は合計87", source="b.docx", chunk_index=0, chunk_id="b0"),
+        _doc("7 | 12 | 5", source="b.docx", chunk_index=1, chunk_id="b1"),
+    ]
+    assert packer.pack(docs)[0].page_content == "売上は合計87\n7 | 12 | 5"
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.rag.embedding_cache import CachedEmbeddings
+from src.rag.embedding_pipeline import BatchedEmbeddings
+from src.rag.fake_backends import LocalFakeEmbeddings
+
+
+def test_concurrent_misses_on_same_text_call_the_api_once():
+    base = LocalFakeEmbeddings(size=32, latency=0.2)
+    cache = CachedEmbeddings(base, None)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        vectors = list(executor.map(lambda _: cache.embed_query("新製品Aの価格は？"), range(8)))
+    assert base.request_count == 1
+    assert all(vector == vectors[0] for vector in vectors)
+    assert cache.stats["misses"] == 1
+    # 計算中の結果を待った分はcoalesced、計算後にキャッシュで見つかった分だけがhits
+    assert cache.stats["hits"] + cache.stats["coalesced"] == 7
+
+
+def test_documents_are_cached_by_normalized_text(tmp_path):
+    base = LocalFakeEmbeddings(size=32)
+    cache = CachedEmbeddings(base, tmp_path / "embeddings.sqlite3")
+    first = cache.embed_documents(["議事録　A", "議事録 B", "議事録 A"])
+    assert cache.stats == {"hits": 0, "misses": 2, "coalesced": 0}
+    cache.close()
+
+    reopened = CachedEmbeddings(base, tmp_path / "embeddings.sqlite3")
+    assert reopened.embed_documents(["議事録 A"]) == [first[0]]
+    assert reopened.stats == {"hits": 1, "misses": 0, "coalesced": 0}
+
+
+def test_failed_computation_is_not_cached():
+    class Failing(LocalFakeEmbeddings):
+        def embed_query(self, text):
+            raise RuntimeError("boom")
+
+    cache = CachedEmbeddings(Failing(size=32), None)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cache.embed_query("質問")
+    assert cache.stats["misses"] == 0
+
+
+def test_batched_queries_use_query_embeddings():
+    class Asymmetric(LocalFakeEmbeddings):
+        def embed_query(self, text):
+            return [-x for x in super().embed_query(text)]
+
+    base = Asymmetric(size=32)
+    cache = CachedEmbeddings(BatchedEmbeddings(base), None)
+    vectors = cache.embed_queries(["新製品Aの価格は？", "採用面接の日程は？"])
+    assert vectors[0] == pytest.approx(base.embed_query("新製品Aの価格は？"), abs=1e-6)
+    assert cache.embed_query("新製品Aの価格は？") == vectors[0]
+    assert cache.stats["hits"] == 1
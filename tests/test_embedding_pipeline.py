@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.rag.embedding_pipeline import BatchedEmbeddings, is_rate_limit_error
+from src.rag.fake_backends import FakeRateLimitError, LocalFakeEmbeddings
+
+
+def test_rate_limit_is_detected_by_status_or_type_only():
+    class RateLimitError(Exception):
+        pass
+
+    assert is_rate_limit_error(FakeRateLimitError("Too Many Requests"))
+    assert is_rate_limit_error(RateLimitError("slow down"))
+    assert not is_rate_limit_error(ValueError("input has 4290 tokens, request id req_429"))
+
+
+def test_stats_are_returned_per_call():
+    pipeline = BatchedEmbeddings(LocalFakeEmbeddings(size=16, latency=0.05), batch_size=2, max_workers=2,
+                                 progress_callback=lambda *args: None)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        small, large = executor.map(pipeline.embed_documents_with_stats, [["a"] * 2, ["b"] * 10])
+    assert (small[1]["texts"], small[1]["batches"]) == (2, 1)
+    assert (large[1]["texts"], large[1]["batches"]) == (10, 5)
+    assert len(large[0]) == 10
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+import pytest
+from docx import Document as DocxDocument
+
+import src.rag.rag_system as rag_system
+from src.rag.rag_system import RAGSystem
+
+
+def _write_note(path, *paragraphs):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc = DocxDocument()
+    for paragraph in paragraphs:
+        doc.add_paragraph(paragraph)
+    doc.save(path)
+    # 同じ秒のうちに書き直してもサイズ・更新時刻で変更を検出できるようにする
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+def _texts(docs):
+    return "\n".join(doc.page_content for doc in docs)
+
+
+@pytest.fixture(params=["chroma", "compact"])
+def notes_dir(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_system, "VECTOR_STORE_BACKEND", request.param)
+    _write_note(tmp_path / "営業" / "a.docx", "新製品Aの価格は1000円に決定した。")
+    _write_note(tmp_path / "採用" / "b.docx", "採用面接は10月5日に実施する。")
+    return tmp_path
+
+
+def test_added_changed_and_removed_files(notes_dir):
+    rag = RAGSystem(notes_dir)
+    assert rag.sync_index() == {"added": 2, "changed": 0, "removed": 0, "unchanged": 0}
+    assert "1000円" in _texts(rag.theme_retriever["営業"].invoke("新製品Aの価格"))
+
+    _write_note(notes_dir / "営業" / "a.docx", "新製品Aの価格は2000円に変更した。")
+    (notes_dir / "採用" / "b.docx").unlink()
+    _write_note(notes_dir / "営業" / "c.docx", "広告予算は50万円とする。")
+    assert rag.sync_index() == {"added": 1, "changed": 1, "removed": 1, "unchanged": 0}
+
+    found = _texts(rag.all_retriever.invoke("新製品Aの価格"))
+    assert "2000円" in found and "1000円" not in found
+    assert rag.keyword_index.search("1000円") == []
+    assert rag.keyword_index.search("10月5日") == []
+    assert set(rag.theme_retriever) == {"営業"}
+    assert rag.sync_index() == {"added": 0, "changed": 0, "removed": 0, "unchanged": 2}
+
+
+def test_restart_reuses_persisted_index(notes_dir, capsys):
+    RAGSystem(notes_dir).sync_index()
+    capsys.readouterr()
+
+    rag = RAGSystem(notes_dir)
+    assert rag.sync_index() == {"added": 0, "changed": 0, "removed": 0, "unchanged": 2}
+    assert "キーワードインデックスを作成" not in capsys.readouterr().out
+    assert "10月5日" in _texts(rag.theme_retriever["採用"].invoke("採用面接の日程"))
+
+
+def test_queries_during_sync_do_not_see_half_applied_changes(notes_dir):
+    rag = RAGSystem(notes_dir)
+    rag.sync_index()
+    _write_note(notes_dir / "営業" / "a.docx", "新製品Aの価格は2000円に変更した。")
+
+    # 新しいチャンクを追加し、古いチャンクを削除する前の時点で検索する
+    entered = threading.Event()
+    delete_chunks = rag._delete_chunks
+
+    def slow_delete(entry, keep=frozenset()):
+        entered.set()
+        time.sleep(0.3)
+        delete_chunks(entry, keep)
+
+    rag._delete_chunks = slow_delete
+    sync = threading.Thread(target=rag.sync_index)
+    sync.start()
+    assert entered.wait(10)
+    found = _texts(rag.all_retriever.invoke("新製品Aの価格"))
+    sync.join()
+
+    assert "2000円" in found and "1000円" not in found
+
+
+def test_rebuild_does_not_break_queries_holding_old_retrievers(notes_dir):
+    rag = RAGSystem(notes_dir)
+    rag.initialize()
+    old_retriever = rag.all_retriever
+
+    # 作り直しで古いストアを閉じている間に、差し替え前のリトリーバーで検索する
+    entered = threading.Event()
+    reset_data = rag.reset_data
+
+    def slow_reset():
+        entered.set()
+        time.sleep(0.3)
+        reset_data()
+
+    rag.reset_data = slow_reset
+    rebuild = threading.Thread(target=rag.initialize, kwargs={"rebuild": True})
+    rebuild.start()
+    assert entered.wait(10)
+    found = _texts(old_retriever.invoke("新製品Aの価格"))
+    rebuild.join()
+
+    assert "1000円" in found
+    assert "1000円" in _texts(old_retriever.invoke("新製品Aの価格"))
+    assert rag.all_retriever is not old_retriever
+
+
+def test_missing_keyword_index_is_rebuilt_from_the_store(notes_dir, capsys):
+    RAGSystem(notes_dir).sync_index()
+    (notes_dir / ".db" / rag_system.KEYWORD_INDEX_FILE).unlink()
+    capsys.readouterr()
+
+    # ベクターストアに保存済みのチャンクから作り直し、ファイルの再読み込み・再埋め込みはしない
+    rag = RAGSystem(notes_dir)
+    assert rag.sync_index() == {"added": 0, "changed": 0, "removed": 0, "unchanged": 2}
+    assert "キーワードインデックスを作成" in capsys.readouterr().out
+    assert rag.keyword_index.search("10月5日")
+
+
+def test_in_memory_build_streams_chunks_in_batches(notes_dir, monkeypatch):
+    monkeypatch.setattr(rag_system, "PERSIST_INDEX", False)
+    monkeypatch.setattr(rag_system, "BUILD_BATCH_SIZE", 1)
+    rag = RAGSystem(notes_dir)
+    rag.create_vector_stores(rag.load_and_process_files())
+
+    assert set(rag.theme_retriever) == {"営業", "採用"}
+    assert "10月5日" in _texts(rag.theme_retriever["採用"].invoke("採用面接の日程"))
+    # チャンクIDはファイルごとの通し番号で、差分反映と同じIDになる
+    entry = rag.manifest.get("営業/a.docx")
+    assert entry["chunk_ids"] == rag._chunk_ids("営業/a.docx", entry["hash"], len(entry["chunk_ids"]))
+    assert len(rag.keyword_index) == 2
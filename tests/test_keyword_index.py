@@ -0,0 +1,43 @@
+from langchain_core.documents import Document
+
+from src.rag.keyword_index import KeywordIndex
+
+
+def _docs():
+    docs = [
+        Document(page_content="新製品Aの価格を9800円に決定した", metadata={"theme": "営業", "chunk_id": "a"}),
+        Document(page_content="採用面接の日程を調整する", metadata={"theme": "採用", "chunk_id": "b"}),
+        Document(page_content="新製品Bの広告予算を検討した", metadata={"theme": "マーケティング", "chunk_id": "c"}),
+    ]
+    return docs, [doc.metadata["chunk_id"] for doc in docs]
+
+
+def test_search_and_filter():
+    index = KeywordIndex.from_documents(*_docs())
+    results = index.search("新製品の価格", k=3)
+    assert results[0][0].metadata["chunk_id"] == "a"
+    filtered = index.search("新製品", k=3, filter={"theme": "マーケティング"})
+    assert [doc.metadata["chunk_id"] for doc, _ in filtered] == ["c"]
+
+
+def test_persisted_index_is_reopened_without_rebuilding(tmp_path):
+    path = tmp_path / "keyword_index.sqlite3"
+    index = KeywordIndex.from_documents(*_docs(), path=path)
+    index.set_version(3)
+    index.remove(["b"])
+    index.close()
+
+    reopened = KeywordIndex(path)
+    assert len(reopened) == 2
+    assert reopened.version == 3
+    assert reopened.search("採用面接") == []
+    assert reopened.search("9800円")[0][0].metadata["chunk_id"] == "a"
+    assert set(reopened.term_counts()) == {"営業", "マーケティング"}
+
+
+def test_add_replaces_same_id():
+    docs, ids = _docs()
+    index = KeywordIndex.from_documents(docs, ids)
+    index.add([Document(page_content="価格は未定", metadata={"theme": "営業", "chunk_id": "a"})], ["a"])
+    assert len(index) == 3
+    assert index.search("9800円") == []
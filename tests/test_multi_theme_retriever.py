@@ -0,0 +1,43 @@
+from langchain_core.documents import Document
+
+from src.rag.compact_store import CompactVectorStore
+from src.rag.fake_backends import LocalFakeEmbeddings
+from src.rag.hybrid_retriever import HybridRetriever
+from src.rag.keyword_index import KeywordIndex
+from src.rag.multi_theme_retriever import MultiThemeRetriever
+
+THEMES = [f"テーマ{i}" for i in range(7)]
+
+
+def _build():
+    embeddings = LocalFakeEmbeddings(size=64)
+    docs = [
+        Document(page_content=f"{theme}の会議で予算{j}について議論した", metadata={"theme": theme})
+        for theme in THEMES for j in range(3)
+    ]
+    ids = [f"chunk-{i}" for i in range(len(docs))]
+    store = CompactVectorStore(None, embeddings)
+    store.add_texts([d.page_content for d in docs], [d.metadata for d in docs], ids=ids)
+    keyword_index = KeywordIndex.from_documents(docs, ids)
+    retrievers = {
+        theme: HybridRetriever(vector_store=store, keyword_index=keyword_index,
+                               search_kwargs={"filter": {"theme": theme}}, mode="hybrid")
+        for theme in THEMES
+    }
+    return embeddings, MultiThemeRetriever(retrievers)
+
+
+def test_hybrid_fan_out_embeds_question_once():
+    embeddings, retriever = _build()
+    before = embeddings.request_count
+    docs = retriever.retrieve("予算についての議論の内容を教えてください", THEMES)
+    assert embeddings.request_count - before == 1
+    assert {doc.metadata["theme"] for doc in docs} == set(THEMES)
+
+
+def test_keyword_only_fan_out_skips_embedding():
+    embeddings, retriever = _build()
+    before = embeddings.request_count
+    docs = retriever.retrieve("予算1", THEMES)
+    assert embeddings.request_count - before == 0
+    assert docs
@@ -0,0 +1,34 @@
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.rag.fake_backends import LocalFakeEmbeddings
+from src.rag.response_cache import ResponseCache
+
+DOCS = [Document(page_content="新製品Aの価格は9800円", metadata={"chunk_id": "a"})]
+
+
+def test_answers_depend_on_chat_history(tmp_path):
+    cache = ResponseCache(tmp_path / "response_cache.sqlite3", LocalFakeEmbeddings(size=32))
+    history_a = [HumanMessage(content="新製品Aについて"), AIMessage(content="価格は9800円です")]
+    history_b = [HumanMessage(content="新製品Bについて"), AIMessage(content="価格は未定です")]
+    cache.put("価格を短くまとめて", DOCS, 1, "9800円", history_a)
+
+    assert cache.get("価格を短くまとめて", DOCS, 1, history_a) == "9800円"
+    assert cache.get("価格を短くまとめて", DOCS, 1, history_b) is None
+    assert cache.get("価格を短くまとめて", DOCS, 1) is None
+
+    cache.put("新製品Aの価格は？", DOCS, 1, "9800円です")
+    assert cache.get("新製品Aの価格は", DOCS, 1, []) == "9800円です"
+
+
+def test_put_reuses_the_embedding_computed_by_get(tmp_path):
+    embeddings = LocalFakeEmbeddings(size=32)
+    cache = ResponseCache(tmp_path / "response_cache.sqlite3", embeddings)
+    cache.put("新製品Aの価格は？", DOCS, 1, "9800円です")
+    assert embeddings.request_count == 1
+
+    assert cache.get("採用面接の日程は？", DOCS, 1) is None
+    assert embeddings.request_count == 2
+    cache.put("採用面接の日程は？", DOCS, 1, "10月5日です")
+    assert embeddings.request_count == 2
+    assert cache.stats == {"exact_hits": 0, "semantic_hits": 0, "misses": 1}
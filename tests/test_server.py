@@ -0,0 +1,129 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from server import QueryServer, QueryService, SessionBusy
+from src.rag.rag_system import RAGSystem
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = QueryServer(("127.0.0.1", 0), QueryService(RAGSystem(tmp_path), workers=1, queue_size=1))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, headers: str, body: bytes = b""):
+    """生のHTTPリクエストを送り、(ステータス, JSON本文) を返す"""
+    with socket.create_connection(server.server_address, timeout=5) as conn:
+        conn.sendall(f"POST /query HTTP/1.1\r\nHost: test\r\n{headers}\r\n".encode() + body)
+        response = b""
+        while chunk := conn.recv(65536):
+            response += chunk
+            head, _, rest = response.partition(b"\r\n\r\n")
+            length = [int(line.split(b":")[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")]
+            if length and len(rest) >= length[0]:
+                break
+    status = int(head.split(b" ")[1])
+    return status, json.loads(rest)
+
+
+def test_negative_content_length_is_rejected(server):
+    status, body = _post(server, "Content-Length: -1\r\n")
+    assert status == 400
+    assert "Content-Length" in body["error"]
+
+
+def test_invalid_content_length_is_rejected(server):
+    assert _post(server, "Content-Length: abc\r\n")[0] == 400
+
+
+def test_oversized_body_is_rejected_without_reading_it(server):
+    assert _post(server, "Content-Length: 100000000\r\n")[0] == 413
+
+
+def test_malformed_json_and_missing_question(server):
+    assert _post(server, "Content-Length: 3\r\n", b"{x}")[0] == 400
+    body = json.dumps({"session_id": "a"}).encode()
+    assert _post(server, f"Content-Length: {len(body)}\r\n", body)[0] == 400
+
+
+def test_non_string_session_id_is_rejected(server):
+    body = json.dumps({"question": "営業の課題は？", "session_id": ["a"]}).encode()
+    status, response = _post(server, f"Content-Length: {len(body)}\r\n", body)
+    assert status == 400
+    assert "session_id" in response["error"]
+
+
+class _SlowRAG:
+    """1トークンずつ時間をかけて回答するRAGシステム（タイムアウトの確認用）"""
+
+    index_version = 0
+    theme_retriever = {}
+
+    def __init__(self):
+        self.tokens = 0
+
+    def create_chat_history(self):
+        return []
+
+    def stream_query(self, question, chat_history):
+        yield {"context": []}
+        for _ in range(100):
+            time.sleep(0.05)
+            self.tokens += 1
+            yield {"answer": "あ"}
+        chat_history.append(question)
+
+
+def test_timed_out_answer_stops_and_frees_the_session():
+    rag = _SlowRAG()
+    service = QueryService(rag, workers=1, queue_size=0, timeout=0.2)
+    session = service.sessions.get()
+    with pytest.raises(TimeoutError):
+        service.rag_answer("質問", session)
+
+    # ワーカーは次のトークンで打ち切り、会話のロックを返す（回答は履歴に残さない）
+    assert session.lock.acquire(timeout=1)
+    session.lock.release()
+    tokens = rag.tokens
+    time.sleep(0.2)
+    assert rag.tokens == tokens < 100
+    assert session.history == []
+    service.shutdown()
+
+
+def test_busy_session_is_refused_without_waiting():
+    service = QueryService(_SlowRAG(), workers=1, queue_size=0, timeout=5)
+    session = service.sessions.get()
+    with session.lock:
+        started = time.monotonic()
+        with pytest.raises(SessionBusy):
+            service.rag_answer("質問", session)
+    assert time.monotonic() - started < 1
+    assert service.stats["rejected"] == 1 and service.stats["errors"] == 0
+    assert service.stats["completed"] == 0
+    service.shutdown()
+
+
+def test_only_successful_jobs_count_as_completed():
+    service = QueryService(_SlowRAG(), workers=1, queue_size=0, timeout=5)
+    assert service.run(lambda cancelled: "ok") == "ok"
+
+    def _fail(cancelled):
+        raise ValueError("失敗")
+
+    with pytest.raises(ValueError):
+        service.run(_fail)
+    # 完了時のコールバックは結果を返した後にワーカー側で呼ばれる
+    deadline = time.monotonic() + 1
+    while service.stats["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert service.health()["completed"] == 1
+    assert service.health()["errors"] == 1
+    service.shutdown()
@@ -0,0 +1,45 @@
+from src.rag.text_chunker import StructuredTextSplitter, is_heading
+from src.utils.tokens import count_tokens
+
+
+def test_bullet_only_notes_are_kept():
+    splitter = StructuredTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks = splitter.split_text("■ 決定事項\n● 新製品Aの価格を9800円に決定\n【次回】10月5日")
+    text = "\n".join(chunks)
+    assert "■ 決定事項" in text
+    assert "新製品Aの価格を9800円に決定" in text
+    assert "10月5日" in text
+
+
+def test_many_bullets_are_split_by_chunk_size():
+    splitter = StructuredTextSplitter(chunk_size=200, chunk_overlap=20)
+    lines = [f"● 項目{i}: 担当者が次回までに資料を確認する" for i in range(300)]
+    chunks = splitter.split_text("議事録\n" + "\n".join(lines))
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+    text = "\n".join(chunks)
+    assert all(line in text for line in lines)
+
+
+def test_heading_only_text_respects_chunk_size():
+    splitter = StructuredTextSplitter(chunk_size=50, chunk_overlap=0)
+    chunks = splitter.split_text("\n".join(f"## 議題{i}" for i in range(100)))
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+
+
+def test_heading_detection():
+    assert is_heading("# 定例会議")
+    assert is_heading("第3回 企画会議")
+    assert is_heading("【決定事項】")
+    assert not is_heading("12.5万円の予算で広告を出す")
+    assert not is_heading("● 新製品Aの価格を9800円に決定")
+
+
+def test_section_heading_is_carried_to_continuation_chunks():
+    splitter = StructuredTextSplitter(chunk_size=60, chunk_overlap=0)
+    body = "".join(f"売上は前年比{i}%増加した。" for i in range(20))
+    chunks = list(splitter.iter_chunks("# 売上報告\n" + body))
+    assert len(chunks) > 1
+    assert all(section == "# 売上報告" for _, section in chunks)
+    assert all(chunk.startswith("# 売上報告") for chunk, _ in chunks)